@@ -11,8 +11,11 @@ from importlib import import_module
 
 import click
 
+import CLIDaemon
+
 class CLISession(object):
     def __init__(self, **kwargs):
+        self.log_to_stderr = False
         self.__dict__.update(kwargs)
         self.controller = None
 
@@ -45,6 +48,24 @@ pass_session = click.make_pass_decorator(CLISession)
 @click.option(
     "--uri", "-u", help="URI to reach remote PLC."
 )
+@click.option(
+    "--no-daemon", is_flag=True,
+    help="Run commands in this process even if a build daemon is running."
+)
+@click.option(
+    "--profile", is_flag=True,
+    help="Time build stages, write build_profile.json (Chrome trace format) in build folder."
+)
+@click.option(
+    "--iec-cache", metavar="PATH",
+    help="Shared cache of IEC to C compiler output, empty to disable."
+    " Defaults to BEREMIZ_IEC_CACHE or ~/.cache/beremiz/iec2c."
+)
+@click.option(
+    "--jobs", "-j", type=int, default=1, metavar="N",
+    help="Processes generating POUs of projects with at least 500 POUs,"
+    " 0 for all processors. Defaults to 1."
+)
 @click.version_option("0.1")
 @click.pass_context
 def cli(ctx, **kwargs):
@@ -55,10 +76,17 @@ def cli(ctx, **kwargs):
 def ensure_controller(func):
     @wraps(func)
     def func_wrapper(session, *args, **kwargs):
-        if session.controller is None:
-            session.controller = import_module("CLIController").CLIController(session)
-        ret = func(session, *args, **kwargs)
-        return ret
+        processor = func(session, *args, **kwargs)
+
+        # controller is only created when command actually runs here,
+        # not when it is forwarded to build daemon
+        @wraps(processor)
+        def controlled_processor():
+            if session.controller is None:
+                session.controller = import_module("CLIController").CLIController(session)
+            return processor()
+        controlled_processor.request = (func.__name__, kwargs)
+        return controlled_processor
 
     return func_wrapper
 
@@ -74,6 +102,20 @@ def build(session, target):
         return session.controller.build_project(target)
     return processor
 
+
+@cli.command()
+@click.option(
+    "--board", "-B", "boards", multiple=True, required=True,
+    help="Board to build for, by name or PlatformIO env. Repeat for each board."
+)
+@pass_session
+@ensure_controller
+def matrix(session, boards):
+    """Builds project for several embedded boards in parallel. """
+    def processor():
+        return session.controller.build_matrix(boards)
+    return processor
+
 @cli.command()
 @pass_session
 @ensure_controller
@@ -102,26 +144,93 @@ def stop(session):
     return processor
 
 
+@cli.command()
+@click.option(
+    "--variable", "-V", "variables", multiple=True, required=True,
+    metavar="IECPATH",
+    help="IEC path of variable to trace, glob patterns allowed."
+)
+@click.option(
+    "--output", "-o", default="-", metavar="PATH",
+    help="Where to write samples, defaults to stdout."
+)
+@click.option(
+    "--format", "-f", "fmt", type=click.Choice(["csv", "bin"]), default="csv",
+    help="Output format, CSV or binary columnar."
+)
+@click.option(
+    "--duration", "-d", type=float, default=0,
+    help="Stop tracing after given seconds, 0 traces until interrupted."
+)
+@click.option(
+    "--period", type=float, default=0.1,
+    help="Trace polling period in seconds."
+)
+@pass_session
+@ensure_controller
+def trace(session, variables, output, fmt, duration, period):
+    """Trace PLC variables without GUI. """
+    # stdout only carries samples
+    if output == "-":
+        session.log_to_stderr = True
+
+    def processor():
+        return session.controller.trace_project(
+            variables, output, fmt, duration, period)
+    return processor
+
+
+@cli.command()
+@pass_session
+def daemon(session):
+    """Serve commands of other Beremiz_cli calls, keeping projects loaded. """
+    def processor():
+        return CLIDaemon.CLIDaemon(cli, CLISession).Serve()
+    return processor
+
+
+def forward_to_daemon(session, processors):
+    """
+    Run commands in build daemon if one is running, return exit code
+    or None if commands have to run in this process
+    """
+    requests = [getattr(processor, "request", None) for processor in processors]
+    if session.no_daemon or session.keep or any(
+            request is None or request[0] not in CLIDaemon.DAEMON_COMMANDS
+            for request in requests):
+        return None
+    kwargs = {k: v for k, v in session.__dict__.items() if k != "controller"}
+    kwargs["project_home"] = os.path.abspath(session.project_home)
+    if session.buildpath:
+        kwargs["buildpath"] = os.path.abspath(session.buildpath)
+    return CLIDaemon.RunInDaemon(kwargs, requests)
+
+
 @cli.result_callback()
 @pass_session
 def process_pipeline(session, processors, **kwargs):
+    ret = forward_to_daemon(session, processors)
+    if ret is not None:
+        return ret
+
     ret = 0
     for processor in processors:
         ret = processor()
         if ret != 0:
             if len(processors) > 1 :
-                click.echo("Command sequence aborted")
+                click.echo("Command sequence aborted", err=session.log_to_stderr)
             break
 
     if session.keep:
-        click.echo("Press Ctrl+C to quit")
+        click.echo("Press Ctrl+C to quit", err=session.log_to_stderr)
         try:
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
             pass
 
-    session.controller.finish()
+    if session.controller is not None:
+        session.controller.finish()
 
     return ret
 
@@ -3,6 +3,8 @@
 
 import os
 import sys
+import time
+from fnmatch import fnmatchcase
 from functools import wraps
 from threading import Timer
 from datetime import datetime
@@ -14,19 +16,24 @@ import fake_wx
 from ProjectController import ProjectController
 from LocalRuntimeMixin import LocalRuntimeMixin
 from runtime.loglevels import LogLevelsCount, LogLevels
+from runtime.typemapping import UnpackDebugBuffer
+from runtime import PlcStatus
+from util.TraceWriter import OpenTraceWriter
 
 
 class Log:
 
-    def __init__(self):
+    def __init__(self, stream=None):
+        # stderr when stdout carries trace samples
+        self.stream = stream or sys.stdout
         self.crlfpending = False
 
     def write(self, s):
         if s:
             if self.crlfpending:
-                sys.stdout.write("\n")
-            sys.stdout.write(s)
-            sys.stdout.flush()
+                self.stream.write("\n")
+            self.stream.write(s)
+            self.stream.flush()
             self.crlfpending = 0
 
     def write_error(self, s):
@@ -38,14 +45,14 @@ class Log:
             self.write("Warning: "+s)
 
     def flush(self):
-        sys.stdout.flush()
+        self.stream.flush()
         
     def isatty(self):
         return False
 
     def progress(self, s):
         if s:
-            sys.stdout.write(s+"\r")
+            self.stream.write(s+"\r")
             self.crlfpending = True
 
 
@@ -75,9 +82,13 @@ def connected(func):
 class CLIController(LocalRuntimeMixin, ProjectController):
     def __init__(self, session):
         self.session = session
-        log = Log()
+        log = Log(sys.stderr if session.log_to_stderr else None)
         LocalRuntimeMixin.__init__(self, log, use_gui=False)
         ProjectController.__init__(self, None, log)
+        if session.iec_cache is not None:
+            self.IECCodeCachePath = session.iec_cache or None
+        self.ProfileBuild = session.profile
+        self.GenerateJobs = session.jobs
         self.CLIStatusTimer = None
         self.KillCLIStatusTimer = False
 
@@ -164,6 +175,11 @@ class CLIController(LocalRuntimeMixin, ProjectController):
             
         return 0 if self._Build() else 1
 
+    @with_project_loaded
+    def build_matrix(self, boards):
+
+        return 0 if self._BuildMatrix(list(boards)) is not None else 1
+
     @with_project_loaded
     @connected
     def transfer_project(self):
@@ -181,7 +197,81 @@ class CLIController(LocalRuntimeMixin, ProjectController):
     def stop_project(self):
 
         return 0 if self._Stop() else 1
-        
+
+    def resolve_trace_variables(self, patterns):
+        """
+        Expand IEC path glob patterns into a list of (Idx, IECPath, IEC_Type)
+        sorted by debug index, as expected by the runtime
+        """
+        resolved = {}
+        for pattern in patterns:
+            pattern = pattern.upper()
+            matches = [(Idx, IECPath, IEC_Type)
+                       for IECPath, (Idx, IEC_Type) in self._IECPathToIdx.items()
+                       if fnmatchcase(IECPath, pattern)]
+            if not matches:
+                self.logger.write_warning(
+                    _("No variable matches \"%s\"\n") % pattern)
+            for match in matches:
+                resolved[match[0]] = match
+        return sorted(resolved.values())
+
+    @with_project_loaded
+    @connected
+    def trace_project(self, patterns, output, fmt, duration, period):
+        if not self.GetIECProgramsAndVariables():
+            return 1
+
+        traced = self.resolve_trace_variables(patterns)
+        if not traced:
+            self.logger.write_error(_("Nothing to trace\n"))
+            return 1
+
+        idxs, paths, types = list(zip(*traced))
+        token = self._connector.SetTraceVariablesList(
+            [(idx, iectype, None) for idx, iectype in zip(idxs, types)])
+        if token is None or token <= 0:
+            self.logger.write_error(
+                self.RegisterDebugVariableErrorCodes.get(
+                    -token if token is not None else None,
+                    _("Debug: Unknown error")))
+            return 1
+
+        # status polling would compete with trace polling on the connector
+        self.StopCLIStatusTimer()
+        writer = OpenTraceWriter(output, fmt, paths, types)
+        deadline = time.time() + duration if duration else None
+        complained = False
+        ret = 0
+        try:
+            while deadline is None or time.time() < deadline:
+                status, traces = self._connector.GetTraceVariables(token)
+                if status == PlcStatus.Broken or traces is None:
+                    self.logger.write_error(
+                        _("Debug: token rejected - other debug took over\n"))
+                    ret = 1
+                    break
+                samples = []
+                for tick, buff, *wall in traces:
+                    values = UnpackDebugBuffer(buff, types)
+                    if values is not None:
+                        samples.append((tick, wall[0] if wall else None, values))
+                    elif not complained:
+                        complained = True
+                        self.logger.write_warning(
+                            _("Debug: target couldn't trace all requested variables.\n"))
+                writer.write(samples)
+                time.sleep(period)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            writer.close()
+            if self._connector is not None:
+                self._connector.SetTraceVariablesList([])
+                self.StartCLIStatusTimer()
+
+        return ret
+
 
     def finish(self):
 
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Warm build server for Beremiz_cli.
+
+"Beremiz_cli.py daemon" keeps IDE modules imported and projects loaded, and
+serves build/transfer requests of other Beremiz_cli calls over a local
+socket, only accessible to current user. Projects are reloaded when one of
+their files changed, keeping POUs generated code that is still valid.
+
+This module is imported by every Beremiz_cli call, keep client side light.
+"""
+
+
+import os
+import sys
+import tempfile
+import traceback
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+from util.BuildGraph import ContentDigest
+
+# Commands that can run in daemon, others are always run by client
+DAEMON_COMMANDS = ("build", "matrix", "transfer", "run", "stop")
+
+
+def DaemonAddress():
+    if os.name == "nt":
+        import getpass
+        return r"\\.\pipe\beremiz-cli-" + getpass.getuser(), "AF_PIPE"
+    return os.path.join(
+        tempfile.gettempdir(), "beremiz-cli-%d.sock" % os.getuid()), "AF_UNIX"
+
+
+def DaemonKeyPath():
+    return os.path.join(
+        os.path.expanduser("~"), ".cache", "beremiz", "cli_daemon.key")
+
+
+def ReadDaemonKey():
+    try:
+        with open(DaemonKeyPath(), "rb") as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def CreateDaemonKey():
+    path = DaemonKeyPath()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    key = os.urandom(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def ConnectDaemon():
+    """
+    Return connection to running daemon, None if there is none
+    """
+    key = ReadDaemonKey()
+    if key is None:
+        return None
+    address, family = DaemonAddress()
+    try:
+        return Client(address, family, authkey=key)
+    except (OSError, EOFError, AuthenticationError):
+        return None
+
+
+def RunInDaemon(session, requests):
+    """
+    Run requests in daemon, writing its log to stdout.
+    Return exit code, None if no daemon is running.
+    """
+    conn = ConnectDaemon()
+    if conn is None:
+        return None
+    with conn:
+        conn.send({"cwd": os.getcwd(), "session": session, "requests": requests})
+        while True:
+            try:
+                kind, value = conn.recv()
+            except EOFError:
+                sys.stdout.write("Error: build daemon connection lost\n")
+                return 1
+            if kind == "log":
+                sys.stdout.write(value)
+                sys.stdout.flush()
+            elif kind == "result":
+                return value
+
+
+class DaemonLog(object):
+    """
+    Same output as CLI log, sent to client
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.crlfpending = False
+
+    def write(self, s):
+        if s:
+            if self.crlfpending:
+                s = "\n" + s
+            self.send(s)
+            self.crlfpending = False
+
+    def write_error(self, s):
+        if s:
+            self.write("Error: " + s)
+
+    def write_warning(self, s):
+        if s:
+            self.write("Warning: " + s)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def progress(self, s):
+        if s:
+            self.send(s + "\r")
+            self.crlfpending = True
+
+    def send(self, s):
+        try:
+            self.conn.send(("log", s))
+        except (OSError, ValueError):
+            # client gone, keep building anyway
+            pass
+
+
+def ProjectFilesDigest(project_home, buildpath):
+    """
+    Digest of project files names, sizes and modification times
+    """
+    items = []
+    for root, dirs, files in os.walk(project_home):
+        dirs[:] = sorted(
+            d for d in dirs
+            if not d.startswith(".") and d != "__pycache__" and
+            os.path.join(root, d) != buildpath)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            items.append((os.path.relpath(path, project_home),
+                          st.st_mtime_ns, st.st_size))
+    return ContentDigest(items)
+
+
+class CLIDaemon(object):
+    """
+    Serve Beremiz_cli requests, one at a time
+    """
+
+    def __init__(self, cli, session_class):
+        self.cli = cli
+        self.session_class = session_class
+        # (project_home, buildpath) : (controller, project files digest),
+        # digest being None when loaded project was modified in memory
+        self.Projects = {}
+
+    def Serve(self):
+        address, family = DaemonAddress()
+        if ConnectDaemon() is not None:
+            sys.stdout.write("Error: build daemon already running\n")
+            return 1
+        if family == "AF_UNIX" and os.path.exists(address):
+            # left by a daemon that didn't exit cleanly
+            os.unlink(address)
+
+        key = CreateDaemonKey()
+        # warm up before first request
+        import CLIController  # pylint: disable=unused-import
+
+        old_umask = os.umask(0o077) if family == "AF_UNIX" else None
+        try:
+            listener = Listener(address, family, authkey=key)
+        finally:
+            if old_umask is not None:
+                os.umask(old_umask)
+
+        sys.stdout.write("Build daemon listening on %s\n" % address)
+        sys.stdout.flush()
+        with listener:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError):
+                    continue
+                except KeyboardInterrupt:
+                    break
+                with conn:
+                    self.Handle(conn)
+        return 0
+
+    def Handle(self, conn):
+        try:
+            request = conn.recv()
+        except (OSError, EOFError):
+            return
+        log = DaemonLog(conn)
+        try:
+            result = self.RunRequests(request, log)
+        except Exception:
+            log.write_error(traceback.format_exc())
+            result = 1
+        try:
+            conn.send(("result", result))
+        except (OSError, ValueError):
+            pass
+
+    def GetController(self, session, log):
+        """
+        Return controller with project loaded and up to date
+        """
+        from CLIController import CLIController
+        from PLCGenerator import PouProgramCache
+
+        key = (session.project_home, session.buildpath)
+        controller, digest = self.Projects.get(key, (None, None))
+        loaded = controller is not None
+        if not loaded:
+            controller = CLIController(session)
+        controller.session = session
+        controller.logger = controller.local_runtime_log = log
+        if session.iec_cache is not None:
+            controller.IECCodeCachePath = session.iec_cache or None
+        controller.ProfileBuild = session.profile
+        controller.GenerateJobs = session.jobs
+
+        if not loaded:
+            if controller.check_and_load_project():
+                return None
+        elif digest is None or ProjectFilesDigest(
+                session.project_home, controller._getBuildPath()) != digest:
+            if digest is not None:
+                log.write("Project files changed, reloading project\n")
+            # still valid POUs are kept, loading a project clears cache
+            cache = controller.PouProgramCache
+            controller.PouProgramCache = PouProgramCache()
+            if controller.check_and_load_project():
+                self.Projects.pop(key, None)
+                return None
+            controller.PouProgramCache = cache
+        self.Projects[key] = (controller, None)
+        controller.apply_config()
+        return controller
+
+    def RunRequests(self, request, log):
+        import click
+
+        os.chdir(request["cwd"])
+        session = self.session_class(**request["session"])
+        controller = self.GetController(session, log)
+        if controller is None:
+            return 1
+        session.controller = controller
+
+        ret = 0
+        try:
+            with click.Context(self.cli, obj=session):
+                for name, kwargs in request["requests"]:
+                    processor = self.cli.commands[name].callback(**kwargs)
+                    ret = processor()
+                    if ret != 0:
+                        if len(request["requests"]) > 1:
+                            log.write("Command sequence aborted\n")
+                        break
+        finally:
+            controller.finish()
+            # files written by commands themselves don't need reload,
+            # but parameters changed in memory must not leak to next request
+            key = (session.project_home, session.buildpath)
+            if controller.CTNTestModified():
+                digest = None
+            else:
+                digest = ProjectFilesDigest(
+                    session.project_home, controller._getBuildPath())
+            self.Projects[key] = (controller, digest)
+        return ret
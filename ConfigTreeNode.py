@@ -45,6 +45,7 @@ from xmlclass import GenerateParserFromXSDstring
 from PLCControler import LOCATION_CONFNODE
 from editors.ConfTreeNodeEditor import ConfTreeNodeEditor
 from POULibrary import UserAddressedException
+from util.BuildProfiler import ProfileStage
 
 _BaseParamsParser = GenerateParserFromXSDstring("""<?xml version="1.0" encoding="ISO-8859-1" ?>
         <xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema">
@@ -279,7 +280,8 @@ class ConfigTreeNode(object):
     def _Generate_C(self, buildpath, locations):
         # Generate confnodes [(Cfiles, CFLAGS)], LDFLAGS, DoCalls, extra_files
         # extra_files = [(fname,fobject), ...]
-        gen_result = self.CTNGenerate_C(buildpath, locations)
+        with ProfileStage(self.CTNFullName() or self.CTNType, "confnode"):
+            gen_result = self.CTNGenerate_C(buildpath, locations)
         CTNCFilesAndCFLAGS, CTNLDFLAGS, DoCalls = gen_result[:3]
         extra_files = gen_result[3:]
         # if some files have been generated put them in the list with their location
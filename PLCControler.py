@@ -51,6 +51,32 @@ ScriptDirectory = paths.AbsDir(__file__)
 UNDO_BUFFER_LENGTH = 20
 
 
+class ProjectSnapshot(object):
+    """
+    Immutable snapshot of a project, kept serialized.
+    Project model is only rebuilt when debug views ask for it.
+    """
+
+    def __init__(self, xml):
+        self.XML = xml
+        self.Project = None
+
+    @classmethod
+    def FromProject(cls, project, previous=None):
+        """
+        Take snapshot of project, reusing previous one if nothing changed
+        """
+        xml = PLCOpenParser.Dumps(project)
+        if previous is not None and previous.XML == xml:
+            return previous
+        return cls(xml)
+
+    def GetProject(self):
+        if self.Project is None:
+            self.Project = PLCOpenParser.Loads(self.XML)
+        return self.Project
+
+
 class UndoBuffer(object):
     """
     Undo Buffer for PLCOpenEditor
@@ -161,6 +187,9 @@ class PLCControler(object):
         self.FileName = ""
         self.ProgramChunks = []
         self.ProgramOffset = 0
+        self.PouProgramCache = PouProgramCache()
+        # processes generating POUs of large projects, 0 for all processors
+        self.GenerateJobs = 1
         self.NextCompiledProject = None
         self.CurrentCompiledProject = None
         self.ConfNodeTypes = []
@@ -173,7 +202,7 @@ class PLCControler(object):
 
     def GetProject(self, debug=False):
         if debug and self.CurrentCompiledProject is not None:
-            return self.CurrentCompiledProject
+            return self.CurrentCompiledProject.GetProject()
         else:
             return self.Project
 
@@ -198,7 +227,8 @@ class PLCControler(object):
         self.CreateProjectBuffer(False)
         self.ProgramChunks = []
         self.ProgramOffset = 0
-        self.NextCompiledProject = self.Copy(self.Project)
+        self.PouProgramCache.Clear()
+        self.NextCompiledProject = self.GetProjectSnapshot()
         self.CurrentCompiledProject = None
         self.Buffering = False
 
@@ -450,8 +480,12 @@ class PLCControler(object):
         warnings = []
         if self.Project is not None:
             try:
-                self.ProgramChunks = GenerateCurrentProgram(self, self.Project, errors, warnings,**kwargs)
-                self.NextCompiledProject = self.Copy(self.Project)
+                self.ProgramChunks = GenerateCurrentProgram(
+                    self, self.Project, errors, warnings,
+                    cache=self.PouProgramCache, jobs=self.GenerateJobs,
+                    **kwargs)
+                self.NextCompiledProject = ProjectSnapshot.FromProject(
+                    self.Project, self.NextCompiledProject)
                 program_text = "".join([item[0] for item in self.ProgramChunks])
                 if filepath is not None:
                     programfile = open(filepath, "w", encoding='utf-8')
@@ -469,10 +503,10 @@ class PLCControler(object):
         return self.CurrentCompiledProject is not None
 
     def ProgramTransferred(self):
-        if self.NextCompiledProject is None:
+        if self.NextCompiledProject is not None:
             self.CurrentCompiledProject = self.NextCompiledProject
         else:
-            self.CurrentCompiledProject = self.Copy(self.Project)
+            self.CurrentCompiledProject = ProjectSnapshot.FromProject(self.Project)
 
     def GetChunkInfos(self, from_location, to_location):
         row = self.ProgramOffset + 1
@@ -2745,7 +2779,8 @@ class PLCControler(object):
         self.CreateProjectBuffer(True)
         self.ProgramChunks = []
         self.ProgramOffset = 0
-        self.NextCompiledProject = self.Copy(self.Project)
+        self.PouProgramCache.Clear()
+        self.NextCompiledProject = self.GetProjectSnapshot()
         self.CurrentCompiledProject = None
         self.Buffering = False
         self.CurrentElementEditing = None
@@ -2798,6 +2833,12 @@ class PLCControler(object):
         """Return a copy of the project"""
         return deepcopy(model)
 
+    def GetProjectSnapshot(self):
+        """Return snapshot of project, serialized state in undo buffer if any"""
+        if self.ProjectBuffer is not None:
+            return ProjectSnapshot(self.ProjectBuffer.Current())
+        return ProjectSnapshot.FromProject(self.Project)
+
     def CreateProjectBuffer(self, saved):
         if self.ProjectBufferEnabled:
             self.ProjectBuffer = UndoBuffer(PLCOpenParser.Dumps(self.Project), saved)
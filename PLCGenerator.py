@@ -25,12 +25,21 @@
 
 from functools import cmp_to_key
 from operator import eq
+import os
 import re
+import sys
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from functools import reduce
 
+from lxml import etree
+
 from plcopen import PLCOpenParser
 from plcopen.structures import *
 from plcopen.types_enums import *
+import PLCGeneratorWorker
+from util.BuildProfiler import ProfileStage
 
 
 # Dictionary associating PLCOpen variable categories to the corresponding
@@ -100,6 +109,75 @@ class PLCGenException(Exception):
     pass
 
 
+# -------------------------------------------------------------------------------
+#                        Cache of generated POU programs
+# -------------------------------------------------------------------------------
+
+
+# Below this number of POUs to generate, starting worker processes
+# (about a second each, mostly importing modules) costs more than it saves
+PARALLEL_MIN_POUS = 500
+
+
+def LookupDigest(result):
+    return hashlib.md5(repr(result).encode()).hexdigest()
+
+
+def PouDigest(pou):
+    return hashlib.md5(etree.tostring(pou)).hexdigest()
+
+
+class PouProgramCache(object):
+    """
+    Program chunks generated for each POU, kept between generations.
+    An entry is reused as long as the POU model is unchanged and every block
+    type, data type and POU name in text looked up while generating it still
+    gives same result.
+    """
+
+    def __init__(self):
+        self.Entries = {}
+
+    def Get(self, name, digest, lookup):
+        entry = self.Entries.get(name)
+        if entry is None or entry["digest"] != digest:
+            return None
+        for method, args, result in entry["lookups"]:
+            if lookup(method, args) != result:
+                return None
+        return entry
+
+    def Set(self, name, digest, lookups, events, program):
+        self.Entries[name] = {
+            "digest": digest,
+            "lookups": lookups,
+            "events": events,
+            "program": program}
+
+    def Prune(self, names):
+        for name in list(self.Entries.keys()):
+            if name not in names:
+                self.Entries.pop(name)
+
+    def Clear(self):
+        self.Entries = {}
+
+
+class RecordedWarnings(list):
+    """
+    Warnings of a POU being generated, also recorded for replay from cache
+    """
+
+    def __init__(self, warnings, events):
+        list.__init__(self)
+        self.Target = warnings
+        self.Events = events
+
+    def append(self, msg):
+        self.Target.append(msg)
+        self.Events.append(("warning", msg))
+
+
 # -------------------------------------------------------------------------------
 #                           Generator of PLC program
 # -------------------------------------------------------------------------------
@@ -108,7 +186,7 @@ class PLCGenException(Exception):
 class ProgramGenerator(object):
 
     # Create a new PCL program generator
-    def __init__(self, controler, project, errors, warnings):
+    def __init__(self, controler, project, errors, warnings, cache=None, jobs=1):
         # Keep reference of the controler and project
         self.Controler = controler
         self.Project = project
@@ -116,12 +194,57 @@ class ProgramGenerator(object):
         self.Program = []
         self.DatatypeComputed = {}
         self.PouComputed = {}
+        self.PouNameModels = {}
         self.Errors = errors
         self.Warnings = warnings
+        # Cache of POU programs and stack of what POUs being generated use
+        self.Cache = cache
+        self.Recorders = []
+        # Project doesn't change while generating, lookups are done once
+        self.Lookups = {}
+        # Number of processes generating POUs
+        self.Jobs = jobs
+
+    # Lookups done by generator itself, depending on project POUs
+    GeneratorLookups = {"GetPouNamesInText"}
+
+    # Controler lookups, recorded as dependencies of POU being generated
+    def ControlerLookup(self, method, *args):
+        if self.Recorders:
+            self.Recorders[-1]["lookups"].setdefault(
+                (method, args), self.GetLookupDigest(method, args))
+        return self.GetLookup(method, args)[0]
+
+    def GetLookup(self, method, args):
+        lookup = self.Lookups.get((method, args))
+        if lookup is None:
+            source = self if method in self.GeneratorLookups else self.Controler
+            lookup = [getattr(source, method)(*args), None]
+            self.Lookups[(method, args)] = lookup
+        return lookup
+
+    def GetLookupDigest(self, method, args):
+        lookup = self.GetLookup(method, args)
+        if lookup[1] is None:
+            lookup[1] = LookupDigest(lookup[0])
+        return lookup[1]
+
+    def GetBlockType(self, typename, inputs=None):
+        return self.ControlerLookup("GetBlockType", typename, inputs)
+
+    def GetDataTypeInfos(self, tagname):
+        return self.ControlerLookup("GetDataTypeInfos", tagname)
+
+    def GetBaseType(self, typename):
+        return self.ControlerLookup("GetBaseType", typename)
+
+    def RecordEvent(self, kind, name):
+        if self.Recorders:
+            self.Recorders[-1]["events"].append((kind, name))
 
     # Compute value according to type given
     def ComputeValue(self, value, var_type):
-        base_type = self.Controler.GetBaseType(var_type)
+        base_type = self.GetBaseType(var_type)
         if base_type == "STRING" and not value.startswith("'") and not value.endswith("'"):
             return "'%s'" % value
         elif base_type == "WSTRING" and not value.startswith('"') and not value.endswith('"'):
@@ -130,6 +253,7 @@ class ProgramGenerator(object):
 
     # Generate a data type from its name
     def GenerateDataType(self, datatype_name):
+        self.RecordEvent("type", datatype_name)
         # Verify that data type hasn't been generated yet
         if not self.DatatypeComputed.get(datatype_name, True):
             # If not mark data type as computed
@@ -245,6 +369,7 @@ class ProgramGenerator(object):
 
     # Generate a POU from its name
     def GeneratePouProgram(self, pou_name):
+        self.RecordEvent("pou", pou_name)
         # Verify that POU hasn't been generated yet
         if not self.PouComputed.get(pou_name, True):
             # If not mark POU as computed
@@ -255,6 +380,9 @@ class ProgramGenerator(object):
             pou_type = pou.getpouType()
             # Verify that POU type exists
             if pou_type in pouTypeNames:
+                if self.Cache is not None:
+                    self.GenerateCachedPouProgram(pou, pouTypeNames[pou_type])
+                    return
                 # Create a POU program generator
                 pou_program = PouProgramGenerator(self, pou.getname(), pouTypeNames[pou_type], self.Errors, self.Warnings)
                 program = pou_program.GenerateProgram(pou)
@@ -262,12 +390,60 @@ class ProgramGenerator(object):
             else:
                 raise PLCGenException(_("Undefined pou type \"%s\"") % pou_type)
 
+    # Generate a POU, reusing program generated previously if still valid
+    def GenerateCachedPouProgram(self, pou, pou_type):
+        pou_name = pou.getname()
+        digest = PouDigest(pou)
+        recorder = {"lookups": {}, "events": []}
+        entry = self.Cache.Get(pou_name, digest, self.GetLookupDigest)
+
+        self.Recorders.append(recorder)
+        try:
+            with ProfileStage(pou_name, "pou", cached=entry is not None):
+                if entry is not None:
+                    # Replay POUs generated and warnings raised in between,
+                    # so that program chunks come in the same order
+                    for kind, name in entry["events"]:
+                        if kind == "pou":
+                            self.GeneratePouProgram(name)
+                        elif kind == "type":
+                            self.GenerateDataType(name)
+                        else:
+                            self.Warnings.append(name)
+                    program = entry["program"]
+                else:
+                    pou_program = PouProgramGenerator(
+                        self, pou_name, pou_type, self.Errors,
+                        RecordedWarnings(self.Warnings, recorder["events"]))
+                    program = pou_program.GenerateProgram(pou)
+                    self.Cache.Set(pou_name, digest,
+                                   [(method, args, result) for (method, args), result
+                                    in recorder["lookups"].items()],
+                                   recorder["events"], program)
+        finally:
+            self.Recorders.pop()
+
+        self.Program += program
+
     # Generate a POU defined and used in text
     def GeneratePouProgramInText(self, text):
+        # recorded, so that adding or removing a POU used in text
+        # invalidates cached program of POU using it
+        for pou_name in self.ControlerLookup("GetPouNamesInText", text):
+            self.GeneratePouProgram(pou_name)
+
+    # Names of project POUs used in text
+    def GetPouNamesInText(self, text):
+        names = []
         for pou_name in list(self.PouComputed.keys()):
-            model = re.compile("(?:^|[^0-9^A-Z])%s(?:$|[^0-9^A-Z])" % pou_name.upper())
+            # compiled once, re module cache is too small for large projects
+            model = self.PouNameModels.get(pou_name)
+            if model is None:
+                model = re.compile("(?:^|[^0-9^A-Z])%s(?:$|[^0-9^A-Z])" % pou_name.upper())
+                self.PouNameModels[pou_name] = model
             if model.search(text) is not None:
-                self.GeneratePouProgram(pou_name)
+                names.append(pou_name)
+        return names
 
     # Generate a configuration from its model
     def GenerateConfiguration(self, configuration):
@@ -476,10 +652,18 @@ class ProgramGenerator(object):
                 log("Generate Data Type %s"%datatype_name)
                 self.GenerateDataType(datatype_name)
             self.Program += [("END_TYPE\n\n", ())]
+        # Generate POUs in worker processes first, then get them
+        # from cache in their usual order
+        if self.Jobs > 1 and self.Cache is not None:
+            with ProfileStage("Parallel POU generation", "generate"):
+                self.GeneratePouProgramsInParallel(log)
         # Generate every POUs defined
         for pou_name in list(self.PouComputed.keys()):
             log("Generate POU %s"%pou_name)
             self.GeneratePouProgram(pou_name)
+        # Forget POUs removed from project
+        if self.Cache is not None:
+            self.Cache.Prune(self.PouComputed)
         if noconfig:
             return
         # Generate every configurations defined
@@ -487,6 +671,41 @@ class ProgramGenerator(object):
         for config in self.Project.getconfigurations():
             self.Program += self.GenerateConfiguration(config)
 
+    # Generate POUs missing from cache in a pool of processes
+    def GeneratePouProgramsInParallel(self, log):
+        digests = {}
+        for pou in self.Project.getpous():
+            pou_name = pou.getname()
+            digest = PouDigest(pou)
+            if pou.getpouType() in pouTypeNames and \
+               self.Cache.Get(pou_name, digest, self.GetLookupDigest) is None:
+                digests[pou_name] = digest
+        if len(digests) < PARALLEL_MIN_POUS:
+            return
+
+        log("Generate %d POUs in %d processes" % (len(digests), self.Jobs))
+        project_xml = PLCOpenParser.Dumps(self.Project)
+        confnode_types = [
+            (confnodetypes["name"], PLCOpenParser.Dumps(confnodetypes["types"]))
+            for confnodetypes in getattr(self.Controler, "ConfNodeTypes", [])]
+
+        # few batches per process, keeping IPC low while balancing load
+        names = list(digests.keys())
+        nb_batches = min(len(names), self.Jobs * 4)
+        batches = [names[i::nb_batches] for i in range(nb_batches)]
+
+        with ProcessPoolExecutor(
+                self.Jobs,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=PLCGeneratorWorker.InitWorker,
+                initargs=(project_xml, confnode_types,
+                          "fake_wx" in sys.modules)) as pool:
+            for entries in pool.map(PLCGeneratorWorker.GeneratePouPrograms, batches):
+                for pou_name, entry in entries.items():
+                    self.Cache.Set(pou_name, digests[pou_name],
+                                   entry["lookups"], entry["events"],
+                                   entry["program"])
+
     # Return generated program
     def GetGeneratedProgram(self):
         return self.Program
@@ -545,7 +764,7 @@ class PouProgramGenerator(object):
         self.Warnings = warnings
 
     def GetBlockType(self, type, inputs=None):
-        return self.ParentGenerator.Controler.GetBlockType(type, inputs)
+        return self.ParentGenerator.GetBlockType(type, inputs)
 
     def IndentLeft(self):
         if len(self.CurrentIndent) >= 2:
@@ -579,7 +798,7 @@ class PouProgramGenerator(object):
                         current_type = var_type
                         break
             while current_type is not None and len(parts) > 0:
-                blocktype = self.ParentGenerator.Controler.GetBlockType(current_type)
+                blocktype = self.ParentGenerator.GetBlockType(current_type)
                 if blocktype is not None:
                     name = parts.pop(0)
                     current_type = None
@@ -589,7 +808,7 @@ class PouProgramGenerator(object):
                             break
                 else:
                     tagname = ComputeDataTypeName(current_type)
-                    infos = self.ParentGenerator.Controler.GetDataTypeInfos(tagname)
+                    infos = self.ParentGenerator.GetDataTypeInfos(tagname)
                     if infos is not None and infos["type"] == "Structure":
                         name = parts.pop(0)
                         current_type = None
@@ -1767,8 +1986,15 @@ class PouProgramGenerator(object):
         return program
 
 
-def GenerateCurrentProgram(controler, project, errors, warnings, **kwargs):
-    generator = ProgramGenerator(controler, project, errors, warnings)
+def GenerateCurrentProgram(controler, project, errors, warnings, cache=None, jobs=1, **kwargs):
+    # Large projects can be generated in several processes, 0 for all
+    # processors, only when asked for as it starts a pool of processes
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs > 1 and cache is None and \
+       len(project.getpous()) >= PARALLEL_MIN_POUS:
+        cache = PouProgramCache()
+    generator = ProgramGenerator(controler, project, errors, warnings, cache, jobs)
     if hasattr(controler, "logger"):
         def log(txt):
             controler.logger.write("    "+txt+"\n")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Generation of POU programs in worker processes.
+
+Kept apart from PLCGenerator so that worker processes can choose how wx is
+imported (real or fake) before loading any IDE module.
+"""
+
+
+import builtins
+
+WorkerControler = None
+
+
+def InitWorker(project_xml, confnode_types, headless):
+    """
+    Build a read-only controler out of serialized project and confnodes types
+    """
+    global WorkerControler
+    builtins.__dict__.setdefault("_", lambda txt: txt)
+    if headless:
+        import fake_wx  # pylint: disable=unused-import
+    # PLCControler imports graphics, that needs controls loaded first
+    import controls  # pylint: disable=unused-import
+    from PLCControler import PLCControler
+    from plcopen import PLCOpenParser
+
+    controler = PLCControler()
+    controler.Project = PLCOpenParser.Loads(project_xml)
+    controler.AddConfNodeTypesList([
+        {"name": name, "types": PLCOpenParser.Loads(types_xml)}
+        for name, types_xml in confnode_types])
+    WorkerControler = controler
+
+
+def GeneratePouPrograms(pou_names):
+    """
+    Generate given POUs alone, POUs they use are only recorded.
+    Return cache entries of POUs generated without error, others
+    are generated again by main process that reports the error.
+    """
+    from PLCGenerator import ProgramGenerator, PouProgramCache, pouTypeNames
+
+    project = WorkerControler.Project
+    cache = PouProgramCache()
+    generator = ProgramGenerator(WorkerControler, project, [], [], cache)
+    generator.PouComputed = {pou.getname(): True for pou in project.getpous()}
+    for pou_name in pou_names:
+        pou = project.getpou(pou_name)
+        try:
+            generator.GenerateCachedPouProgram(
+                pou, pouTypeNames[pou.getpouType()])
+        except Exception:
+            pass
+        generator.Program = []
+    return cache.Entries
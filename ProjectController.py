@@ -57,13 +57,24 @@ from editors.FileManagementPanel import FileManagementPanel
 from editors.ProjectNodeEditor import ProjectNodeEditor
 from editors.IECCodeViewer import IECCodeViewer
 from editors.DebugViewer import DebugViewer, REFRESH_PERIOD
-from dialogs import UriEditor
+from dialogs import UriEditor, POUProfileDialog
 from PLCControler import PLCControler
 from plcopen.structures import IEC_KEYWORDS
 from plcopen.types_enums import ComputeConfigurationResourceName, ITEM_CONFNODE
 import targets
 from runtime.typemapping import DebugTypesSize, UnpackDebugBuffer
 from runtime import PlcStatus
+from util.VariablesTable import LoadVariablesTable
+from util.BuildGraph import BuildGraph, ContentDigest, FileDigest, TreeDigest, WriteIfChanged
+from util.IECCodeCache import IECCodeCache, DefaultIECCodeCachePath
+from util.BuildProfiler import BUILD_PROFILE_FILE, StartProfiling, StopProfiling, ProfileStage
+from util.POUProfile import POU_PROFILE_NAMES, INCLUDE_POUS, InstrumentPOUs, ProfileRows
+from util.ScanStats import FormatScanStats, FormatJitter
+from util.TaskStats import FormatTaskStats
+from util.IECTime import gettime
+from util.RetainImage import (
+    RETAIN_LAYOUT, RetainLayout, ImageSize, LayoutHash, WriteLayout,
+    ReadLayout, DecodeRetainImage)
 from ConfigTreeNode import ConfigTreeNode, XSDSchemaErrorMessage
 from POULibrary import UserAddressedException
 
@@ -72,6 +83,11 @@ base_folder = paths.AbsDir(__file__)
 MATIEC_ERROR_MODEL = re.compile(
     r".*\.st:(\d+)-(\d+)\.\.(\d+)-(\d+): (?:error)|(?:warning) : (.*)$")
 
+# seconds between two reads of embedded runtime scan statistics
+SCAN_STATS_PERIOD = 2.0
+# longest wait for them, GUI is blocked meanwhile
+SCAN_STATS_TIMEOUT = 0.2
+
 
 def ExtractChildrenTypesFromCatalog(catalog):
     children_types = []
@@ -103,6 +119,7 @@ class Iec2CSettings(object):
     def __init__(self, controler):
         self.iec2c = None
         self.iec2c_buildopts = None
+        self.iec2c_digest = None
         self.ieclib_path = self.findLibPath()
         self.ieclib_c_path = self.findLibCPath()
         self.controler = controler
@@ -187,6 +204,19 @@ class Iec2CSettings(object):
             self.ieclib_c_path = self.findLibCPath()
         return self.ieclib_c_path
 
+    def getDigest(self):
+        """
+        Return digest of compiler binary, options and IEC library content,
+        independent of install location
+        """
+        if self.iec2c_digest is None:
+            cmd = self.getCmd()
+            self.iec2c_digest = ContentDigest(
+                FileDigest(shutil.which(cmd) or cmd),
+                self.getOptions(),
+                TreeDigest(self.getLibPath()))
+        return self.iec2c_digest
+
 
 def GetProjectControllerXSD():
     XSD = """<?xml version="1.0" encoding="ISO-8859-1" ?>
@@ -273,6 +303,9 @@ class ProjectController(ConfigTreeNode, PLCControler):
         self._setBuildPath(None)
         self.debug_break = False
         self.previous_plcstate = None
+        self.PLCStats = None
+        self.PLCStatsTime = 0
+        self.PLCStatsPolled = True
         # copy StatusMethods so that it can be later customized
         self.StatusMethods = [dic.copy() for dic in self.StatusMethods]
         self.DebugToken = None
@@ -281,10 +314,16 @@ class ProjectController(ConfigTreeNode, PLCControler):
 
         self.IECcodeDigest = None
         self.LastBuiltIECcodeDigest = None
+        self.BuildGraph = None
+        # shared cache of iec2c output, None to disable
+        self.IECCodeCachePath = DefaultIECCodeCachePath()
+        # time build stages, see util.BuildProfiler
+        self.ProfileBuild = False
+        self.Libraries = []
+        self.LoadedLibraries = None
 
     def LoadLibraries(self):
-        self.Libraries = []
-        TypeStack = []
+        enabled = []
         for libname, clsname, lib_enabled in features.libraries:
             if self.BeremizRoot.Libraries is not None:
                 enable_attr = getattr(self.BeremizRoot.Libraries,
@@ -293,9 +332,19 @@ class ProjectController(ConfigTreeNode, PLCControler):
                     lib_enabled = enable_attr
 
             if lib_enabled:
-                Lib = GetClassImporter(clsname)()(self, libname, TypeStack)
-                TypeStack.append(Lib.GetTypes())
-                self.Libraries.append(Lib)
+                enabled.append((libname, clsname))
+
+        # Libraries are parsed again only if selection changed
+        if enabled == self.LoadedLibraries:
+            return
+
+        self.Libraries = []
+        TypeStack = []
+        for libname, clsname in enabled:
+            Lib = GetClassImporter(clsname)()(self, libname, TypeStack)
+            TypeStack.append(Lib.GetTypes())
+            self.Libraries.append(Lib)
+        self.LoadedLibraries = enabled
 
     def SetAppFrame(self, frame, logger):
         self.AppFrame = frame
@@ -706,6 +755,10 @@ class ProjectController(ConfigTreeNode, PLCControler):
     def _getExtraFilesPath(self):
         return os.path.join(self._getBuildPath(), "extra_files")
 
+    def _getDebugFilterPath(self):
+        # filter used to build debug table, kept with build results
+        return os.path.join(self._getBuildPath(), "debug_filter.txt")
+
     def _getIECcodepath(self):
         # define name for IEC code file
         return os.path.join(self._getBuildPath(), "plc.st")
@@ -755,9 +808,11 @@ class ProjectController(ConfigTreeNode, PLCControler):
         return LibGlobals + CTNGlobals
 
     def _Generate_SoftPLC(self):
-        if self._Generate_PLC_ST():
+        with ProfileStage("Generate ST"):
+            if not self._Generate_PLC_ST():
+                return False
+        with ProfileStage("IEC to C"):
             return self._Compile_ST_to_SoftPLC()
-        return False
 
     def _Generate_PLC_ST(self):
         """
@@ -802,9 +857,7 @@ class ProjectController(ConfigTreeNode, PLCControler):
         if not os.path.exists(IECcodepath):
             self.LastBuiltIECcodeDigest = None
 
-        with open(IECcodepath, "w") as plc_file:
-            plc_file.write(IECCodeContent)
-            plc_file.write(POUsIECCodeContent)
+        WriteIfChanged(IECcodepath, IECCodeContent + POUsIECCodeContent)
 
         hasher = hashlib.md5()
         hasher.update(IECCodeContent.encode())
@@ -821,9 +874,9 @@ class ProjectController(ConfigTreeNode, PLCControler):
 
         if self.LastBuiltIECcodeDigest == self.IECcodeDigest:
             self.logger.write(_("IEC program did no change, not re-compiling into C code.\n"))
+            self._SkipBuildStage("IEC to C")
             return True
 
-        self.logger.write(_("Compiling IEC Program into C code...\n"))
         buildpath = self._getBuildPath()
         buildcmd = "\"%s\" %s -I \"%s\" -T \"%s\" \"%s\"" % (
             self.iec2c_cfg.getCmd(),
@@ -832,6 +885,38 @@ class ProjectController(ConfigTreeNode, PLCControler):
             buildpath,
             self._getIECcodepath())
 
+        # C files produced by a previous session can be reused as is
+        graph = self.BuildGraph
+        stage_inputs = ContentDigest(self.IECcodeDigest, buildcmd)
+        if graph is not None and graph.UpToDate("IEC to C", stage_inputs):
+            self.logger.write(_("IEC program did no change, not re-compiling into C code.\n"))
+            self._SkipBuildStage("IEC to C")
+            self._SetIECtoCOutputs(graph.Data("IEC to C"))
+            return True
+
+        if graph is not None:
+            graph.Invalidate("IEC to C")
+
+        # C files produced by any project with same ST code and compiler
+        cache = None
+        if self.IECCodeCachePath:
+            cache = IECCodeCache(self.IECCodeCachePath)
+            cache_key = ContentDigest(
+                self.IECcodeDigest, self.iec2c_cfg.getDigest())
+            cached = cache.Restore(cache_key, buildpath)
+            if cached is not None:
+                self.logger.write(_("IEC program found in cache, not re-compiling into C code.\n"))
+                self._SkipBuildStage("IEC to C")
+                self._SetIECtoCOutputs(cached["C_files"])
+                if graph is not None:
+                    graph.Done("IEC to C", stage_inputs,
+                               [os.path.join(buildpath, fname)
+                                for fname in cached["outputs"]],
+                               cached["C_files"])
+                return True
+
+        self.logger.write(_("Compiling IEC Program into C code...\n"))
+
         try:
             # Invoke compiler.
             # Output files are listed to stdout, errors to stderr
@@ -901,17 +986,40 @@ class ProjectController(ConfigTreeNode, PLCControler):
                 modified.write('#include "beremiz.h"\n' + data)
 
         self.logger.write(_("Extracting Located Variables...\n"))
+        C_files = [os.path.basename(fpath) for fpath in C_files]
+        self._SetIECtoCOutputs(C_files)
+
+        outputs = [os.path.join(buildpath, fname) for fname in
+                   dict.fromkeys(result.splitlines() + ["VARIABLES.csv"]) if fname]
+        outputs = [fpath for fpath in outputs if os.path.isfile(fpath)]
+        if graph is not None:
+            graph.Done("IEC to C", stage_inputs, outputs, C_files)
+        if cache is not None:
+            cache.Store(cache_key, outputs, {
+                "C_files": C_files,
+                "outputs": [os.path.basename(fpath) for fpath in outputs]})
+
+        return True
+
+    def _SetIECtoCOutputs(self, C_files):
+        """
+        Keep track of IEC to C compiler results, given C files base names
+        """
         # Keep track of generated located variables for later use by
         # self._Generate_C
         self.PLCGeneratedLocatedVars = self.GetLocations()
         # Keep track of generated C files for later use by self.CTNGenerate_C
-        self.PLCGeneratedCFiles = C_files
+        self.PLCGeneratedCFiles = [
+            os.path.join(self._getBuildPath(), filename)
+            for filename in C_files]
         # compute CFLAGS for plc
         self.plcCFLAGS = '"-I%s" -Wno-unused-function' % self.iec2c_cfg.getLibCPath()
 
         self.LastBuiltIECcodeDigest = self.IECcodeDigest
 
-        return True
+    def _SkipBuildStage(self, stage):
+        if self.BuildGraph is not None:
+            self.BuildGraph.Skip(stage)
 
     def GetBuilder(self):
         """
@@ -941,20 +1049,73 @@ class ProjectController(ConfigTreeNode, PLCControler):
         @return: [(C_file_name, CFLAGS),...] , LDFLAGS_TO_APPEND
         """
 
+        C_files = self.PLCGeneratedCFiles
+        if self.IsPOUProfilingEnabled():
+            C_files = self.Generate_POU_profiler(buildpath) or C_files
+
         return ([(C_file_name, self.plcCFLAGS)
-                 for C_file_name in self.PLCGeneratedCFiles],
+                 for C_file_name in C_files],
                 "",  # no ldflags
                 False)  # do not expose retreive/publish calls
 
+    def IsPOUProfilingEnabled(self):
+        content = self.GetTarget().getcontent()
+        return content is not None and \
+            content.getLocalTag() == "PlatformIO" and \
+            bool(content.getEnable_Profiling())
+
+    def Generate_POU_profiler(self, buildpath):
+        """
+        Write timed copies of IEC2C generated code to buildpath, leaving
+        IEC2C outputs untouched, and profile table code. IEC2C outputs may
+        be elsewhere, e.g. shared by boards of build matrix.
+        @return: C files to compile instead of IEC2C generated ones
+        """
+        with open(os.path.join(self._getBuildPath(), "POUS.c")) as f:
+            code, names = InstrumentPOUs(f.read())
+        if not names:
+            self.logger.write_warning(_("POU profiling: no POU to profile\n"))
+            return None
+        WriteIfChanged(os.path.join(buildpath, "POUS_profile.c"), code)
+
+        C_files = []
+        for C_file_name in self.PLCGeneratedCFiles:
+            with open(C_file_name) as f:
+                code = f.read()
+            if INCLUDE_POUS in code:
+                C_file_name = os.path.join(buildpath, os.path.splitext(
+                    os.path.basename(C_file_name))[0] + "_profile.c")
+                WriteIfChanged(C_file_name, code.replace(
+                    INCLUDE_POUS, '#include "POUS_profile.c"'))
+            C_files.append(C_file_name)
+
+        loader = FileSystemLoader(
+            os.path.join(paths.AbsDir(__file__), 'platformio', 'templates'))
+        env = Environment(loader=loader)
+        for template in ("pou_profile.h", "pou_profile.c"):
+            WriteIfChanged(os.path.join(buildpath, template),
+                           env.get_template(template + ".j2").render(names=names))
+        WriteIfChanged(os.path.join(buildpath, POU_PROFILE_NAMES),
+                       "".join(name + "\n" for name in names))
+
+        self.logger.write(
+            _("POU profiling: {a1} programs and function blocks timed\n").format(
+                a1=len(names)))
+        return C_files + [os.path.join(buildpath, "pou_profile.c")]
+
     def ResetIECProgramsAndVariables(self):
         """
         Reset variable and program list that are parsed from
         CSV file generated by IEC2C compiler.
         """
+        # views on table must be dropped before it is closed
         self._ProgramList = None
         self._VariablesList = None
         self._DbgVariablesList = None
         self._IECPathToIdx = {}
+        if getattr(self, "_VariablesTable", None) is not None:
+            self._VariablesTable.close()
+        self._VariablesTable = None
         self._Ticktime = 0
         self.TracedIECPath = []
         self.TracedIECTypes = []
@@ -964,76 +1125,25 @@ class ProjectController(ConfigTreeNode, PLCControler):
         Parse CSV-like file  VARIABLES.csv resulting from IEC2C compiler.
         Each section is marked with a line staring with '//'
         list of all variables used in various POUs
+
+        Parsed result is cached in build directory, and memory mapped
+        as long as VARIABLES.csv doesn't change.
         """
         if self._ProgramList is None or self._VariablesList is None:
             try:
                 csvfile = os.path.join(self._getBuildPath(), "VARIABLES.csv")
-                # describes CSV columns
-                ProgramsListAttributeName = ["num", "C_path", "type"]
-                VariablesListAttributeName = [
-                    "num", "vartype", "IEC_path", "C_path", "type", "derived", "retain"]
-                self._ProgramList = []
-                self._VariablesList = []
-                self._DbgVariablesList = []
-                self._IECPathToIdx = {}
-
-                # Separate sections
-                ListGroup = []
-                for line in open(csvfile, 'r').readlines():
-                    strippedline = line.strip()
-                    if strippedline.startswith("//"):
-                        # Start new section
-                        ListGroup.append([])
-                    elif len(strippedline) > 0 and len(ListGroup) > 0:
-                        # append to this section
-                        ListGroup[-1].append(strippedline)
-
-                # first section contains programs
-                for line in ListGroup[0]:
-                    # Split and Maps each field to dictionnary entries
-                    attrs = dict(
-                        list(zip(ProgramsListAttributeName, line.strip().split(';'))))
-                    # Truncate "C_path" to remove conf an resources names
-                    attrs["C_path"] = '__'.join(
-                        attrs["C_path"].split(".", 2)[1:])
-                    # Push this dictionnary into result.
-                    self._ProgramList.append(attrs)
-
-                # second section contains all variables
-                config_FBs = {}
-                Idx = 0
-                for line in ListGroup[1]:
-                    # Split and Maps each field to dictionnary entries
-                    attrs = dict(
-                        list(zip(VariablesListAttributeName, line.strip().split(';'))))
-                    # Truncate "C_path" to remove conf an resources names
-                    parts = attrs["C_path"].split(".", 2)
-                    if len(parts) > 2:
-                        config_FB = config_FBs.get(tuple(parts[:2]))
-                        if config_FB:
-                            parts = [config_FB] + parts[2:]
-                            attrs["C_path"] = '.'.join(parts)
-                        else:
-                            attrs["C_path"] = '__'.join(parts[1:])
-                    else:
-                        attrs["C_path"] = '__'.join(parts)
-                        if attrs["vartype"] == "FB":
-                            config_FBs[tuple(parts)] = attrs["C_path"]
-                    if attrs["vartype"] != "FB" and attrs["type"] in DebugTypesSize:
-                        # Push this dictionnary into result.
-                        self._DbgVariablesList.append(attrs)
-                        # Fill in IEC<->C translation dicts
-                        IEC_path = attrs["IEC_path"]
-                        self._IECPathToIdx[IEC_path] = (Idx, attrs["type"])
-                        # Ignores numbers given in CSV file
-                        # Idx=int(attrs["num"])
-                        # Count variables only, ignore FBs
-                        Idx += 1
-                    self._VariablesList.append(attrs)
-
-                # third section contains ticktime
-                if len(ListGroup) > 2:
-                    self._Ticktime = int(ListGroup[2][0])
+                debug_filter = ""
+                if os.path.isfile(self._getDebugFilterPath()):
+                    with open(self._getDebugFilterPath()) as f:
+                        debug_filter = f.read()
+                table = LoadVariablesTable(csvfile, DebugTypesSize,
+                                           debug_filter=debug_filter)
+                self._VariablesTable = table
+                self._ProgramList = table.programs
+                self._VariablesList = table.variables
+                self._DbgVariablesList = table.debug_variables
+                self._IECPathToIdx = table.paths
+                self._Ticktime = table.ticktime
 
             except Exception:
                 self.logger.write_error(
@@ -1044,27 +1154,37 @@ class ProjectController(ConfigTreeNode, PLCControler):
 
         return True
 
+    def HasDebugIECVariables(self, IECPathPrefix):
+        """
+        Tell if some debuggable variable path starts with given prefix.
+        Returns None if variables list isn't available.
+        """
+        if self._VariablesTable is None:
+            return None
+        return self._IECPathToIdx.HasPrefix(IECPathPrefix.upper())
+
+    def GetDebugVariablesFilter(self):
+        """
+        Return specification of variables to include in embedded debug table,
+        empty if all variables are to be debugged.
+        """
+        if not self.IsEmbeddedPlatform():
+            return ""
+        platform = self.GetTarget().getcontent().getPlatform().getcontent()
+        scope = platform.getDebug_Scope()
+        patterns = re.split(r"[,;\s]+", platform.getDebug_Variables().strip())
+        patterns = [p for p in patterns if p]
+        if scope == "All" and not patterns:
+            return ""
+        return "\n".join([scope] + patterns) + "\n"
+
     def Generate_plc_debug_cvars(self):
         """
-        Generate debug C variables out of PLC variable list
+        Generate extern declarations of PLC variables, for generated C code
         """
         if not self._DbgVariablesList and not self._VariablesList:
             self.GetIECProgramsAndVariables()
 
-        type_suffix = {"EXT": "_P_ENUM",
-                       "IN" : "_P_ENUM",
-                       "MEM": "_O_ENUM",
-                       "OUT": "_O_ENUM",
-                       "VAR": "_ENUM"}
-        variable_decl_array  = [
-            f"{{&({v['C_path']}), {v['type']}{type_suffix[v['vartype']]}}}"
-            for v in self._DbgVariablesList
-        ]
-
-        # unique list of types
-        enum_types = [*{*[f"{v['type']}{type_suffix[v['vartype']]}"
-                          for v in self._DbgVariablesList]}]
-
         types = {"EXT": ("extern __IEC_", "_p"),
                  "IN":  ("extern __IEC_", "_p"),
                  "MEM": ("extern __IEC_", "_p"),
@@ -1076,26 +1196,164 @@ class ProjectController(ConfigTreeNode, PLCControler):
             for v in self._VariablesList if '.' not in v['C_path']
         ]
 
-        return variable_decl_array, extern_variables_declarations, enum_types
+        return extern_variables_declarations
 
     def generate_embed_plc_debugger(self, buildpath):
-        dvars, externs, enums = self.Generate_plc_debug_cvars()
+        externs = self.Generate_plc_debug_cvars()
 
         base_folder = paths.AbsDir(__file__)
         loader = FileSystemLoader(
             os.path.join(base_folder, 'platformio', 'templates'))
         template = Environment(loader=loader).get_template('debug.c.j2')
 
+        # where value and force flag are, see debug.c.j2
+        kinds = {"EXT": "DEBUG_POINTER",
+                 "IN":  "DEBUG_POINTER",
+                 "MEM": "DEBUG_OUTPUT",
+                 "OUT": "DEBUG_OUTPUT",
+                 "VAR": "DEBUG_VALUE"}
+        dvars = [{'C_path': v['C_path'],
+                  'type': v['type'],
+                  'kind': kinds[v['vartype']]} for v in self._DbgVariablesList]
+
+        # each debug_vars[] entry is a pointer and 4 bytes of offsets,
+        # code reading the table isn't counted
+        total = sum(1 for v in self._VariablesList if v["vartype"] != "FB")
+        self.logger.write(
+            _("Debug table: {a1} of {a2} variables, {a3} bytes of flash for table\n").format(
+                a1=len(dvars), a2=total, a3=len(dvars) * 8))
+
         cfile = os.path.join(buildpath, 'debug.c')
-        with open(cfile, 'w') as f:
-            f.write(template.render(
-                debug={
-                    'externs': externs,
-                    'vars': dvars,
-                    'enums': enums,
-                    'types': list(set(a.split("_",1)[0] for a in enums))
-                })
-            )
+        WriteIfChanged(cfile, template.render(
+            debug={
+                'externs': externs,
+                'vars': dvars,
+            }))
+
+        return cfile, ''
+
+    def GetResourceTasks(self):
+        """
+        Return resource tasks with their programs, highest priority first,
+        None if some task can't be run at its own interval
+        """
+        if not self.GetIECProgramsAndVariables():
+            return None
+        programs = {p["C_path"]: p for p in self._ProgramList}
+
+        tasks = []
+        for config in self.GetProject(True).getconfigurations():
+            for resource in config.getresource():
+                resource_tasks = []
+                for task in resource.gettask():
+                    if task.getsingle():
+                        self.logger.write(
+                            _("Task {a1} is triggered by {a2}, running all tasks at common tick\n").format(
+                                a1=task.getname(), a2=task.getsingle()))
+                        return None
+                    interval = gettime(task.getinterval() or "")
+                    if interval is None or interval.total_seconds() < 1e-6:
+                        self.logger.write(
+                            _("Task {a1} has no interval, running all tasks at common tick\n").format(
+                                a1=task.getname()))
+                        return None
+                    resource_tasks.append(
+                        (task.getname(), task.getpriority(),
+                         round(interval.total_seconds() * 1000000),
+                         task.getpouInstance()))
+                # programs without task run at every tick, after others
+                if resource.getpouInstance():
+                    resource_tasks.append(
+                        (resource.getname(), None, self._Ticktime // 1000,
+                         resource.getpouInstance()))
+
+                prefix = resource.getname().upper() + "__"
+                for name, priority, period, instances in resource_tasks:
+                    if period <= 0:
+                        return None
+                    task_programs = [
+                        programs.pop(prefix + instance.getname().upper(), None)
+                        for instance in instances]
+                    if None in task_programs:
+                        return None
+                    if task_programs:
+                        tasks.append({
+                            "name": name,
+                            "priority": priority,
+                            "period": period,
+                            "programs": task_programs})
+
+        # every program must be run by a task
+        if not tasks or programs:
+            return None
+
+        # IEC 61131-3 : 0 is highest priority, then shortest period first
+        return sorted(tasks, key=lambda t: (
+            t["priority"] is None, t["priority"] or 0, t["period"]))
+
+    def generate_embed_plc_schedule(self, buildpath):
+        tasks = self.GetResourceTasks()
+        if tasks is None:
+            return None
+
+        loader = FileSystemLoader(
+            os.path.join(paths.AbsDir(__file__), 'platformio', 'templates'))
+        template = Environment(loader=loader).get_template('schedule.c.j2')
+
+        self.logger.write(_("Tasks scheduled at their own interval: {a1}\n").format(
+            a1=", ".join("%s (%gms)" % (t["name"], t["period"] / 1000.) for t in tasks)))
+
+        cfile = os.path.join(buildpath, 'schedule.c')
+        WriteIfChanged(cfile, template.render(tasks=tasks))
+
+        return cfile, ''
+
+    def generate_embed_plc_retain(self, buildpath):
+        """
+        Write retained variables table and image layout, None if no
+        variable is retained
+        """
+        layout_path = os.path.join(buildpath, RETAIN_LAYOUT)
+        if not self.GetIECProgramsAndVariables():
+            return None
+
+        layout, skipped = RetainLayout(self._VariablesList)
+        for path in skipped:
+            self.logger.write_warning(
+                _("Retain: type of {a1} can't be retained\n").format(a1=path))
+        if not layout:
+            if os.path.isfile(layout_path):
+                os.remove(layout_path)
+            return None
+
+        externs = self.Generate_plc_debug_cvars()
+        # located and external variables point to their value
+        retain_vars = [{
+            'IEC_path': v.IEC_path,
+            'ptr': f"&({v.C_path}.value)" if v.vartype == "VAR" else f"&({v.C_path})",
+            'indirect': int(v.vartype != "VAR"),
+            'offset': v.offset,
+            'size': v.size} for v in layout]
+
+        loader = FileSystemLoader(
+            os.path.join(paths.AbsDir(__file__), 'platformio', 'templates'))
+        template = Environment(loader=loader).get_template('retain.c.j2')
+
+        size = ImageSize(layout)
+        self.logger.write(
+            _("Retain: {a1} variables, {a2} bytes image\n").format(
+                a1=len(layout), a2=size))
+
+        cfile = os.path.join(buildpath, 'retain.c')
+        WriteIfChanged(cfile, template.render(
+            retain={
+                'externs': externs,
+                'vars': retain_vars,
+                'sizes': sorted({(v.type, v.size) for v in layout}),
+                'size': size,
+                'hash': LayoutHash(layout),
+            }))
+        WriteIfChanged(layout_path, WriteLayout(layout))
 
         return cfile, ''
 
@@ -1106,7 +1364,17 @@ class ProjectController(ConfigTreeNode, PLCControler):
         self.GetIECProgramsAndVariables()
 
         # prepare debug code
-        variable_decl_array, extern_variables_declarations, _ = self.Generate_plc_debug_cvars()
+        extern_variables_declarations = self.Generate_plc_debug_cvars()
+
+        type_suffix = {"EXT": "_P_ENUM",
+                       "IN" : "_P_ENUM",
+                       "MEM": "_O_ENUM",
+                       "OUT": "_O_ENUM",
+                       "VAR": "_ENUM"}
+        variable_decl_array  = [
+            f"{{&({v['C_path']}), {v['type']}{type_suffix[v['vartype']]}}}"
+            for v in self._DbgVariablesList
+        ]
 
         retain_indexes = []
         for i, v in enumerate(self._DbgVariablesList):
@@ -1172,6 +1440,29 @@ class ProjectController(ConfigTreeNode, PLCControler):
         """
         Method called by user to (re)build SoftPLC and confnode tree
         """
+        if not self.ProfileBuild:
+            return self._BuildStages()
+
+        profiler = StartProfiling()
+        try:
+            with ProfileStage("Build"):
+                return self._BuildStages()
+        finally:
+            StopProfiling()
+            self._WriteBuildProfile(profiler)
+
+    def _WriteBuildProfile(self, profiler):
+        profile_path = os.path.join(self._getBuildPath(), BUILD_PROFILE_FILE)
+        try:
+            profiler.Write(profile_path)
+        except (IOError, OSError) as e:
+            self.logger.write_error(
+                _("Couldn't write build profile : %s\n") % str(e))
+            return
+        self.logger.write(_("Build profile written to %s\n") % profile_path)
+        self.logger.write(profiler.Summary())
+
+    def _BuildStages(self):
         if self.AppFrame is not None:
             self.AppFrame.ClearErrors()
         self._CloseView(self._IECCodeView)
@@ -1185,6 +1476,9 @@ class ProjectController(ConfigTreeNode, PLCControler):
         self.logger.flush()
         self.logger.write(_("Start build in %s\n") % buildpath)
 
+        # Stages inputs and outputs, kept from previous builds
+        self.BuildGraph = BuildGraph(buildpath)
+
         # Generate SoftPLC IEC code
         IECGenRes = self._Generate_SoftPLC()
         self.UpdateButtons()
@@ -1198,10 +1492,15 @@ class ProjectController(ConfigTreeNode, PLCControler):
         # CSV file generated by IEC2C compiler.
         self.ResetIECProgramsAndVariables()
 
+        # Debug indexes depend on this filter, both in IDE and target
+        WriteIfChanged(self._getDebugFilterPath(),
+                       self.GetDebugVariablesFilter())
+
         # Collect platform specific C code
         # Code and other files from extension
-        if not self._Generate_runtime():
-            return False
+        with ProfileStage("Generate C"):
+            if not self._Generate_runtime():
+                return False
 
         # Get current or fresh builder
         builder = self.GetBuilder()
@@ -1211,7 +1510,9 @@ class ProjectController(ConfigTreeNode, PLCControler):
 
         # Build
         try:
-            if not builder.build():
+            with ProfileStage("C build"):
+                result = builder.build()
+            if not result:
                 self.logger.write_error(_("C Build failed.\n"))
                 return False
         except Exception:
@@ -1220,21 +1521,153 @@ class ProjectController(ConfigTreeNode, PLCControler):
             self.logger.write_error(traceback.format_exc())
             return False
 
+        if self.BuildGraph.skipped:
+            self.logger.write(_("Skipped unchanged build stages: %s\n") %
+                              ", ".join(self.BuildGraph.skipped))
         self.logger.write(_("Successfully built.\n"))
         # Update GUI status about need for transfer
         self.CompareLocalAndRemotePLC()
         return True
 
-    def _Generate_runtime(self):
+    def _getBoardBuildPath(self, board):
+        return os.path.join(self._getBuildPath(), "boards", targets.GetBoardEnv(board))
+
+    def _SelectBoard(self, board):
+        """
+        Change embedded board of target, without notifying project change,
+        None for no board
+        """
+        platform = self.GetTarget().getcontent().getPlatform().getcontent()
+        platform.getBoard().setcontent(
+            self.Parser.CreateElement(board, "Board") if board is not None else None)
+        for child in self.IterChildren():
+            if hasattr(child, "CTNSelectBoard"):
+                child.CTNSelectBoard(board)
+
+    def _BuildMatrix(self, boards=None):
+        """
+        Build same PLC program for several embedded boards.
+        IEC code is generated and compiled to C once, then each board gets
+        its own build directory and PlatformIO runs for all boards at once.
+        Return dict of board binary path and MD5, None if build failed.
+        """
+        if not self.IsEmbeddedPlatform():
+            self.logger.write_error(_("Build matrix needs an embedded platform.\n"))
+            return None
+
+        platform = self.GetTarget().getcontent().getPlatform().getcontent()
+        current_board = platform.getBoard().getcontent()
+        current_board = current_board.getLocalTag() if current_board is not None else None
+
+        if boards is None:
+            boards = self._AskMatrixBoards(current_board)
+            if not boards:
+                return None
+        unknown = [board for board in boards if targets.GetBoardName(board) is None]
+        if unknown:
+            self.logger.write_error(_("Unknown boards: %s\n") % ", ".join(unknown))
+            return None
+        boards = [targets.GetBoardName(board) for board in boards]
+
+        if self.AppFrame is not None:
+            self.AppFrame.ClearErrors()
+        self._CloseView(self._IECCodeView)
+
         buildpath = self._getBuildPath()
+        if not os.path.exists(buildpath):
+            os.mkdir(buildpath)
+
+        self.logger.flush()
+        self.logger.write(_("Start build matrix in %s\n") % buildpath)
+
+        # Shared part, IEC code to C
+        self.BuildGraph = BuildGraph(buildpath)
+        IECGenRes = self._Generate_SoftPLC()
+        self.UpdateButtons()
+        if not IECGenRes:
+            self.logger.write_error(_("PLC code generation failed !\n"))
+            return None
+
+        self.ResetIECProgramsAndVariables()
+        WriteIfChanged(self._getDebugFilterPath(),
+                       self.GetDebugVariablesFilter())
+        main_graph = self.BuildGraph
+
+        # Board specific C code, generated one board after the other,
+        # then PlatformIO builds run in parallel
+        targetclass = targets.GetBuilder(
+            self.GetTarget().getcontent().getLocalTag())
+        jobs = []
+        try:
+            for board in boards:
+                self.logger.write(_("Generating C code for %s\n") % board)
+                boardpath = self._getBoardBuildPath(board)
+                os.makedirs(boardpath, exist_ok=True)
+                self._SelectBoard(board)
+                self.BuildGraph = BuildGraph(boardpath)
+                if not self._Generate_runtime(boardpath):
+                    return None
+                builder = targetclass(self)
+                builder.SetBuildPath(boardpath)
+                builder.include_path = buildpath
+                job = builder.PrepareBuild()
+                if job is None:
+                    return None
+                jobs.append((board, builder, job))
+        finally:
+            self.BuildGraph = main_graph
+            self._SelectBoard(current_board)
+
+        processes = [
+            None if builder.IsUpToDate(job)
+            else builder.StartBuild(job, quiet=True)
+            for board, builder, job in jobs]
+
+        results = {}
+        for (board, builder, job), process in zip(jobs, processes):
+            if process is not None:
+                if not builder.FinishBuild(job, process):
+                    self.logger.write_error(
+                        _("C Build failed for %s :\n") % board)
+                    self.logger.write_warning("".join(process.errdata))
+                    continue
+            results[board] = (builder.GetBinaryPath(), builder.GetBinaryMD5())
+
+        for board, (binpath, md5) in results.items():
+            self.logger.write("%s: %s %s\n" % (board, md5, binpath))
+        if len(results) < len(boards):
+            self.logger.write_error(_("Build matrix failed.\n"))
+            return None
+        self.logger.write(_("Successfully built matrix.\n"))
+        return results
+
+    def _AskMatrixBoards(self, current_board):
+        if self.AppFrame is None:
+            return [current_board] if current_board else []
+        choices = targets.GetBoards()
+        dialog = wx.MultiChoiceDialog(
+            self.AppFrame, _("Select boards to build"), _("Build matrix"),
+            choices)
+        if current_board in choices:
+            dialog.SetSelections([choices.index(current_board)])
+        boards = None
+        if dialog.ShowModal() == wx.ID_OK:
+            boards = [choices[i] for i in dialog.GetSelections()]
+        dialog.Destroy()
+        return boards
+
+    def _Generate_runtime(self, buildpath=None):
+        if buildpath is None:
+            buildpath = self._getBuildPath()
 
         # CTN code gen is expected AFTER Libraries code gen,
         # at least SVGHMI relies on it.
 
         # Generate C code and compilation params from liraries
         try:
-            LibCFilesAndCFLAGS, LibLDFLAGS, LibExtraFiles = self.GetLibrariesCCode(
-                buildpath)
+            with ProfileStage("Libraries", "confnode"):
+                LibCFilesAndCFLAGS, LibLDFLAGS, LibExtraFiles = self.GetLibrariesCCode(
+                    buildpath)
         except UserAddressedException as e:
             self.logger.write_error(e.message)
             return False
@@ -1275,22 +1708,30 @@ class ProjectController(ConfigTreeNode, PLCControler):
         ExtraFiles = CTNExtraFiles + LibExtraFiles
 
         # Get temporary directory path
-        extrafilespath = self._getExtraFilesPath()
-        # Remove old directory
-        if os.path.exists(extrafilespath):
-            shutil.rmtree(extrafilespath)
-        # Recreate directory
-        os.mkdir(extrafilespath)
-        # Then write the files
+        extrafilespath = os.path.join(buildpath, "extra_files")
+        if not os.path.exists(extrafilespath):
+            os.mkdir(extrafilespath)
+        # Then write the files, leaving unchanged ones untouched
+        # so that their mtime doesn't trigger a rebuild
+        extrafiles = []
         for fname, fobject in ExtraFiles:
             fpath = os.path.join(extrafilespath, fname)
-            open(fpath, "wb").write(fobject.read())
+            WriteIfChanged(fpath, fobject.read())
+            extrafiles.append(fpath)
         # Now we can forget ExtraFiles (will close files object)
         del ExtraFiles
 
+        # Remove extra files left by previous build
+        graph = self.BuildGraph
+        if graph is not None:
+            for fpath in graph.Outputs("Extra files"):
+                if fpath not in extrafiles and os.path.isfile(fpath):
+                    os.remove(fpath)
+            graph.Done("Extra files", None, extrafiles)
+
         # Header file for extensions
-        open(os.path.join(buildpath, "beremiz.h"), "w").write(
-            targets.GetHeader())
+        WriteIfChanged(os.path.join(buildpath, "beremiz.h"),
+                       targets.GetHeader())
 
         if self.IsEmbeddedPlatform():
             platform = self.GetTarget().getcontent().getPlatform()
@@ -1299,6 +1740,14 @@ class ProjectController(ConfigTreeNode, PLCControler):
                 self.LocationCFilesAndCFLAGS[0][1].insert(
                     0, self.generate_embed_plc_debugger(buildpath))
 
+            schedule = self.generate_embed_plc_schedule(buildpath)
+            if schedule is not None:
+                self.LocationCFilesAndCFLAGS[0][1].insert(0, schedule)
+
+            retain = self.generate_embed_plc_retain(buildpath)
+            if retain is not None:
+                self.LocationCFilesAndCFLAGS[0][1].insert(0, retain)
+
             self.logger.write(_("C code generated successfully.\n"))
             return True
 
@@ -1318,7 +1767,7 @@ class ProjectController(ConfigTreeNode, PLCControler):
                 if code is None:
                     raise Exception
                 code_path = os.path.join(buildpath, filename)
-                open(code_path, "w").write(code)
+                WriteIfChanged(code_path, code)
                 # Insert this file as first file to be compiled at root
                 # confnode
                 self.LocationCFilesAndCFLAGS[0][1].insert(
@@ -1493,6 +1942,7 @@ class ProjectController(ConfigTreeNode, PLCControler):
     def _UpdateButtons(self):
         self.EnableMethod("_Clean", os.path.exists(self._getBuildPath()))
         self.ShowMethod("_showIECcode", os.path.isfile(self._getIECcodepath()))
+        self.ShowMethod("_BuildMatrix", self.IsEmbeddedPlatform())
         if self.AppFrame is not None and not self.UpdateMethodsFromPLCStatus():
             self.AppFrame.RefreshStatusToolBar()
 
@@ -1512,15 +1962,24 @@ class ProjectController(ConfigTreeNode, PLCControler):
         "_Repair": False,
         "_Disconnect": False,
         "_Port": True,
+        "_ShowPOUProfile": False,
+        "_ShowRetainImage": False,
+        "_ShowTaskStats": False,
     }
 
     MethodsFromStatus = {
         PlcStatus.Started:      {"_Stop": True,
+                                 "_ShowPOUProfile": True,
+                                 "_ShowRetainImage": True,
+                                 "_ShowTaskStats": True,
                                  "_Transfer": True,
                                  "_Connect": False,
                                  "_Port": False,
                                  "_Disconnect": True},
         PlcStatus.Stopped:      {"_Run": True,
+                                 "_ShowPOUProfile": True,
+                                 "_ShowRetainImage": True,
+                                 "_ShowTaskStats": True,
                                  "_Transfer": True,
                                  "_Connect": False,
                                  "_Port": False,
@@ -1550,8 +2009,15 @@ class ProjectController(ConfigTreeNode, PLCControler):
             allmethods = self.DefaultMethods.copy()
             allmethods.update(
                 self.MethodsFromStatus.get(status, {}))
+            if not self.IsPOUProfilingEnabled():
+                allmethods["_ShowPOUProfile"] = False
+            if not self.IsEmbeddedPlatform():
+                allmethods["_ShowRetainImage"] = False
+                allmethods["_ShowTaskStats"] = False
             for method, active in list(allmethods.items()):
                 self.ShowMethod(method, active)
+            if self.previous_plcstate == PlcStatus.Started:
+                self.ClearPLCStats()
             self.previous_plcstate = status
             if self.AppFrame is not None:
                 updated = True
@@ -1565,8 +2031,44 @@ class ProjectController(ConfigTreeNode, PLCControler):
                         _("Connected to URI: %s") % self.BeremizRoot.getURI_location().strip(), 1)
                     self.AppFrame.ConnectionStatusBar.SetStatusText(
                         _(status), 2)
+        if status == PlcStatus.Started:
+            self.UpdatePLCStats()
         return updated
 
+    def UpdatePLCStats(self):
+        """
+        Show scan time statistics of embedded runtime in status bar,
+        and warn about new overruns. Polling stops for this connection
+        once target doesn't answer, e.g. a firmware without statistics.
+        """
+        if not self.IsEmbeddedPlatform() or not self.PLCStatsPolled or \
+           time.time() < self.PLCStatsTime + SCAN_STATS_PERIOD:
+            return
+        self.PLCStatsTime = time.time()
+
+        stats = self._connector.GetPLCStats(False, SCAN_STATS_TIMEOUT)
+        if stats is None:
+            self.PLCStatsPolled = False
+            self.logger.write_warning(
+                _("PLC doesn't answer scan statistics requests, not polling them anymore\n"))
+            return
+        previous = self.PLCStats
+        if previous is not None and stats["overruns"] > previous["overruns"]:
+            self.logger.write_warning(
+                _("PLC scan overrun ({a1} more): {a2}, jitter {a3}\n").format(
+                    a1=stats["overruns"] - previous["overruns"],
+                    a2=FormatScanStats(stats),
+                    a3=FormatJitter(stats["jitter"])))
+        self.PLCStats = stats
+        if self.AppFrame is not None:
+            self.AppFrame.ConnectionStatusBar.SetStatusText(
+                FormatScanStats(stats), 0)
+
+    def ClearPLCStats(self):
+        self.PLCStats = None
+        if self.AppFrame is not None:
+            self.AppFrame.ConnectionStatusBar.SetStatusText('', 0)
+
     def ShowPLCProgress(self, status="", progress=0):
         self.AppFrame.ProgressStatusBar.Show()
         self.AppFrame.ConnectionStatusBar.SetStatusText(
@@ -1592,7 +2094,8 @@ class ProjectController(ConfigTreeNode, PLCControler):
             # self.IECdebug_datas.items()]
             if debug_status == PlcStatus.Started:
                 if len(Traces) > 0:
-                    for debug_tick, debug_buff in Traces:
+                    # embedded runtime appends wall clock time to traces
+                    for debug_tick, debug_buff, *_ in Traces:
                         debug_vars = UnpackDebugBuffer(
                             debug_buff, self.TracedIECTypes)
                         if debug_vars is not None:
@@ -1871,6 +2374,8 @@ class ProjectController(ConfigTreeNode, PLCControler):
 
     def _SetConnector(self, connector, update_status=True):
         self._connector = connector
+        self.ClearPLCStats()
+        self.PLCStatsPolled = True
         if self.AppFrame is not None:
             self.AppFrame.LogViewer.SetLogSource(connector)
         if connector is not None:
@@ -2049,6 +2554,74 @@ class ProjectController(ConfigTreeNode, PLCControler):
         wx.CallAfter(self.UpdateMethodsFromPLCStatus)
         return success
 
+    def GetPOUProfile(self, reset=False):
+        """
+        Return (name, calls, min, avg, max, self avg) of each POU, times in us
+        """
+        try:
+            with open(os.path.join(self._getBuildPath(), POU_PROFILE_NAMES)) as f:
+                names = f.read().split()
+        except IOError:
+            names = []
+        profile = self._connector.GetPOUProfile(reset) \
+            if self._connector is not None else None
+        if profile is None:
+            self.logger.write_error(_("Couldn't get POU profile from target\n"))
+            return None
+        freq, entries = profile
+        return ProfileRows(names, freq, entries)
+
+    def _ShowPOUProfile(self):
+        dialog = POUProfileDialog(self.AppFrame, self)
+        dialog.ShowModal()
+        dialog.Destroy()
+
+    def _ShowRetainImage(self):
+        """
+        Log values of retained variables, as kept by target
+        """
+        try:
+            with open(os.path.join(self._getBuildPath(), RETAIN_LAYOUT)) as f:
+                layout = ReadLayout(f.read())
+        except IOError:
+            self.logger.write_warning(_("No retained variable in PLC\n"))
+            return
+        retain = self._connector.GetRetainImage() \
+            if self._connector is not None else None
+        if retain is None:
+            self.logger.write_error(_("Couldn't get retain image from target\n"))
+            return
+        hashval, records, erases, image = retain
+        if hashval != LayoutHash(layout) or len(image) != ImageSize(layout):
+            self.logger.write_warning(
+                _("Retain image of target doesn't match built PLC\n"))
+            return
+        self.logger.write(
+            _("Retained variables, {a1} records written and {a2} pages erased since boot:\n").format(
+                a1=records, a2=erases))
+        for path, iectype, value in DecodeRetainImage(layout, image):
+            self.logger.write("    %s (%s) = %s\n" % (path, iectype, value))
+
+    def _ShowTaskStats(self):
+        """
+        Log time spent by target in each background task, then clear it
+        """
+        tasks = self._connector.GetTaskStats(True) \
+            if self._connector is not None else None
+        if tasks is None:
+            self.logger.write_error(_("Couldn't get task usage from target\n"))
+            return
+        elapsed, entries = tasks
+        self.logger.write(
+            _("Background tasks over last {a1:.1f} s:\n").format(
+                a1=elapsed / 1000.))
+        for task in entries:
+            line = "    %s\n" % FormatTaskStats(task, elapsed)
+            if task["overruns"]:
+                self.logger.write_warning(line)
+            else:
+                self.logger.write(line)
+
     def _Repair(self):
         dialog = wx.MessageDialog(
             self.AppFrame,
@@ -2074,6 +2647,13 @@ class ProjectController(ConfigTreeNode, PLCControler):
             "method":   "_Clean",
             "enabled":    False,
         },
+        {
+            "bitmap":    "Build",
+            "name":    _("Build matrix"),
+            "tooltip": _("Build project for several boards at once"),
+            "method":   "_BuildMatrix",
+            "shown":      False,
+        },
         {
             "bitmap":    "Run",
             "name":    _("Run"),
@@ -2121,6 +2701,27 @@ class ProjectController(ConfigTreeNode, PLCControler):
             "tooltip": _("Programming Port"),
             "method":   "_Port",
         },
+        {
+            "bitmap":    "Debug",
+            "name":    _("POU profile"),
+            "tooltip": _("Show scan time of each POU measured on target"),
+            "method":   "_ShowPOUProfile",
+            "shown":      False,
+        },
+        {
+            "bitmap":    "ShowVars",
+            "name":    _("Retain image"),
+            "tooltip": _("Show values of retained variables kept by target"),
+            "method":   "_ShowRetainImage",
+            "shown":      False,
+        },
+        {
+            "bitmap":    "TargetType",
+            "name":    _("Task usage"),
+            "tooltip": _("Show time spent by target in background tasks since last shown"),
+            "method":   "_ShowTaskStats",
+            "shown":      False,
+        },
         {
             "bitmap":    "ShowIECcode",
             "name":    _("Show code"),
@@ -334,7 +334,8 @@ class PouInstanceVariablesPanel(wx.Panel):
     def RefreshButtons(self):
         enabled = self.InstanceChoice.GetSelection() != -1
         self.ParentButton.Enable(enabled and self.PouInfos.var_class != ITEM_CONFIGURATION)
-        self.DebugButton.Enable(enabled and self.PouInfos.debug and self.Debug)
+        self.DebugButton.Enable(enabled and self.PouInfos.debug and self.Debug and
+                                self.InstanceHasDebugVariables())
 
         root = self.VariablesList.GetRootItem()
         if root is not None and root.IsOk():
@@ -366,6 +367,13 @@ class PouInstanceVariablesPanel(wx.Panel):
             tagname = ComputePouName(infos.type)
         self.ParentWindow.EditProjectElement(var_class, tagname)
 
+    def InstanceHasDebugVariables(self):
+        # prefix lookup in compiled variables, only available in Beremiz
+        has_debug = getattr(self.Controller, "HasDebugIECVariables", None)
+        if has_debug is None:
+            return True
+        return has_debug(self.InstanceChoice.GetStringSelection()) is not False
+
     def DebugButtonCallback(self, infos):
         if self.InstanceChoice.GetSelection() != -1:
             var_class = infos.var_class
@@ -27,6 +27,8 @@ import datetime
 
 import wx
 
+from util.IECTime import SECOND, MINUTE, HOUR, gettime
+
 # -------------------------------------------------------------------------------
 #                                Helpers
 # -------------------------------------------------------------------------------
@@ -63,41 +65,11 @@ getfloat = gen_get_function(float)
 getstring = gen_get_string("'")
 getwstring = gen_get_string('"')
 
-SECOND = 1000000
-MINUTE = 60 * SECOND
-HOUR = 60 * MINUTE
-DAY = 24 * HOUR
-
-IEC_TIME_MODEL = re.compile(r"(?:(?:T|TIME)#)?(-)?(?:(%(float)s)D_?)?(?:(%(float)s)H_?)?(?:(%(float)s)M(?!S)_?)?(?:(%(float)s)S_?)?(?:(%(float)s)MS)?$" % {"float": r"[0-9]+(?:\.[0-9]+)?"})
 IEC_DATE_MODEL = re.compile(r"(?:(?:D|DATE)#)?([0-9]{4})-([0-9]{2})-([0-9]{2})$")
 IEC_DATETIME_MODEL = re.compile(r"(?:(?:DT|DATE_AND_TIME)#)?([0-9]{4})-([0-9]{2})-([0-9]{2})-([0-9]{2}):([0-9]{2}):([0-9]{2}(?:\.[0-9]+)?)$")
 IEC_TIMEOFDAY_MODEL = re.compile(r"(?:(?:TOD|TIME_OF_DAY)#)?([0-9]{2}):([0-9]{2}):([0-9]{2}(?:\.[0-9]+)?)$")
 
 
-def gettime(v):
-    result = IEC_TIME_MODEL.match(v.upper())
-    if result is not None:
-        negative, days, hours, minutes, seconds, milliseconds = result.groups()
-        microseconds = 0
-        not_null = False
-        for value, factor in [(days, DAY),
-                              (hours, HOUR),
-                              (minutes, MINUTE),
-                              (seconds, SECOND),
-                              (milliseconds, 1000)]:
-            if value is not None:
-                microseconds += float(value) * factor
-                not_null = True
-        if not not_null:
-            return None
-        if negative is not None:
-            microseconds = -microseconds
-        return datetime.timedelta(microseconds=microseconds)
-
-    else:
-        return None
-
-
 def getdate(v):
     result = IEC_DATE_MODEL.match(v.upper())
     if result is not None:
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import wx
+import wx.lib.mixins.listctrl as listmix
+
+
+class POUProfileDialog(wx.Dialog, listmix.ColumnSorterMixin):
+    """
+    Scan time of each POU, as measured on target
+    """
+
+    Columns = [
+        (_("POU"), 200, wx.LIST_FORMAT_LEFT, "%s"),
+        (_("Calls"), 90, wx.LIST_FORMAT_RIGHT, "%d"),
+        (_("Min (us)"), 90, wx.LIST_FORMAT_RIGHT, "%.1f"),
+        (_("Avg (us)"), 90, wx.LIST_FORMAT_RIGHT, "%.1f"),
+        (_("Max (us)"), 90, wx.LIST_FORMAT_RIGHT, "%.1f"),
+        (_("Self avg (us)"), 100, wx.LIST_FORMAT_RIGHT, "%.1f"),
+    ]
+
+    def __init__(self, parent, ctr):
+        self.ctr = ctr
+        wx.Dialog.__init__(self,
+                           name='POUProfileDialog', parent=parent,
+                           title=_('POU profile'),
+                           style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER,
+                           size=(700, 450))
+
+        main_sizer = wx.BoxSizer(wx.VERTICAL)
+
+        self.ProfileList = wx.ListCtrl(self, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        for col, (label, width, fmt, _fmt) in enumerate(self.Columns):
+            self.ProfileList.InsertColumn(col, label, fmt, width)
+        main_sizer.Add(self.ProfileList, 1, border=10, flag=wx.ALL | wx.EXPAND)
+
+        buttons_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        for label, handler in [(_("Refresh"), self.OnRefreshButton),
+                               (_("Reset"), self.OnResetButton),
+                               (_("Close"), self.OnCloseButton)]:
+            button = wx.Button(self, label=label)
+            self.Bind(wx.EVT_BUTTON, handler, button)
+            buttons_sizer.Add(button, border=5, flag=wx.LEFT)
+        main_sizer.Add(buttons_sizer, border=10,
+                       flag=wx.LEFT | wx.RIGHT | wx.BOTTOM | wx.ALIGN_RIGHT)
+
+        self.SetSizer(main_sizer)
+
+        self.itemDataMap = {}
+        listmix.ColumnSorterMixin.__init__(self, len(self.Columns))
+        self.Bind(wx.EVT_CHAR_HOOK, self.OnEscapeKey)
+
+        self.RefreshProfile()
+
+    def GetListCtrl(self):
+        return self.ProfileList
+
+    def RefreshProfile(self, reset=False):
+        rows = self.ctr.GetPOUProfile(reset)
+        self.ProfileList.DeleteAllItems()
+        self.itemDataMap = {}
+        for idx, row in enumerate(rows or []):
+            item = self.ProfileList.InsertItem(idx, row[0])
+            for col, value in enumerate(row[1:], 1):
+                self.ProfileList.SetItem(item, col, self.Columns[col][3] % value)
+            self.ProfileList.SetItemData(item, idx)
+            self.itemDataMap[idx] = row
+        # slowest POUs first
+        self.SortListItems(4, 0)
+
+    def OnRefreshButton(self, event):
+        self.RefreshProfile()
+
+    def OnResetButton(self, event):
+        self.RefreshProfile(True)
+
+    def OnCloseButton(self, event):
+        self.EndModal(wx.ID_OK)
+
+    def OnEscapeKey(self, event):
+        keycode = event.GetKeyCode()
+        if keycode == wx.WXK_ESCAPE:
+            self.EndModal(wx.ID_CANCEL)
+        else:
+            event.Skip()
@@ -52,3 +52,4 @@ from dialogs.BrowseValuesLibraryDialog import BrowseValuesLibraryDialog
 from dialogs.UriEditor import UriEditor
 from dialogs.IDManager import IDManager
 from dialogs.MessageBoxOnce import MessageBoxOnce
+from dialogs.POUProfileDialog import POUProfileDialog
@@ -19,6 +19,7 @@
 
 from configparser import ConfigParser
 import os
+import re
 import sys
 
 from jinja2 import Environment, FileSystemLoader
@@ -26,9 +27,52 @@ from pubsub import pub
 
 from PLCControler import LOCATION_CONFNODE, LOCATION_VAR_INPUT, LOCATION_VAR_OUTPUT
 import util.paths as paths
+from util.BuildGraph import WriteIfChanged
+from util.ModbusPlanner import BIT_FUNCTIONS, LocationItem, MapItems, PlanRequests
+
+# STM32 style pin names, port letter and bit
+PORT_PIN = re.compile(r'^P([A-K])(\d{1,2})$')
+
+
+def group_by_port(pins):
+    """
+    Group pins by GPIO port, as list of dict with port name, (index, bit)
+    of each pin and mask of port bits, None if a pin isn't a port pin
+    """
+    ports = {}
+    for idx, pin in enumerate(pins):
+        m = PORT_PIN.match(pin)
+        if m is None or int(m.group(2)) > 15:
+            return None
+        port = ports.setdefault(m.group(1), {
+            'name': m.group(1), 'pins': [], 'mask': 0})
+        port['pins'].append((idx, int(m.group(2))))
+        port['mask'] |= 1 << int(m.group(2))
+
+    for port in ports.values():
+        port['mask'] = f"0x{port['mask']:04x}"
+
+    return sorted(ports.values(), key=lambda p: p['name'])
 
 
 class Modbus():
+    """
+    Modbus RTU master, located variables are remote items, e.g.
+    %IW0.1.<slave>.<register>. See util/ModbusPlanner.py for mapping.
+    """
+    XSD = """<?xml version="1.0" encoding="ISO-8859-1" ?>
+    <xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+      <xsd:element name="ModbusMaster">
+        <xsd:complexType>
+          <xsd:attribute name="UART" type="xsd:string" use="optional" default="USART2"/>
+          <xsd:attribute name="Baudrate" type="xsd:integer" use="optional" default="19200"/>
+          <xsd:attribute name="Poll_Period" type="xsd:integer" use="optional" default="100"/>
+          <xsd:attribute name="Timeout" type="xsd:integer" use="optional" default="100"/>
+          <xsd:attribute name="Max_Gap" type="xsd:integer" use="optional" default="4"/>
+        </xsd:complexType>
+      </xsd:element>
+    </xsd:schema>
+    """
     PlugType = "Modbus"
     CTNMaxCount = 1
 
@@ -40,7 +84,68 @@ class Modbus():
         return self.CTNName()
 
     def CTNGenerate_C(self, buildpath, locations):
-        return [], '', False
+        if self.CTNParent.skip:
+            return [], '', False
+
+        # remove location duplicates
+        loc = [dict(t) for t in {tuple(d.items()) for d in locations}]
+
+        items = {}
+        for l in loc:
+            msg = (f"{l['NAME'].replace('__', '%').replace('_', '.')} "
+                   f"is not a valid Modbus location for {self.CTNName()}\n")
+
+            item = None
+            if len(l['LOC']) == 4:
+                item = LocationItem(l['DIR'], l['SIZE'], *l['LOC'][2:])
+            if item is None:
+                self.CTNParent.generate_exception('LocationError', msg)
+
+            items[l['NAME']] = item
+
+        if not items:
+            return [], '', False
+
+        params = self.ModbusMaster
+        plan = PlanRequests(items.values(), max(params.getMax_Gap(), 0))
+        mapping = MapItems(plan, items.values())
+
+        # each request owns a slice of bits or words buffer
+        mb = {'bits_size': 0, 'words_size': 0, 'requests': [],
+              'located_vars': ''}
+        offsets = []
+        for req in plan:
+            x = 'bits' if req.function in BIT_FUNCTIONS else 'words'
+            offsets.append((x, mb[f'{x}_size']))
+            mb['requests'].append(dict(req._asdict(),
+                                       data=f"mb_{x}[{mb[f'{x}_size']}]"))
+            mb[f'{x}_size'] += req.count
+
+        for name, item in sorted(items.items()):
+            idx, offset = mapping[item]
+            x, base = offsets[idx]
+            mb['located_vars'] += (
+                f"const {'uint8_t' if x == 'bits' else 'uint16_t'} "
+                f"*{name} = &mb_{x}[{base + offset}];\n")
+
+        mb.update({'uart': params.getUART(),
+                   'baudrate': params.getBaudrate(),
+                   'period': params.getPoll_Period(),
+                   'timeout': params.getTimeout()})
+
+        self.GetCTRoot().logger.write(
+            f"Modbus: {len(items)} variables polled with "
+            f"{len(plan)} requests.\n")
+
+        base_folder = paths.AbsParentDir(__file__)
+        loader = FileSystemLoader(
+            os.path.join(base_folder, 'platformio', 'templates'))
+        template = Environment(loader=loader).get_template('modbus_table.cpp.j2')
+
+        cfile = os.path.join(buildpath, 'modbus_table.cpp')
+        WriteIfChanged(cfile, template.render(mb=mb))
+
+        return [(cfile, '')], '', False
 
 
 class IO():
@@ -81,10 +186,18 @@ class IO():
 
             locals()[x].update({l['NAME']: src[idx]})
 
-        hw = {'located_vars': ''}
+        hw = {'located_vars': '', 'port_io': 1}
         for x in ('ain', 'aout', 'din', 'dout'):
             sorted_used = dict(sorted(locals()[x].items()))
             used = list(sorted_used.values())
+
+            if x in ('din', 'dout'):
+                # only used pins, in _din/_dout order
+                ports = group_by_port(used)
+                if ports is None:
+                    hw['port_io'] = 0
+                hw[f'{x}_ports'] = ports or []
+
             unused = [a for a in getattr(self.CTNParent, x) if a not in used]
 
             hw[f'{x}_size'] = len(used)
@@ -105,8 +218,7 @@ class IO():
         template = Environment(loader=loader).get_template('hw.cpp.j2')
 
         cfile = os.path.join(buildpath, 'hw.cpp')
-        with open(cfile, 'w') as f:
-            f.write(template.render(hw=hw))
+        WriteIfChanged(cfile, template.render(hw=hw))
 
         return [(cfile, '')], '', False
 
@@ -196,6 +308,13 @@ class Root():
                 v = config.getlist(board, a, fallback=[])
                 setattr(self, a, v)
 
+    def CTNSelectBoard(self, name):
+        # board pins used by IO, for build matrix
+        if name is None:
+            self.ain, self.aout, self.din, self.dout = [], [], [], []
+        else:
+            self.load_config(name)
+
     def GetCurrentNodeName(self):
         return self.CTNName()
 
@@ -237,13 +356,12 @@ class Root():
         loc = [dict(t) for t in {tuple(d.items()) for d in locations}]
 
         c_text = '#include "iec_types.h"\n\n'
-        for l in loc:
+        for l in sorted(loc, key=lambda l: l['NAME']):
             c_text += f"static IEC_{l['IEC_TYPE']} var{l['NAME']};\n"
             c_text += f"const IEC_{l['IEC_TYPE']} *{l['NAME']} = &var{l['NAME']};\n"
 
         cfile = os.path.join(buildpath, 'located.c')
-        with open(cfile, 'w') as f:
-            f.write(c_text)
+        WriteIfChanged(cfile, c_text)
 
         return [(cfile, '')], '', False
 
@@ -0,0 +1,140 @@
+/*
+ * This file is part of Beremiz for uC
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; If not, see <http://www.gnu.org/licenses/>.
+ *
+ */
+
+/*
+ * Ring buffer of log messages, from LOGGER blocks and runtime errors,
+ * drained by host through MIN_PLC_GET_LOG. Only whole records are stored,
+ * a message that doesn't fit is dropped and counted. Written and read
+ * from loop() only, so no locking.
+ */
+
+#include <Arduino.h>
+#include <stdarg.h>
+#include <stdio.h>
+#include <string.h>
+
+#include "logbuf.h"
+
+#if LOG_BUFFER_SIZE > 0xffff
+#error LOG_BUFFER_SIZE too large
+#endif
+
+extern unsigned long tick;
+
+static struct {
+    uint8_t buf[LOG_BUFFER_SIZE];
+    uint16_t head;
+    uint16_t tail;
+    uint16_t used;
+    uint32_t dropped;
+} logbuf;
+
+static void put(const void *data, size_t len)
+{
+    const uint8_t *p = (const uint8_t *)data;
+
+    for (size_t i = 0; i < len; i++) {
+        logbuf.buf[logbuf.head] = p[i];
+        logbuf.head = (logbuf.head + 1) % LOG_BUFFER_SIZE;
+    }
+    logbuf.used += len;
+}
+
+static uint8_t peek(size_t offset)
+{
+    return logbuf.buf[(logbuf.tail + offset) % LOG_BUFFER_SIZE];
+}
+
+/* same prototype as in beremiz.h, used by LOGGER block */
+int LogMessage(uint8_t level, char *buf, uint32_t size)
+{
+    uint8_t len = size < LOG_MSG_SIZE ? size : LOG_MSG_SIZE;
+    uint32_t t = tick;
+    uint32_t ms = millis();
+
+    /* strings of LOGGER are sent with their terminating null */
+    while (len && buf[len - 1] == '\0')
+        len--;
+
+    if (level > LOG_DEBUG ||
+        LOG_RECORD_SIZE + len > LOG_BUFFER_SIZE - logbuf.used) {
+        logbuf.dropped++;
+        return 0;
+    }
+
+    put(&level, 1);
+    put(&len, 1);
+    put(&t, 4);
+    put(&ms, 4);
+    put(buf, len);
+
+    return 1;
+}
+
+void plc_log(uint8_t level, const char *fmt, ...)
+{
+    char msg[LOG_MSG_SIZE];
+    va_list args;
+    int len;
+
+    va_start(args, fmt);
+    len = vsnprintf(msg, sizeof(msg), fmt, args);
+    va_end(args);
+
+    if (len >= 0)
+        LogMessage(level, msg, len < (int)sizeof(msg) ? len : sizeof(msg) - 1);
+}
+
+/*
+ * Copy as many whole records as fit in size to buf, returns bytes copied.
+ * Records stay in buffer until log_consume() is called once they are sent.
+ */
+size_t log_read(uint8_t *buf, size_t size)
+{
+    size_t len = 0;
+
+    while (len < logbuf.used) {
+        size_t record = LOG_RECORD_SIZE + peek(len + 1);
+
+        if (len + record > size)
+            break;
+
+        for (size_t i = 0; i < record; i++, len++)
+            buf[len] = peek(len);
+    }
+
+    return len;
+}
+
+/* forget records read, len being what log_read() returned */
+void log_consume(size_t len)
+{
+    logbuf.tail = (logbuf.tail + len) % LOG_BUFFER_SIZE;
+    logbuf.used -= len;
+}
+
+uint32_t log_dropped(void)
+{
+    return logbuf.dropped;
+}
+
+/* bytes of records not consumed yet */
+size_t log_pending(void)
+{
+    return logbuf.used;
+}
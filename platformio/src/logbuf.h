@@ -0,0 +1,43 @@
+#ifndef LOGBUF_H
+#define LOGBUF_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+/* bytes of ring buffer, records are LOG_RECORD_SIZE + message length */
+#ifndef LOG_BUFFER_SIZE
+#define LOG_BUFFER_SIZE         512
+#endif
+
+/* longer messages are truncated */
+#ifndef LOG_MSG_SIZE
+#define LOG_MSG_SIZE            96
+#endif
+
+/* level, message length (uint8), tick, millis() (uint32) */
+#define LOG_RECORD_SIZE         10
+
+#ifndef LOG_CRITICAL
+#define LOG_CRITICAL            0
+#define LOG_WARNING             1
+#define LOG_INFO                2
+#define LOG_DEBUG               3
+#endif
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+int LogMessage(uint8_t level, char *buf, uint32_t size);
+void plc_log(uint8_t level, const char *fmt, ...);
+
+size_t log_read(uint8_t *buf, size_t size);
+void log_consume(size_t len);
+uint32_t log_dropped(void);
+size_t log_pending(void);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
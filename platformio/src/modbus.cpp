@@ -0,0 +1,152 @@
+/*
+ * This file is part of Beremiz for uC
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; If not, see <http://www.gnu.org/licenses/>.
+ *
+ */
+
+#include <Arduino.h>
+
+#include "async.h"
+#include "logbuf.h"
+#include "modbus.h"
+
+extern "C" {
+    struct modbus_master *__no_master(void) { return 0; }
+    struct modbus_master *modbus_master(void)
+        __attribute__((weak, alias("__no_master")));
+}
+
+static struct modbus_state {
+    async_state;
+    struct modbus_master *master;
+    uint8_t buf[MODBUS_FRAME_SIZE];
+    size_t len;
+    size_t sent;
+    uint8_t idx;
+    unsigned long start;
+    unsigned long cycle;
+    int run;
+} mbs;
+
+/* send frame in buf as the port accepts it, true once done */
+static bool modbus_send(struct modbus_state *pt)
+{
+    HardwareSerial *port = pt->master->port;
+    int space = port->availableForWrite();
+
+    while (space-- > 0 && pt->sent < pt->len)
+        port->write(pt->buf[pt->sent++]);
+
+    return pt->sent == pt->len;
+}
+
+/* gather reply to current request, true once complete or timed out */
+static bool modbus_receive(struct modbus_state *pt, unsigned long dt)
+{
+    HardwareSerial *port = pt->master->port;
+    struct modbus_request *req = &pt->master->requests[pt->idx];
+    size_t size;
+
+    while (port->available() > 0 && pt->len < MODBUS_FRAME_SIZE)
+        pt->buf[pt->len++] = port->read();
+
+    size = modbus_reply_size(req, pt->buf, pt->len);
+    if (size && pt->len >= size)
+        return true;
+
+    return dt - pt->start > pt->master->timeout;
+}
+
+/*
+ * Poll all requests in turn, then wait for next period. Only one request
+ * is pending at a time, each call does what can be done without waiting.
+ */
+static async modbus_poll_task(unsigned long dt, struct modbus_state *pt)
+{
+    struct modbus_request *req;
+    int status;
+
+    async_begin(pt);
+
+    while (1) {
+        pt->cycle = dt;
+
+        for (pt->idx = 0; pt->idx < pt->master->count; pt->idx++) {
+            req = &pt->master->requests[pt->idx];
+
+            /* outputs are only written while PLC runs, as local ones */
+            if (!pt->run && (req->function == MODBUS_WRITE_COILS ||
+                             req->function == MODBUS_WRITE_REGISTERS))
+                continue;
+
+            /* drop late replies to previous request */
+            while (pt->master->port->available() > 0)
+                pt->master->port->read();
+
+            pt->start = dt;
+            await(dt - pt->start >= MODBUS_GAP_MS);
+
+            /* locals don't survive await */
+            req = &pt->master->requests[pt->idx];
+            pt->len = modbus_frame(req, pt->buf);
+            pt->sent = 0;
+            await(modbus_send(pt));
+
+            pt->start = dt;
+            pt->len = 0;
+            await(modbus_receive(pt, dt));
+
+            req = &pt->master->requests[pt->idx];
+            status = pt->len ? modbus_parse(req, pt->buf, pt->len)
+                             : MODBUS_ERR_TIMEOUT;
+            if (status)
+                req->errors++;
+
+            /* log changes only, a missing slave would flood the log */
+            if (status != req->status) {
+                if (status)
+                    plc_log(LOG_WARNING, "Modbus slave %u function %u at %u "
+                            "failed (%d)", req->slave, req->function,
+                            req->start, status);
+                else
+                    plc_log(LOG_INFO, "Modbus slave %u function %u at %u "
+                            "recovered", req->slave, req->function,
+                            req->start);
+            }
+            req->status = status;
+        }
+
+        await(dt - pt->cycle >= pt->master->period);
+    }
+
+    async_end;
+}
+
+void modbus_init(void)
+{
+    mbs.master = modbus_master();
+    if (!mbs.master || !mbs.master->count)
+        return;
+
+    mbs.master->port->begin(mbs.master->baudrate);
+    async_init(&mbs);
+}
+
+void modbus_task(unsigned long dt, int run)
+{
+    mbs.run = run;
+    if (mbs.master && mbs.master->count)
+        modbus_poll_task(dt, &mbs);
+}
@@ -0,0 +1,70 @@
+#ifndef modbus_h
+#define modbus_h
+
+#include <stddef.h>
+#include <stdint.h>
+
+/* RTU frame: slave, PDU and CRC */
+#define MODBUS_FRAME_SIZE           256
+
+#define MODBUS_READ_COILS           1
+#define MODBUS_READ_DISCRETE        2
+#define MODBUS_READ_HOLDING         3
+#define MODBUS_READ_INPUT           4
+#define MODBUS_WRITE_COILS          15
+#define MODBUS_WRITE_REGISTERS      16
+
+#define MODBUS_ERR_SHORT            -1
+#define MODBUS_ERR_CRC              -2
+#define MODBUS_ERR_REPLY            -3
+#define MODBUS_ERR_TIMEOUT          -4
+
+/* ms of silence before sending a frame, at least 3.5 characters */
+#ifndef MODBUS_GAP_MS
+#define MODBUS_GAP_MS               2
+#endif
+
+/*
+ * Block of coils or registers of a slave, planned at build time by
+ * util/ModbusPlanner.py. data is an uint8_t per coil or an uint16_t per
+ * register, read into or written from by the PLC through located variables.
+ */
+struct modbus_request {
+    uint8_t slave;
+    uint8_t function;
+    uint16_t start;
+    uint16_t count;
+    void *data;
+    uint16_t errors;
+    int8_t status;                  /* of last exchange, 0 if ok */
+};
+
+#ifdef __cplusplus
+#include <HardwareSerial.h>
+
+struct modbus_master {
+    HardwareSerial *port;
+    uint32_t baudrate;
+    uint16_t period;                /* ms between two polls of all requests */
+    uint16_t timeout;               /* ms to wait for a reply */
+    uint8_t count;
+    struct modbus_request *requests;
+};
+
+extern "C" {
+#endif
+
+/* generated from Modbus node, NULL without it */
+struct modbus_master *modbus_master(void);
+
+uint16_t modbus_crc(const uint8_t *buf, size_t len);
+size_t modbus_frame(const struct modbus_request *req, uint8_t *buf);
+size_t modbus_reply_size(const struct modbus_request *req,
+                         const uint8_t *buf, size_t len);
+int modbus_parse(struct modbus_request *req, const uint8_t *buf, size_t len);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
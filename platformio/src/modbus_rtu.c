@@ -0,0 +1,170 @@
+/*
+ * This file is part of Beremiz for uC
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; If not, see <http://www.gnu.org/licenses/>.
+ *
+ */
+
+/*
+ * Modbus RTU frames of master requests, no hardware access here so that
+ * it can be built on host and tested against a simulated slave.
+ */
+
+#include <stdbool.h>
+
+#include "modbus.h"
+
+static inline uint16_t get_be16(const uint8_t *buf)
+{
+    return (uint16_t)(buf[0] << 8 | buf[1]);
+}
+
+static inline void put_be16(uint8_t *buf, uint16_t val)
+{
+    buf[0] = val >> 8;
+    buf[1] = val & 0xff;
+}
+
+static inline bool is_bits(uint8_t function)
+{
+    return function == MODBUS_READ_COILS ||
+           function == MODBUS_READ_DISCRETE ||
+           function == MODBUS_WRITE_COILS;
+}
+
+uint16_t modbus_crc(const uint8_t *buf, size_t len)
+{
+    uint16_t crc = 0xffff;
+
+    for (size_t i = 0; i < len; i++) {
+        crc ^= buf[i];
+        for (uint8_t b = 0; b < 8; b++)
+            crc = (crc & 1) ? (crc >> 1) ^ 0xa001 : crc >> 1;
+    }
+
+    return crc;
+}
+
+/* request frame of req in buf, returns its length */
+size_t modbus_frame(const struct modbus_request *req, uint8_t *buf)
+{
+    size_t len = 6;
+    uint16_t crc;
+
+    buf[0] = req->slave;
+    buf[1] = req->function;
+    put_be16(buf + 2, req->start);
+    put_be16(buf + 4, req->count);
+
+    if (req->function == MODBUS_WRITE_COILS) {
+        const uint8_t *bits = (const uint8_t *)req->data;
+
+        buf[len++] = (req->count + 7) / 8;
+        for (uint16_t i = 0; i < req->count; i++) {
+            if (i % 8 == 0)
+                buf[len + i / 8] = 0;
+            if (bits[i])
+                buf[len + i / 8] |= 1 << (i % 8);
+        }
+        len += (req->count + 7) / 8;
+
+    } else if (req->function == MODBUS_WRITE_REGISTERS) {
+        const uint16_t *regs = (const uint16_t *)req->data;
+
+        buf[len++] = req->count * 2;
+        for (uint16_t i = 0; i < req->count; i++, len += 2)
+            put_be16(buf + len, regs[i]);
+    }
+
+    crc = modbus_crc(buf, len);
+    buf[len++] = crc & 0xff;
+    buf[len++] = crc >> 8;
+
+    return len;
+}
+
+/* expected length of reply to req, given its first bytes, 0 if unknown yet */
+size_t modbus_reply_size(const struct modbus_request *req,
+                         const uint8_t *buf, size_t len)
+{
+    if (len < 2)
+        return 0;
+
+    if (buf[1] & 0x80)
+        return 5;
+
+    switch (req->function) {
+    case MODBUS_READ_COILS:
+    case MODBUS_READ_DISCRETE:
+        return 5 + (req->count + 7) / 8;
+    case MODBUS_READ_HOLDING:
+    case MODBUS_READ_INPUT:
+        return 5 + req->count * 2;
+    default:
+        return 8;
+    }
+}
+
+/*
+ * Check reply to req and store read values in its data.
+ * Returns 0, a negative MODBUS_ERR_* or the exception code of the slave.
+ */
+int modbus_parse(struct modbus_request *req, const uint8_t *buf, size_t len)
+{
+    size_t size = modbus_reply_size(req, buf, len);
+    uint16_t crc;
+
+    if (size == 0 || len < size)
+        return MODBUS_ERR_SHORT;
+
+    crc = modbus_crc(buf, size - 2);
+    if (buf[size - 2] != (crc & 0xff) || buf[size - 1] != (crc >> 8))
+        return MODBUS_ERR_CRC;
+
+    if (buf[0] != req->slave)
+        return MODBUS_ERR_REPLY;
+
+    if (buf[1] == (req->function | 0x80))
+        return buf[2] ? buf[2] : MODBUS_ERR_REPLY;
+
+    if (buf[1] != req->function)
+        return MODBUS_ERR_REPLY;
+
+    if (req->function == MODBUS_WRITE_COILS ||
+        req->function == MODBUS_WRITE_REGISTERS) {
+
+        if (get_be16(buf + 2) != req->start || get_be16(buf + 4) != req->count)
+            return MODBUS_ERR_REPLY;
+
+    } else if (is_bits(req->function)) {
+        uint8_t *bits = (uint8_t *)req->data;
+
+        if (buf[2] != size - 5)
+            return MODBUS_ERR_REPLY;
+
+        for (uint16_t i = 0; i < req->count; i++)
+            bits[i] = (buf[3 + i / 8] >> (i % 8)) & 1;
+
+    } else {
+        uint16_t *regs = (uint16_t *)req->data;
+
+        if (buf[2] != size - 5)
+            return MODBUS_ERR_REPLY;
+
+        for (uint16_t i = 0; i < req->count; i++)
+            regs[i] = get_be16(buf + 3 + 2 * i);
+    }
+
+    return 0;
+}
@@ -19,25 +19,36 @@
  */
 
 #include <Arduino.h>
+#include <string.h>
 
 #include "hw.h"
+#include "schedule.h"
+#include "stats.h"
 #include "tasks.h"
 
 unsigned long tick = 0;
+unsigned long tick_ms = 0;
 unsigned long scan_cycle;
-unsigned long timer_ms = 0;
+unsigned long timer_us = 0;
 extern unsigned long long common_ticktime__;
 
 extern "C" {
     void update_time();
+    void advance_time(unsigned long us);
     void config_run__(unsigned long tick);
     void config_init__(void);
     void __empty(void) {}
+    void profile_init(void) __attribute__((weak, alias("__empty")));
+
+    struct plc_task *__no_task(uint8_t *count) { *count = 0; return 0; }
+    struct plc_task *plc_task_table(uint8_t *count)
+        __attribute__((weak, alias("__no_task")));
 }
 
 void eth_init()       __attribute__((weak, alias("__empty")));
 void hardware_init()  __attribute__((weak, alias("__empty")));
 void modbus_init()    __attribute__((weak, alias("__empty")));
+void retain_init()    __attribute__((weak, alias("__empty")));
 void serial_init()    __attribute__((weak, alias("__empty")));
 void update_inputs()  __attribute__((weak, alias("__empty")));
 void update_outputs() __attribute__((weak, alias("__empty")));
@@ -49,8 +60,153 @@ static enum {
     PLC_ERR,
 } plc_state;
 
+static const uint32_t jitter_bounds[JITTER_BUCKETS - 1] = {
+    10, 50, 100, 500, 1000, 5000, 10000
+};
+
+static struct {
+    uint32_t count;
+    uint32_t min;
+    uint32_t max;
+    uint64_t total;
+    uint32_t overruns;
+    uint32_t jitter[JITTER_BUCKETS];
+} scan_stats;
+
+/* shortest scan period, us */
+static uint32_t scan_period;
+
+/* scan started late us after due time, and lasted elapsed us */
+static void record_scan(uint32_t late, uint32_t elapsed)
+{
+    uint8_t i = 0;
+
+    while (i < JITTER_BUCKETS - 1 && late >= jitter_bounds[i])
+        i++;
+    scan_stats.jitter[i]++;
+
+    if (scan_stats.count == 0 || elapsed < scan_stats.min)
+        scan_stats.min = elapsed;
+    if (elapsed > scan_stats.max)
+        scan_stats.max = elapsed;
+    scan_stats.count++;
+    scan_stats.total += elapsed;
+}
+
+void scan_stats_read(uint8_t *buf)
+{
+    memcpy(buf, &scan_stats.count, 4);
+    memcpy(buf + 4, &scan_stats.min, 4);
+    memcpy(buf + 8, &scan_stats.max, 4);
+    memcpy(buf + 12, &scan_stats.total, 8);
+    memcpy(buf + 20, &scan_stats.overruns, 4);
+    memcpy(buf + 24, &scan_period, 4);
+    memcpy(buf + 28, scan_stats.jitter, 4 * JITTER_BUCKETS);
+}
+
+void scan_stats_reset(void)
+{
+    memset(&scan_stats, 0, sizeof(scan_stats));
+}
+
+static struct plc_task *plc_tasks;
+static uint8_t plc_task_count;
+static bool plc_tasks_running;
+static uint32_t plc_tasks_time;
+static bool plc_running;
+
+/* first activation of every task is now, e.g. when PLC starts */
+static void reset_tasks(uint32_t now)
+{
+    for (uint8_t i = 0; i < plc_task_count; i++)
+        plc_tasks[i].next = now;
+
+    plc_tasks_time = now;
+}
+
+/*
+ * Run due tasks, highest priority first, higher priority tasks being
+ * checked again after each task. Tasks don't preempt each other, so
+ * activations missed while busy are dropped and counted as overruns.
+ */
+static void run_due_tasks(void)
+{
+    uint32_t start = micros();
+    uint32_t now = start;
+    uint32_t late = 0;
+    bool due = false;
+    uint8_t i;
+
+    for (i = 0; i < plc_task_count; i++) {
+        if ((int32_t)(now - plc_tasks[i].next) >= 0) {
+            if (now - plc_tasks[i].next > late)
+                late = now - plc_tasks[i].next;
+            due = true;
+        }
+    }
+
+    if (!due)
+        return;
+
+    tick_ms = millis();
+    advance_time(now - plc_tasks_time);
+    plc_tasks_time = now;
+    update_inputs();
+
+    for (i = 0; i < plc_task_count; ) {
+        struct plc_task *t = &plc_tasks[i];
+
+        if ((int32_t)(now - t->next) < 0) {
+            i++;
+            continue;
+        }
+
+        t->run();
+        t->next += t->period;
+
+        now = micros();
+        if ((int32_t)(now - t->next) >= 0) {
+            uint32_t missed = (now - t->next) / t->period + 1;
+
+            t->overruns += missed;
+            t->next += missed * t->period;
+            scan_stats.overruns += missed;
+        }
+
+        i = 0;
+    }
+
+    update_outputs();
+    tick++;
+
+    record_scan(late, micros() - start);
+}
+
+/* us left before next scan is due, UINT32_MAX if PLC doesn't run */
+uint32_t plc_idle_time(void)
+{
+    uint32_t now = micros();
+    int32_t left;
+
+    if (!plc_running)
+        return UINT32_MAX;
+
+    if (plc_task_count) {
+        left = plc_tasks[0].next - now;
+        for (uint8_t i = 1; i < plc_task_count; i++)
+            if ((int32_t)(plc_tasks[i].next - now) < left)
+                left = plc_tasks[i].next - now;
+    } else {
+        left = timer_us - now;
+    }
+
+    return left > 0 ? left : 0;
+}
+
 void setup()
 {
+    /* before other init, which can register tasks */
+    tasks_init();
     hardware_init();
 #if DEBUG
     LL_GPIO_AF_Remap_SWJ_NOJTAG();
@@ -65,8 +221,8 @@ void setup()
     if (RUN_SW)
         pinMode(RUN_SW, INPUT);
 
-    scan_cycle = (uint32_t) (common_ticktime__ / 1000000);
-    timer_ms = millis() + scan_cycle;
+    scan_cycle = (uint32_t) (common_ticktime__ / 1000);
+    timer_us = micros() + scan_cycle;
 
     serial_init();
     modbus_init();
@@ -74,6 +230,15 @@ void setup()
     eth_init();
 
     config_init__();
+    retain_init();
+    profile_init();
+
+    plc_tasks = plc_task_table(&plc_task_count);
+
+    scan_period = scan_cycle;
+    for (uint8_t i = 0; i < plc_task_count; i++)
+        if (i == 0 || plc_tasks[i].period < scan_period)
+            scan_period = plc_tasks[i].period;
 
     plc_state = PLC_STOP;
 }
@@ -88,16 +253,38 @@ void loop()
         run = IS_RUN_SW;
     else
         run = (plc_state == PLC_RUN);
+    plc_running = run;
+
+    if (plc_task_count) {
+
+        if (run && !plc_tasks_running)
+            reset_tasks(micros());
+        plc_tasks_running = run;
+
+        if (run)
+            run_due_tasks();
+
+    } else {
+        uint32_t start = micros();
+
+        if ((int32_t)(start - timer_us) >= 0) {
+            uint32_t late = start - timer_us;
+
+            timer_us += scan_cycle;
 
-    if (dt >= timer_ms) {
+            if (run) {
+                tick_ms = dt;
+                update_inputs();
+                config_run__(tick++);
+                update_outputs();
+                update_time();
 
-        timer_ms += scan_cycle;
+                /* late scans are caught up, next one is already due */
+                if ((int32_t)(micros() - timer_us) >= 0)
+                    scan_stats.overruns++;
 
-        if (run) {
-            update_inputs();
-            config_run__(tick++);
-            update_outputs();
-            update_time();
+                record_scan(late, micros() - start);
+            }
         }
     }
 
@@ -0,0 +1,16 @@
+#ifndef PROFILE_H
+#define PROFILE_H
+
+__attribute__((weak))
+uint16_t profile_count(void) {return 0;}
+
+__attribute__((weak))
+uint32_t profile_freq(void) {return 0;}
+
+__attribute__((weak))
+void profile_read(uint16_t, uint8_t *) {}
+
+__attribute__((weak))
+void profile_reset(void) {}
+
+#endif
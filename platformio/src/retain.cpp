@@ -0,0 +1,281 @@
+/*
+ * This file is part of Beremiz for uC
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; If not, see <http://www.gnu.org/licenses/>.
+ *
+ */
+
+/*
+ * Retained variables, packed in an image as laid out in generated
+ * retain.c. Image is restored from flash at boot and after PLC init.
+ * Every RETAIN_PERIOD, changed variables mark their blocks dirty, which
+ * are then saved one flash operation per pass, only when next scan isn't
+ * due before operation is over. See retain_store.c for flash layout.
+ */
+
+#include <Arduino.h>
+#include <string.h>
+
+#include "async.h"
+#include "logbuf.h"
+#include "retain.h"
+
+extern "C" {
+    const struct retain_layout *__no_retain(void) { return 0; }
+    const struct retain_layout *retain_layout(void)
+        __attribute__((weak, alias("__no_retain")));
+}
+
+uint32_t plc_idle_time(void);
+
+#if defined(ARDUINO_ARCH_STM32) && defined(STM32F1xx) && \
+    defined(HAL_FLASH_MODULE_ENABLED)
+
+#ifndef RETAIN_FLASH_ADDR
+#define RETAIN_FLASH_ADDR   (FLASH_BANK1_END + 1 - RETAIN_PAGES * FLASH_PAGE_SIZE)
+#endif
+
+/* end of firmware in flash, from linker script */
+extern "C" char _sidata, _sdata, _edata;
+
+static int flash_erase(uint8_t page)
+{
+    FLASH_EraseInitTypeDef erase;
+    uint32_t error;
+    HAL_StatusTypeDef status;
+
+    memset(&erase, 0, sizeof(erase));
+    erase.TypeErase = FLASH_TYPEERASE_PAGES;
+    erase.PageAddress = RETAIN_FLASH_ADDR + page * FLASH_PAGE_SIZE;
+    erase.NbPages = 1;
+
+    HAL_FLASH_Unlock();
+    status = HAL_FLASHEx_Erase(&erase, &error);
+    HAL_FLASH_Lock();
+
+    return status != HAL_OK;
+}
+
+static int flash_program(uint32_t offset, const uint8_t *data, uint16_t len)
+{
+    HAL_StatusTypeDef status = HAL_OK;
+
+    HAL_FLASH_Unlock();
+    for (uint16_t i = 0; i < len && status == HAL_OK; i += 2)
+        status = HAL_FLASH_Program(FLASH_TYPEPROGRAM_HALFWORD,
+                                   RETAIN_FLASH_ADDR + offset + i,
+                                   data[i] | (uint16_t)data[i + 1] << 8);
+    HAL_FLASH_Lock();
+
+    return status != HAL_OK;
+}
+
+static const struct retain_flash flash = {
+    (const uint8_t *)RETAIN_FLASH_ADDR,
+    FLASH_PAGE_SIZE,
+    RETAIN_PAGES,
+    flash_erase,
+    flash_program,
+};
+
+static bool flash_free(void)
+{
+    return (uint32_t)&_sidata + (&_edata - &_sdata) <= RETAIN_FLASH_ADDR;
+}
+
+#define RETAIN_FLASH    &flash
+
+#else
+
+#define RETAIN_FLASH    0
+
+static bool flash_free(void)
+{
+    return false;
+}
+
+#endif
+
+static const struct retain_layout *layout;
+static struct retain_store store;
+static bool saving;
+
+static struct retain_state {
+    async_state;
+    unsigned long dt;           /* last look for changes */
+    unsigned long since;        /* saving has been pending */
+    int status;
+} rts;
+
+static void *value(const struct retain_var *v)
+{
+    return v->indirect ? *(void **)v->ptr : v->ptr;
+}
+
+/* copy variables to image, marking changed blocks */
+void retain_collect(void)
+{
+    if (!layout)
+        return;
+
+    for (uint16_t i = 0; i < layout->count; i++) {
+        const struct retain_var *v = &layout->vars[i];
+        void *p = value(v);
+
+        if (p)
+            retain_store_update(&store, v->offset, p, v->size);
+    }
+}
+
+/* copy image to variables, e.g. once initialized */
+void retain_restore(void)
+{
+    if (!layout)
+        return;
+
+    for (uint16_t i = 0; i < layout->count; i++) {
+        const struct retain_var *v = &layout->vars[i];
+        void *p = value(v);
+
+        if (p)
+            memcpy(p, layout->image + v->offset, v->size);
+    }
+}
+
+/* variables are initialized, variables never saved keep their value */
+void retain_init(void)
+{
+    int pages;
+
+    layout = retain_layout();
+    if (!layout || !layout->count)
+        return;
+
+    store.flash = RETAIN_FLASH;
+    store.image = layout->image;
+    store.size = layout->size;
+    store.hash = layout->hash;
+    store.dirty = layout->dirty;
+    store.missing = layout->missing;
+
+    retain_collect();
+
+    if (!store.flash) {
+        plc_log(LOG_WARNING, "Retain: no flash storage, values lost at reset");
+        return;
+    }
+
+    if (!flash_free()) {
+        plc_log(LOG_CRITICAL, "Retain: flash pages used by firmware");
+        return;
+    }
+
+    pages = retain_store_load(&store);
+    if (pages < 0) {
+        plc_log(LOG_CRITICAL, "Retain: %u bytes image too large for flash",
+                store.size);
+        return;
+    }
+
+    retain_restore();
+    saving = true;
+    async_init(&rts);
+
+    plc_log(LOG_INFO, "Retain: %u bytes restored from %d pages",
+            store.size, pages);
+}
+
+/*
+ * Page of image, after header. Variables are copied to image before
+ * first page is read, so that it holds their current value.
+ */
+size_t retain_read(uint16_t offset, uint8_t *buf, size_t size)
+{
+    uint16_t len = 0;
+
+    if (offset == 0)
+        retain_collect();
+
+    memcpy(buf, &offset, 2);
+    memcpy(buf + 2, &store.size, 2);
+    memcpy(buf + 4, &store.hash, 4);
+    memcpy(buf + 8, &store.records, 4);
+    memcpy(buf + 12, &store.erases, 4);
+
+    if (layout && offset < store.size) {
+        len = store.size - offset;
+        if (len > size - RETAIN_INFO_SIZE)
+            len = size - RETAIN_INFO_SIZE;
+        memcpy(buf + RETAIN_INFO_SIZE, store.image + offset, len);
+    }
+
+    return RETAIN_INFO_SIZE + len;
+}
+
+/*
+ * Look for changes every RETAIN_PERIOD, then save them one flash
+ * operation per pass. An operation is only done if it's over before
+ * next scan is due, unless saving has been pending for RETAIN_MAX_DELAY.
+ */
+static async retain_save(unsigned long dt, struct retain_state *pt)
+{
+    uint32_t idle;
+    bool overdue;
+
+    async_begin(pt);
+
+    pt->dt = dt;
+    pt->status = RETAIN_IDLE;
+
+    while (1) {
+        if (pt->status == RETAIN_IDLE) {
+            await(dt - pt->dt >= RETAIN_PERIOD);
+            pt->since = dt;
+        }
+
+        if (dt - pt->dt >= RETAIN_PERIOD) {
+            pt->dt = dt;
+            retain_collect();
+        }
+
+        idle = plc_idle_time();
+        overdue = retain_store_pending(&store) &&
+                  dt - pt->since >= RETAIN_MAX_DELAY;
+
+        if (idle >= RETAIN_WRITE_US || overdue) {
+            pt->status = retain_store_step(&store,
+                                           idle >= RETAIN_ERASE_US || overdue);
+
+            if (pt->status == RETAIN_ERROR) {
+                /* retried next period */
+                plc_log(LOG_CRITICAL, "Retain: flash write failed");
+                pt->status = RETAIN_IDLE;
+            } else if (pt->status == RETAIN_ERASED && idle < RETAIN_ERASE_US) {
+                plc_log(LOG_WARNING, "Retain: page erase delayed scan");
+            }
+        } else {
+            pt->status = RETAIN_BLOCKED;
+        }
+
+        async_yield;
+    }
+
+    async_end;
+}
+
+void retain_task(unsigned long dt, int run)
+{
+    if (saving)
+        retain_save(dt, &rts);
+}
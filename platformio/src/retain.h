@@ -0,0 +1,69 @@
+#ifndef RETAIN_H
+#define RETAIN_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#include "retain_store.h"
+
+/* ms between looks for changed retained variables */
+#ifndef RETAIN_PERIOD
+#define RETAIN_PERIOD           1000
+#endif
+
+/* us left before next scan needed to erase a page, or write a record */
+#ifndef RETAIN_ERASE_US
+#define RETAIN_ERASE_US         40000
+#endif
+
+#ifndef RETAIN_WRITE_US
+#define RETAIN_WRITE_US         2000
+#endif
+
+/* ms after which saving goes on even if it delays a scan */
+#ifndef RETAIN_MAX_DELAY
+#define RETAIN_MAX_DELAY        60000
+#endif
+
+/* flash pages used, at end of flash */
+#ifndef RETAIN_PAGES
+#define RETAIN_PAGES            2
+#endif
+
+/* offset, image size (uint16), layout hash, records, erases (uint32) */
+#define RETAIN_INFO_SIZE        16
+
+/* retained variable, as generated in retain.c */
+struct retain_var {
+    void *ptr;                  /* value, or pointer to it if indirect */
+    uint16_t offset;            /* in image */
+    uint8_t size;
+    uint8_t indirect;
+};
+
+struct retain_layout {
+    const struct retain_var *vars;
+    uint16_t count;
+    uint16_t size;
+    uint32_t hash;
+    uint8_t *image;
+    uint8_t *dirty;
+    uint8_t *missing;
+};
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+const struct retain_layout *retain_layout(void);
+
+#ifdef __cplusplus
+}
+#endif
+
+void retain_init(void);
+void retain_collect(void);
+void retain_restore(void);
+size_t retain_read(uint16_t offset, uint8_t *buf, size_t size);
+
+#endif
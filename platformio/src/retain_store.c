@@ -0,0 +1,316 @@
+/*
+ * This file is part of Beremiz for uC
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; If not, see <http://www.gnu.org/licenses/>.
+ *
+ */
+
+/*
+ * Log structured storage of retain image in flash pages, no Arduino
+ * dependency so that it can be tested on host.
+ *
+ * Each page starts with a sequence number and the layout hash, then
+ * holds records of image blocks, appended as blocks change. Loading
+ * replays pages oldest first, so newest record of a block wins. When
+ * current page is full, writing goes on in next page, starting with a
+ * copy of every block, after which page before isn't needed anymore.
+ * Pages are used in turn to spread wear, and are erased ahead of time,
+ * only when caller allows it, so that an erase never delays a scan.
+ */
+
+#include <string.h>
+
+#include "retain_store.h"
+
+#define BIT(map, i)     ((map)[(i) / 8] & (1 << ((i) % 8)))
+#define SET(map, i)     ((map)[(i) / 8] |= (1 << ((i) % 8)))
+#define CLEAR(map, i)   ((map)[(i) / 8] &= ~(1 << ((i) % 8)))
+
+/* CRC-16/CCITT */
+static uint16_t crc16(uint16_t crc, const uint8_t *data, uint16_t len)
+{
+    while (len--) {
+        crc ^= (uint16_t)*data++ << 8;
+        for (uint8_t i = 0; i < 8; i++)
+            crc = crc & 0x8000 ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+    return crc;
+}
+
+static uint16_t record_crc(uint16_t block, const uint8_t *data)
+{
+    return crc16(crc16(0xffff, (const uint8_t *)&block, 2),
+                 data, RETAIN_BLOCK_SIZE);
+}
+
+static const uint8_t *page_mem(const struct retain_store *s, uint8_t page)
+{
+    return s->flash->mem + (uint32_t)page * s->flash->page_size;
+}
+
+static uint8_t next_page(const struct retain_store *s)
+{
+    return s->page == RETAIN_NO_PAGE ? 0 : (s->page + 1) % s->flash->pages;
+}
+
+static int is_erased(const uint8_t *p, uint16_t len)
+{
+    while (len--)
+        if (*p++ != 0xff)
+            return 0;
+    return 1;
+}
+
+/* sequence number of a page written for this layout, 0 otherwise */
+static uint32_t page_seq(const struct retain_store *s, uint8_t page)
+{
+    const uint8_t *p = page_mem(s, page);
+    uint32_t seq, hash;
+
+    memcpy(&seq, p, 4);
+    memcpy(&hash, p + 4, 4);
+
+    return hash == s->hash && seq != 0xffffffff ? seq : 0;
+}
+
+static void mark_all(const struct retain_store *s, uint8_t *map)
+{
+    memset(map, 0, RETAIN_BITMAP_SIZE(s->size));
+    for (uint16_t i = 0; i < s->blocks; i++)
+        SET(map, i);
+}
+
+/*
+ * Copy valid records of page to image, clearing them from missing
+ * blocks. Returns offset after last programmed record, torn records
+ * included, as they can't be programmed again.
+ */
+static uint16_t replay(struct retain_store *s, uint8_t page)
+{
+    const uint8_t *p = page_mem(s, page);
+    uint16_t end = RETAIN_PAGE_HEADER;
+    uint16_t off, block, crc, start;
+
+    for (off = RETAIN_PAGE_HEADER;
+         off + RETAIN_RECORD_SIZE <= s->flash->page_size;
+         off += RETAIN_RECORD_SIZE) {
+
+        if (is_erased(p + off, RETAIN_RECORD_SIZE))
+            continue;
+        end = off + RETAIN_RECORD_SIZE;
+
+        memcpy(&block, p + off, 2);
+        memcpy(&crc, p + off + 2, 2);
+        if (block >= s->blocks || crc != record_crc(block, p + off + 4))
+            continue;
+
+        start = block * RETAIN_BLOCK_SIZE;
+        memcpy(s->image + start, p + off + 4,
+               s->size - start < RETAIN_BLOCK_SIZE ?
+               s->size - start : RETAIN_BLOCK_SIZE);
+        CLEAR(s->missing, block);
+    }
+
+    return end;
+}
+
+/*
+ * Restore image from flash, blocks never saved keeping their value.
+ * Returns count of pages found, -1 if flash is too small for image.
+ */
+int retain_store_load(struct retain_store *s)
+{
+    uint16_t records = (s->flash->page_size - RETAIN_PAGE_HEADER) /
+                       RETAIN_RECORD_SIZE;
+    uint32_t last = 0;
+    int count = 0;
+
+    s->blocks = (s->size + RETAIN_BLOCK_SIZE - 1) / RETAIN_BLOCK_SIZE;
+    s->page = RETAIN_NO_PAGE;
+    s->seq = 0;
+    s->cursor = 0;
+    s->records = 0;
+    s->erases = 0;
+    memset(s->dirty, 0, RETAIN_BITMAP_SIZE(s->size));
+    memset(s->missing, 0, RETAIN_BITMAP_SIZE(s->size));
+
+    /* a page holds a copy of every block, and as much again */
+    if (s->blocks == 0 || s->flash->pages < 2 ||
+        s->flash->pages == RETAIN_NO_PAGE || records < 2 * s->blocks)
+        return -1;
+
+    while (1) {
+        uint8_t page = RETAIN_NO_PAGE;
+        uint32_t oldest = 0;
+
+        for (uint8_t i = 0; i < s->flash->pages; i++) {
+            uint32_t seq = page_seq(s, i);
+
+            if (seq > last && (page == RETAIN_NO_PAGE || seq < oldest)) {
+                page = i;
+                oldest = seq;
+            }
+        }
+
+        if (page == RETAIN_NO_PAGE)
+            break;
+
+        /* only newest page tells which blocks it still lacks */
+        mark_all(s, s->missing);
+        s->offset = replay(s, page);
+        s->page = page;
+        s->seq = last = oldest;
+        count++;
+    }
+
+    if (s->page == RETAIN_NO_PAGE)
+        memset(s->missing, 0, RETAIN_BITMAP_SIZE(s->size));
+
+    s->next_erased = is_erased(page_mem(s, next_page(s)), s->flash->page_size);
+
+    return count;
+}
+
+/* copy value to image, marking blocks it changed as dirty */
+void retain_store_update(struct retain_store *s, uint16_t offset,
+                         const void *data, uint16_t len)
+{
+    const uint8_t *p = (const uint8_t *)data;
+
+    for (uint16_t i = 0; i < len; i++) {
+        if (s->image[offset + i] != p[i]) {
+            s->image[offset + i] = p[i];
+            SET(s->dirty, (offset + i) / RETAIN_BLOCK_SIZE);
+        }
+    }
+}
+
+/* next block to save, round robin so that every block gets its turn */
+static int next_block(const struct retain_store *s)
+{
+    for (uint16_t i = 0; i < s->blocks; i++) {
+        uint16_t block = (s->cursor + i) % s->blocks;
+
+        if (BIT(s->dirty, block) || BIT(s->missing, block))
+            return block;
+    }
+
+    return -1;
+}
+
+int retain_store_pending(const struct retain_store *s)
+{
+    return next_block(s) >= 0;
+}
+
+static int complete(const struct retain_store *s)
+{
+    for (uint16_t i = 0; i < s->blocks; i++)
+        if (BIT(s->missing, i))
+            return 0;
+    return 1;
+}
+
+static int erase_next(struct retain_store *s)
+{
+    if (s->flash->erase(next_page(s)))
+        return RETAIN_ERROR;
+
+    s->next_erased = 1;
+    s->erases++;
+
+    return RETAIN_ERASED;
+}
+
+static int open_page(struct retain_store *s)
+{
+    uint8_t header[RETAIN_PAGE_HEADER];
+    uint8_t page = next_page(s);
+    uint32_t seq = s->seq + 1;
+
+    memcpy(header, &seq, 4);
+    memcpy(header + 4, &s->hash, 4);
+
+    s->next_erased = 0;
+    if (s->flash->program((uint32_t)page * s->flash->page_size,
+                          header, sizeof(header)))
+        return RETAIN_ERROR;
+
+    s->page = page;
+    s->seq = seq;
+    s->offset = RETAIN_PAGE_HEADER;
+    mark_all(s, s->missing);
+    s->next_erased = is_erased(page_mem(s, next_page(s)), s->flash->page_size);
+
+    return RETAIN_WROTE;
+}
+
+static int write_block(struct retain_store *s, uint16_t block)
+{
+    uint8_t record[RETAIN_RECORD_SIZE];
+    uint16_t start = block * RETAIN_BLOCK_SIZE;
+    uint16_t crc;
+    uint32_t addr = (uint32_t)s->page * s->flash->page_size + s->offset;
+
+    memset(record + 4, 0, RETAIN_BLOCK_SIZE);
+    memcpy(record + 4, s->image + start,
+           s->size - start < RETAIN_BLOCK_SIZE ?
+           s->size - start : RETAIN_BLOCK_SIZE);
+    crc = record_crc(block, record + 4);
+    memcpy(record, &block, 2);
+    memcpy(record + 2, &crc, 2);
+
+    /* slot can't be programmed again, even if this failed */
+    s->offset += RETAIN_RECORD_SIZE;
+    if (s->flash->program(addr, record, sizeof(record)))
+        return RETAIN_ERROR;
+
+    CLEAR(s->dirty, block);
+    CLEAR(s->missing, block);
+    s->cursor = (block + 1) % s->blocks;
+    s->records++;
+
+    return RETAIN_WROTE;
+}
+
+/*
+ * Do one flash operation towards saving image, erasing a page only if
+ * may_erase is set. Page before current one can be erased once current
+ * one holds every block.
+ */
+int retain_store_step(struct retain_store *s, int may_erase)
+{
+    int block = next_block(s);
+    int can_erase = may_erase && !s->next_erased &&
+                    (s->flash->pages > 2 || complete(s));
+
+    if (block < 0) {
+        /* erase ahead, so that next page switch doesn't wait */
+        if (s->page != RETAIN_NO_PAGE && can_erase)
+            return erase_next(s);
+        return RETAIN_IDLE;
+    }
+
+    if (s->page == RETAIN_NO_PAGE ||
+        s->offset + RETAIN_RECORD_SIZE > s->flash->page_size) {
+
+        if (s->next_erased)
+            return open_page(s);
+        if (s->page == RETAIN_NO_PAGE ? may_erase : can_erase)
+            return erase_next(s);
+        return RETAIN_BLOCKED;
+    }
+
+    return write_block(s, block);
+}
@@ -0,0 +1,70 @@
+#ifndef RETAIN_STORE_H
+#define RETAIN_STORE_H
+
+#include <stdint.h>
+
+/* image is saved by blocks, each record holds a block */
+#ifndef RETAIN_BLOCK_SIZE
+#define RETAIN_BLOCK_SIZE       32
+#endif
+
+/* page header is sequence number and layout hash (uint32) */
+#define RETAIN_PAGE_HEADER      8
+
+/* record is block index, CRC (uint16) then block */
+#define RETAIN_RECORD_SIZE      (4 + RETAIN_BLOCK_SIZE)
+
+#define RETAIN_NO_PAGE          0xff
+
+enum {
+    RETAIN_IDLE,                /* all blocks saved */
+    RETAIN_WROTE,               /* a record or page header was written */
+    RETAIN_ERASED,              /* a page was erased */
+    RETAIN_BLOCKED,             /* waiting for permission to erase */
+    RETAIN_ERROR = -1,          /* flash operation failed */
+};
+
+/* flash pages, read through mem, written by halfwords at least */
+struct retain_flash {
+    const uint8_t *mem;
+    uint16_t page_size;
+    uint8_t pages;
+    int (*erase)(uint8_t page);
+    int (*program)(uint32_t offset, const uint8_t *data, uint16_t len);
+};
+
+struct retain_store {
+    const struct retain_flash *flash;
+    uint8_t *image;
+    uint16_t size;
+    uint32_t hash;
+    uint8_t *dirty;             /* blocks changed since saved */
+    uint8_t *missing;           /* blocks not yet in current page */
+    uint16_t blocks;
+    uint16_t cursor;            /* next block to look at */
+    uint8_t page;               /* current page */
+    uint8_t next_erased;        /* page after current one is erased */
+    uint16_t offset;            /* next record in current page */
+    uint32_t seq;               /* of current page */
+    uint32_t records;
+    uint32_t erases;
+};
+
+#define RETAIN_BITMAP_SIZE(size) \
+    (((size) + RETAIN_BLOCK_SIZE * 8 - 1) / (RETAIN_BLOCK_SIZE * 8))
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+int retain_store_load(struct retain_store *s);
+void retain_store_update(struct retain_store *s, uint16_t offset,
+                         const void *data, uint16_t len);
+int retain_store_pending(const struct retain_store *s);
+int retain_store_step(struct retain_store *s, int may_erase);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
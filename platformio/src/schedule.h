@@ -0,0 +1,14 @@
+#ifndef SCHEDULE_H
+#define SCHEDULE_H
+
+#include <stdint.h>
+
+/* resource task, as generated in schedule.c, sorted by priority */
+struct plc_task {
+    void (*run)(void);
+    uint32_t period;            /* us */
+    uint32_t next;              /* micros() of next activation */
+    uint32_t overruns;          /* activations dropped while busy */
+};
+
+#endif
@@ -25,11 +25,16 @@
 #include "async.h"
 #include "async-sem.h"
 #include "hw.h"
+#include "logbuf.h"
+#include "retain.h"
 #include "serial.h"
+#include "stats.h"
+#include "task_sched.h"
 
 extern "C" {
 #include "min.h"
 #include "debug.h"
+#include "profile.h"
 
 void config_init__(void);
 }
@@ -45,9 +50,26 @@ void config_init__(void);
 #define MIN_PLC_GET_TRACE       8
 #define MIN_PLC_WAIT_TRACE      9
 #define MIN_PLC_RESET_TRACE     10
+#define MIN_PLC_SET_TRACES      11
+#define MIN_PLC_GET_PROFILE     12
+#define MIN_PLC_RESET_PROFILE   13
+#define MIN_PLC_GET_STATS       14
+#define MIN_PLC_GET_LOG         15
+#define MIN_PLC_GET_RETAIN      16
+#define MIN_PLC_GET_TASKS       17
 
 #define BUFFER_SIZE             32
 
+#ifndef TRACE_BATCH_SIZE
+#define TRACE_BATCH_SIZE        512
+#endif
+
+#define PROFILE_ENTRY_SIZE      28
+#define PROFILE_PAGE            ((MAX_PAYLOAD - 8) / PROFILE_ENTRY_SIZE)
+
+#define BATCH_FIRST             0x01
+#define BATCH_LAST              0x02
+
 #if ARDUINO_ARCH_STM32 && defined STM32F1xx
 #include <stm32f1xx_hal_cortex.h>
 static inline void run_bootloader(void)
@@ -71,6 +93,7 @@ static inline void reset(void)
 #endif
 
 extern unsigned long tick;
+extern unsigned long tick_ms;
 
 void plc_run(bool);
 
@@ -80,8 +103,8 @@ static struct min_context min_ctx;
 
 static struct min_poll_state {
     async_state;
-    uint8_t buf;
-    uint8_t len;
+    uint8_t buf[MIN_RX_BUDGET];
+    size_t len;
     unsigned long keepalive;
     unsigned long dt;
 } min_poll_state;
@@ -93,11 +116,169 @@ static struct min_state {
     size_t idx;
 } min_state;
 
-static struct {
+struct min_cmd {
     uint8_t buf[BUFFER_SIZE];
     uint8_t id;
     uint8_t len;
-} min_data;
+};
+
+/* command being run by min_task, and the ones waiting for it */
+static struct min_cmd min_data;
+
+static struct {
+    struct min_cmd cmd[MIN_CMD_QUEUE];
+    uint8_t head;
+    uint8_t tail;
+} min_cmds;
+
+/* tick and the millis() timestamp of its scan */
+static void queue_tick(void)
+{
+    uint32_t buf[2] = {(uint32_t)tick, (uint32_t)tick_ms};
+
+    min_queue_frame(&min_ctx, MIN_PLC_TICK, (uint8_t *)buf, sizeof(buf));
+}
+
+static struct {
+    uint8_t buf[TRACE_BATCH_SIZE];
+    uint16_t len;
+    bool overflow;
+} trace_batch;
+
+/*
+ * Batched trace list : frames are staged until the last one is received,
+ * then the whole list is applied at once, between two scans.
+ * Each entry is index (uint16), forced flag (uint8) and value if forced.
+ */
+static void set_traces(uint8_t const *payload, uint8_t len)
+{
+    static uint64_t val[16];
+    uint8_t flags = payload[0];
+    uint8_t status;
+
+    if (flags & BATCH_FIRST) {
+        trace_batch.len = 0;
+        trace_batch.overflow = false;
+    }
+
+    if (trace_batch.len + len - 1 > TRACE_BATCH_SIZE) {
+        trace_batch.overflow = true;
+    } else {
+        memcpy(trace_batch.buf + trace_batch.len, payload + 1, len - 1);
+        trace_batch.len += len - 1;
+    }
+
+    if (!(flags & BATCH_LAST))
+        return;
+
+    status = trace_batch.overflow;
+    if (status)
+        plc_log(LOG_WARNING, "Debug trace list too large");
+
+    if (!status) {
+        trace_reset();
+
+        for (size_t i = 0; i + 3 <= trace_batch.len;) {
+            uint16_t idx;
+            bool forced;
+            size_t size;
+
+            memcpy(&idx, trace_batch.buf + i, 2);
+            forced = trace_batch.buf[i + 2];
+            i += 3;
+
+            size = forced ? get_var_size(idx) : 0;
+            if (size > sizeof(val) || i + size > trace_batch.len)
+                break;
+
+            /* copy to aligned storage */
+            memcpy(val, trace_batch.buf + i, size);
+            set_trace(idx, forced, (void *)val);
+            i += size;
+        }
+    }
+
+    min_queue_frame(&min_ctx, MIN_PLC_SET_TRACES, &status, 1);
+}
+
+/*
+ * Page of POU profile table, starting at given POU index.
+ * Header is first index and POU count (uint16), timer frequency (uint32).
+ */
+static void queue_profile(uint16_t start)
+{
+    static uint8_t buf[8 + PROFILE_PAGE * PROFILE_ENTRY_SIZE];
+    uint16_t count = profile_count();
+    uint32_t freq = profile_freq();
+    uint8_t len = 8;
+
+    memcpy(buf, &start, 2);
+    memcpy(buf + 2, &count, 2);
+    memcpy(buf + 4, &freq, 4);
+
+    for (uint16_t i = start; i < count && len < sizeof(buf); i++) {
+        profile_read(i, buf + len);
+        len += PROFILE_ENTRY_SIZE;
+    }
+
+    min_queue_frame(&min_ctx, MIN_PLC_GET_PROFILE, buf, len);
+}
+
+/* scan statistics, reset once sent if asked to */
+static void queue_stats(bool reset)
+{
+    uint8_t buf[SCAN_STATS_SIZE];
+
+    scan_stats_read(buf);
+    if (reset)
+        scan_stats_reset();
+
+    min_queue_frame(&min_ctx, MIN_PLC_GET_STATS, buf, sizeof(buf));
+}
+
+/*
+ * Page of log records, after dropped messages count (uint32) and a flag
+ * telling more records are pending. Records are only removed from log
+ * buffer once page is queued.
+ */
+static void queue_log(void)
+{
+    static uint8_t buf[MAX_PAYLOAD];
+    uint32_t dropped = log_dropped();
+    size_t len;
+
+    memcpy(buf, &dropped, 4);
+    len = log_read(buf + 5, sizeof(buf) - 5);
+    buf[4] = log_pending() > len;
+
+    if (min_queue_frame(&min_ctx, MIN_PLC_GET_LOG, buf, 5 + len))
+        log_consume(len);
+}
+
+/* page of retain image, starting at given offset, see retain_read() */
+static void queue_retain(uint16_t offset)
+{
+    static uint8_t buf[MAX_PAYLOAD];
+
+    min_queue_frame(&min_ctx, MIN_PLC_GET_RETAIN, buf,
+                    retain_read(offset, buf, sizeof(buf)));
+}
+
+/*
+ * Page of background task usage, starting at given task index, see
+ * sched_read(). Counters are reset once last page is sent, if asked to.
+ */
+static void queue_tasks(unsigned long dt, uint16_t start, bool reset)
+{
+    static uint8_t buf[MAX_PAYLOAD];
+    size_t len = sched_read(start, dt, buf, sizeof(buf));
+
+    if (reset && start + (len - TASK_INFO_SIZE) / TASK_ENTRY_SIZE >=
+                 sched_count())
+        sched_reset(dt);
+
+    min_queue_frame(&min_ctx, MIN_PLC_GET_TASKS, buf, len);
+}
 
 static async min_task(unsigned long dt, struct min_state *pt)
 {
@@ -109,11 +290,10 @@ static async min_task(unsigned long dt, struct min_state *pt)
     while (1) {
         await_sem(&ready);
 
-        if (min_data.id == MIN_KEEP_ALIVE) {
-
-            min_queue_frame(&min_ctx, MIN_KEEP_ALIVE, 0, 0);
+        min_data = min_cmds.cmd[min_cmds.tail];
+        min_cmds.tail = (min_cmds.tail + 1) % MIN_CMD_QUEUE;
 
-        } else if (min_data.id == MIN_PLC_START) {
+        if (min_data.id == MIN_PLC_START) {
 
             plc_run(true);
             min_queue_frame(&min_ctx, MIN_PLC_START, 0, 0);
@@ -129,7 +309,10 @@ static async min_task(unsigned long dt, struct min_state *pt)
 
         } else if (min_data.id == MIN_PLC_INIT) {
 
+            /* retained variables survive init */
+            retain_collect();
             config_init__();
+            retain_restore();
             tick = 0;
 
         } else if (min_data.id == MIN_PLC_UPLOAD) {
@@ -145,7 +328,7 @@ static async min_task(unsigned long dt, struct min_state *pt)
             await (tick != pt->last_tick);
 
             pt->last_tick = tick;
-            min_queue_frame(&min_ctx, MIN_PLC_TICK, (uint8_t *) & tick, 4);
+            queue_tick();
 
             min_queue_frame(&min_ctx, MIN_PLC_GET_TRACE,
                             (uint8_t *)get_var_addr(pt->idx),
@@ -160,7 +343,7 @@ static async min_task(unsigned long dt, struct min_state *pt)
             if (tick != pt->last_tick) {
 
                 pt->last_tick = tick;
-                min_queue_frame(&min_ctx, MIN_PLC_TICK, (uint8_t *) & tick, 4);
+                queue_tick();
 
             }
 
@@ -174,6 +357,35 @@ static async min_task(unsigned long dt, struct min_state *pt)
 
             trace_reset();
 
+        } else if (min_data.id == MIN_PLC_GET_PROFILE) {
+
+            queue_profile(min_data.len >= 2 ?
+                          ((uint16_t *)min_data.buf)[0] : 0);
+
+        } else if (min_data.id == MIN_PLC_GET_STATS) {
+
+            queue_stats(min_data.len >= 1 && min_data.buf[0]);
+
+        } else if (min_data.id == MIN_PLC_GET_LOG) {
+
+            queue_log();
+
+        } else if (min_data.id == MIN_PLC_GET_RETAIN) {
+
+            queue_retain(min_data.len >= 2 ?
+                         ((uint16_t *)min_data.buf)[0] : 0);
+
+        } else if (min_data.id == MIN_PLC_GET_TASKS) {
+
+            queue_tasks(dt, min_data.len >= 2 ?
+                        ((uint16_t *)min_data.buf)[0] : 0,
+                        min_data.len >= 3 && min_data.buf[2]);
+
+        } else if (min_data.id == MIN_PLC_RESET_PROFILE) {
+
+            profile_reset();
+            min_queue_frame(&min_ctx, MIN_PLC_RESET_PROFILE, 0, 0);
+
         } else {
 
             min_queue_frame(&min_ctx, MIN_KEEP_ALIVE, 0, 0);
@@ -190,14 +402,17 @@ static async min_poll_task(unsigned long dt, struct min_poll_state *pt)
     pt->keepalive = 0 - MIN_TIMEOUT;
 
     while (1) {
-        min_poll(&min_ctx, &pt->buf, pt->len);
+        pt->dt = dt;
 
-        if (MINPORT.available()) {
-            pt->buf = MINPORT.read();
-            pt->len = 1;
-        } else {
-            pt->len = 0;
-        }
+        /*
+         * drain what was received since last pass, so that command rate
+         * doesn't depend on scan time, budget bounds time spent here
+         */
+        pt->len = 0;
+        while (pt->len < MIN_RX_BUDGET && MINPORT.available() > 0)
+            pt->buf[pt->len++] = MINPORT.read();
+
+        min_poll(&min_ctx, pt->buf, pt->len);
 
         /* keep alive */
         if (dt - pt->keepalive > MIN_TIMEOUT) {
@@ -206,8 +421,6 @@ static async min_poll_task(unsigned long dt, struct min_poll_state *pt)
             min_queue_frame(&min_ctx, MIN_KEEP_ALIVE, 0, 0);
         }
 
-        pt->dt = dt;
-
         async_yield;
     }
 
@@ -223,7 +436,18 @@ void min_application_handler(uint8_t min_id,
     /* keep alive */
     min_poll_state.keepalive = min_poll_state.dt;
 
-    if (min_id == MIN_PLC_SET_TRACE) {
+    if (min_id == MIN_KEEP_ALIVE) {
+
+        /* answer at once with echoed sequence, tick and time,
+           host uses the round trip to align its clock */
+        uint32_t sync[3] = {0, (uint32_t)tick, (uint32_t)millis()};
+
+        if (len_payload >= 4)
+            memcpy(sync, min_payload, 4);
+
+        min_send_frame(&min_ctx, MIN_KEEP_ALIVE, (uint8_t *)sync, sizeof(sync));
+
+    } else if (min_id == MIN_PLC_SET_TRACE) {
 
         size_t idx = ((size_t *)min_payload)[0];
         bool forced = ((bool *)min_payload)[8];
@@ -233,12 +457,25 @@ void min_application_handler(uint8_t min_id,
 
         set_trace(idx, forced, (void *)buf);
 
-    } else {
-        min_data.id = min_id;
-        min_data.len = len_payload;
-        memcpy(min_data.buf, min_payload, len_payload);
+    } else if (min_id == MIN_PLC_SET_TRACES && len_payload > 0) {
+
+        set_traces(min_payload, len_payload);
+
+    } else if (ready.count < MIN_CMD_QUEUE) {
+        /* several frames can complete in one min_poll() call */
+        struct min_cmd *cmd = &min_cmds.cmd[min_cmds.head];
+
+        min_cmds.head = (min_cmds.head + 1) % MIN_CMD_QUEUE;
+
+        cmd->id = min_id;
+        cmd->len = len_payload < BUFFER_SIZE ? len_payload : BUFFER_SIZE;
+        memcpy(cmd->buf, min_payload, cmd->len);
 
         signal_sem(&ready);
+
+    } else {
+        /* frame is already acked, host only learns about it from log */
+        plc_log(LOG_WARNING, "MIN command %u dropped, queue full", min_id);
     }
 }
 
@@ -263,6 +500,7 @@ void serial_init(void)
     MINPORT.flush();
 
     init_sem(&ready, 0);
+    min_cmds.head = min_cmds.tail = 0;
 
     async_init(&min_poll_state);
     async_init(&min_state);
@@ -13,4 +13,14 @@
 #define MIN_TIMEOUT             2000
 #endif
 
+/* bytes handed to MIN per loop() pass */
+#ifndef MIN_RX_BUDGET
+#define MIN_RX_BUDGET           64
+#endif
+
+/* commands received but not yet run by min_task */
+#ifndef MIN_CMD_QUEUE
+#define MIN_CMD_QUEUE           4
+#endif
+
 #endif
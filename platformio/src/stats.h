@@ -0,0 +1,17 @@
+#ifndef STATS_H
+#define STATS_H
+
+#include <stdint.h>
+
+/* scan start lateness histogram, bucket i counts scans late by less
+   than jitter_bounds[i] us, last one the others */
+#define JITTER_BUCKETS          8
+
+/* count, min, max (uint32), total (uint64), overruns, period (uint32),
+   then jitter buckets (uint32), in us */
+#define SCAN_STATS_SIZE         (28 + 4 * JITTER_BUCKETS)
+
+void scan_stats_read(uint8_t *buf);
+void scan_stats_reset(void);
+
+#endif
@@ -0,0 +1,164 @@
+/*
+ * This file is part of Beremiz for uC
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; If not, see <http://www.gnu.org/licenses/>.
+ *
+ */
+
+/*
+ * Cooperative scheduler of background tasks, run between PLC scans, no
+ * Arduino dependency so that it can be tested on host.
+ *
+ * Tasks run in turn, high priority ones first. High priority tasks run
+ * every pass, even when PLC overruns and a scan is always due, so that
+ * serial link keeps answering. Before each low priority task, time left
+ * before next scan is checked: it is only started if its budget ends
+ * before next scan, unless it has been deferred for TASK_MAX_DEFER ms.
+ * Time spent in each task is measured.
+ */
+
+#include <string.h>
+
+#include "task_sched.h"
+
+struct task {
+    char name[TASK_NAME_SIZE];
+    task_fn run;
+    uint32_t budget;            /* us, longest expected call */
+    uint8_t priority;
+    unsigned long last;         /* dt of last call */
+    uint32_t calls;
+    uint64_t total;
+    uint32_t max;
+    uint32_t overruns;          /* calls longer than budget */
+    uint32_t deferred;          /* passes skipped for lack of time */
+};
+
+static struct task tasks[MAX_TASKS];
+static uint8_t count;
+static unsigned long since;     /* dt of stats reset */
+
+static uint32_t (*now_us)(void);
+static uint32_t (*idle_us)(void);
+
+void sched_init(uint32_t (*now)(void), uint32_t (*idle)(void))
+{
+    memset(tasks, 0, sizeof(tasks));
+    count = 0;
+    since = 0;
+    now_us = now;
+    idle_us = idle;
+}
+
+/* add task after others of same priority, -1 if table is full */
+int sched_register(const char *name, task_fn run, uint32_t budget,
+                   uint8_t priority)
+{
+    uint8_t i = count;
+
+    if (count >= MAX_TASKS)
+        return -1;
+
+    while (i > 0 && tasks[i - 1].priority > priority) {
+        tasks[i] = tasks[i - 1];
+        i--;
+    }
+
+    memset(&tasks[i], 0, sizeof(tasks[i]));
+    strncpy(tasks[i].name, name, TASK_NAME_SIZE);
+    tasks[i].run = run;
+    tasks[i].budget = budget;
+    tasks[i].priority = priority;
+    count++;
+
+    return i;
+}
+
+uint8_t sched_count(void)
+{
+    return count;
+}
+
+void sched_run(unsigned long dt, int run)
+{
+    for (uint8_t i = 0; i < count; i++) {
+        struct task *t = &tasks[i];
+        uint32_t start, elapsed;
+
+        /* only low priority work gives way to a due scan */
+        if (t->priority == TASK_LOW && dt - t->last < TASK_MAX_DEFER) {
+            uint32_t idle = idle_us();
+
+            if (idle == 0 || idle < t->budget) {
+                t->deferred++;
+                continue;
+            }
+        }
+
+        start = now_us();
+        t->run(dt, run);
+        elapsed = now_us() - start;
+
+        t->last = dt;
+        t->calls++;
+        t->total += elapsed;
+        if (elapsed > t->max)
+            t->max = elapsed;
+        if (elapsed > t->budget)
+            t->overruns++;
+    }
+}
+
+/* page of task table, starting at given index, see TASK_ENTRY_SIZE */
+size_t sched_read(uint16_t start, unsigned long dt, uint8_t *buf, size_t size)
+{
+    uint16_t total = count;
+    uint32_t elapsed = dt - since;
+    size_t len = TASK_INFO_SIZE;
+
+    memcpy(buf, &start, 2);
+    memcpy(buf + 2, &total, 2);
+    memcpy(buf + 4, &elapsed, 4);
+
+    for (uint16_t i = start; i < count && len + TASK_ENTRY_SIZE <= size; i++) {
+        const struct task *t = &tasks[i];
+        uint8_t *p = buf + len;
+
+        memcpy(p, t->name, TASK_NAME_SIZE);
+        p += TASK_NAME_SIZE;
+        *p++ = t->priority;
+        memcpy(p, &t->budget, 4);
+        memcpy(p + 4, &t->calls, 4);
+        memcpy(p + 8, &t->total, 8);
+        memcpy(p + 16, &t->max, 4);
+        memcpy(p + 20, &t->overruns, 4);
+        memcpy(p + 24, &t->deferred, 4);
+        len += TASK_ENTRY_SIZE;
+    }
+
+    return len;
+}
+
+void sched_reset(unsigned long dt)
+{
+    for (uint8_t i = 0; i < count; i++) {
+        tasks[i].calls = 0;
+        tasks[i].total = 0;
+        tasks[i].max = 0;
+        tasks[i].overruns = 0;
+        tasks[i].deferred = 0;
+    }
+
+    since = dt;
+}
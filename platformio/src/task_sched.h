@@ -0,0 +1,50 @@
+#ifndef TASK_SCHED_H
+#define TASK_SCHED_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+/* registered background tasks, at most */
+#ifndef MAX_TASKS
+#define MAX_TASKS               12
+#endif
+
+/* ms a low priority task can be deferred, before it runs anyway */
+#ifndef TASK_MAX_DEFER
+#define TASK_MAX_DEFER          100
+#endif
+
+#define TASK_NAME_SIZE          8
+
+/* first index, task count (uint16), ms since stats reset (uint32) */
+#define TASK_INFO_SIZE          8
+
+/* name, priority (uint8), budget, calls (uint32), total (uint64),
+   max, overruns, deferred (uint32), times in us */
+#define TASK_ENTRY_SIZE         (TASK_NAME_SIZE + 29)
+
+/* priority relative to PLC scan, only low priority tasks wait for it */
+enum task_priority {
+    TASK_HIGH,                  /* started every pass, even if scan is due */
+    TASK_LOW,                   /* started if budget ends before next scan */
+};
+
+typedef void (*task_fn)(unsigned long dt, int run);
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+void sched_init(uint32_t (*now)(void), uint32_t (*idle)(void));
+int sched_register(const char *name, task_fn run, uint32_t budget,
+                   uint8_t priority);
+uint8_t sched_count(void);
+void sched_run(unsigned long dt, int run);
+size_t sched_read(uint16_t start, unsigned long dt, uint8_t *buf, size_t size);
+void sched_reset(unsigned long dt);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
@@ -21,6 +21,7 @@
 #include <Arduino.h>
 
 #include "hw.h"
+#include "retain.h"
 #include "tasks.h"
 
 extern "C" void __task(unsigned long, int) {}
@@ -28,10 +29,8 @@ extern "C" void __task(unsigned long, int) {}
 void serial_task(unsigned long, int) __attribute__((weak, alias("__task")));
 void wifi_task(unsigned long, int)   __attribute__((weak, alias("__task")));
 void eth_task(unsigned long, int)    __attribute__((weak, alias("__task")));
-
-struct task_state {
-    async_state;
-} ts;
+void modbus_task(unsigned long, int) __attribute__((weak, alias("__task")));
+void retain_task(unsigned long, int) __attribute__((weak, alias("__task")));
 
 struct blink_task_state {
     async_state;
@@ -64,23 +63,35 @@ static async blink_task(unsigned long dt, int run)
     }
 }
 
-async run_tasks(unsigned long dt, int run)
+static void blink(unsigned long dt, int run)
 {
-    async_begin(&ts);
-
-    while (1) {
-
-        blink_task(dt, run);
+    blink_task(dt, run);
+}
 
-        serial_task(dt, run);
-        async_yield;
+static uint32_t now_us(void)
+{
+    return micros();
+}
 
-        wifi_task(dt, run);
-        async_yield;
+uint32_t plc_idle_time(void);
 
-        eth_task(dt, run);
-        async_yield;
-    }
+/*
+ * Serial link and LED are served even when their budget doesn't fit before
+ * next scan, retain saving checks time left by itself.
+ */
+void tasks_init(void)
+{
+    sched_init(now_us, plc_idle_time);
+
+    sched_register("blink", blink, 50, TASK_HIGH);
+    sched_register("serial", serial_task, TASK_SERIAL_BUDGET, TASK_HIGH);
+    sched_register("wifi", wifi_task, TASK_WIFI_BUDGET, TASK_LOW);
+    sched_register("eth", eth_task, TASK_ETH_BUDGET, TASK_LOW);
+    sched_register("modbus", modbus_task, TASK_MODBUS_BUDGET, TASK_LOW);
+    sched_register("retain", retain_task, RETAIN_ERASE_US, TASK_HIGH);
+}
 
-    async_end;
+void run_tasks(unsigned long dt, int run)
+{
+    sched_run(dt, run);
 }
@@ -2,8 +2,27 @@
 #define tasks_h
 
 #include "async.h"
+#include "task_sched.h"
 
-async run_tasks(unsigned long dt, int run_prog);
+/* us, longest expected call of built-in tasks */
+#ifndef TASK_SERIAL_BUDGET
+#define TASK_SERIAL_BUDGET      1000
+#endif
+
+#ifndef TASK_WIFI_BUDGET
+#define TASK_WIFI_BUDGET        1000
+#endif
 
+#ifndef TASK_ETH_BUDGET
+#define TASK_ETH_BUDGET         1000
 #endif
 
+#ifndef TASK_MODBUS_BUDGET
+#define TASK_MODBUS_BUDGET      500
+#endif
+
+/* built-in tasks, others may be registered with sched_register() after */
+void tasks_init(void);
+void run_tasks(unsigned long dt, int run_prog);
+
+#endif
@@ -21,6 +21,7 @@
 #include "iec_std_lib.h"
 
 void update_time(void);
+void advance_time(unsigned long us);
 
 IEC_TIME __CURRENT_TIME;
 IEC_BOOL __DEBUG;
@@ -32,3 +33,11 @@ void update_time(void)
 
     __CURRENT_TIME = __time_add(__CURRENT_TIME, ticktime);
 }
+
+/* tasks scheduled at their own interval, time follows the clock */
+void advance_time(unsigned long us)
+{
+    const TIME elapsed = {us / 1000000, (us % 1000000) * 1000};
+
+    __CURRENT_TIME = __time_add(__CURRENT_TIME, elapsed);
+}
@@ -20,6 +20,7 @@
 
 import argparse
 import asyncio
+from collections import deque
 from contextlib import suppress
 from functools import partial
 import hashlib
@@ -43,6 +44,12 @@ from serial import Serial, SerialException
 from min import MINTransport, MINConnectionError
 from runtime import PlcStatus
 import util.paths as paths
+from util.DeviceLog import ParseLogPage
+from util.POUProfile import ParseProfilePage
+from util.RetainImage import ParseRetainPage
+from util.ScanStats import ParseScanStats
+from util.TaskStats import ParseTaskPage
+from util.ClockSync import ClockSync, Unwrap32
 from util.ProcessLogger import ProcessLogger
 
 logging.basicConfig(level=logging.INFO)
@@ -55,6 +62,9 @@ TRAY_STOP_ICON = f'{ROOT}/images/icostop24.png'
 
 KEEP_ALIVE_PERIOD = 1.0
 IDLE_COUNT = 10
+SYNC_PERIOD = 1.0
+PROFILE_TIMEOUT = 2.0
+LOG_PERIOD = 1.0
 
 (MIN_KEEP_ALIVE,
  MIN_PLC_START,
@@ -66,11 +76,25 @@ IDLE_COUNT = 10
  MIN_PLC_SET_TRACE,
  MIN_PLC_GET_TRACE,
  MIN_PLC_WAIT_TRACE,
- MIN_PLC_RESET_TRACE) = range(0, 11)
+ MIN_PLC_RESET_TRACE,
+ MIN_PLC_SET_TRACES,
+ MIN_PLC_GET_PROFILE,
+ MIN_PLC_RESET_PROFILE,
+ MIN_PLC_GET_STATS,
+ MIN_PLC_GET_LOG,
+ MIN_PLC_GET_RETAIN,
+ MIN_PLC_GET_TASKS) = range(0, 18)
+
+MIN_MAX_PAYLOAD = 255
+BATCH_FIRST = 0x01
+BATCH_LAST = 0x02
+
+# same as matiec iec_types.h, STRING is length byte and buffer
+STR_MAX_LEN = 126
 
 IEC_SIZES = {'BOOL': 1, 'BYTE': 1, 'DATE': 8, 'DINT': 4, 'DT': 8, 'DWORD': 4,
              'INT': 2, 'LINT': 8, 'LREAL': 8, 'LWORD': 8, 'REAL': 4, 'SINT': 1,
-             'STRING': 1, 'TIME': 8, 'TOD': 8, 'UDINT': 4, 'UINT': 2,
+             'STRING': 1 + STR_MAX_LEN, 'TIME': 8, 'TOD': 8, 'UDINT': 4, 'UINT': 2,
              'ULINT': 8, 'USINT': 1, 'WORD': 2}
 
 IEC_FORMAT = {
@@ -86,7 +110,7 @@ IEC_FORMAT = {
     'LWORD': 'q',
     'REAL': 'f',
     'SINT': 'b',
-    'STRING': 's',
+    'STRING': 'B%ds' % STR_MAX_LEN,
     'TIME': 'Q',
     'TOD': 'Q',
     'UDINT': 'I',
@@ -97,6 +121,18 @@ IEC_FORMAT = {
 
 Pyro5.config.SERPENT_BYTES_REPR = True
 
+
+def pack_value(t, v):
+    """
+    Value of type t as laid out in PLC memory, get_var_size() bytes
+    """
+    if t == 'STRING':
+        data = v.encode() if isinstance(v, str) else bytes(v)
+        data = data[:STR_MAX_LEN]
+        return pack(IEC_FORMAT[t], len(data), data)
+    return pack(IEC_FORMAT[t], v)
+
+
 [ITEM_PLC_START, ITEM_PLC_STOP, ITEM_EXIT] = range(3)
 
 ITEM_PLC_STATE = {
@@ -179,6 +215,14 @@ class PLCObject():
         self.log = [[], [], [], []]
         self.wdir = wdir
         self.blobs = {}
+        self.profile = None
+        self.profile_event = threading.Event()
+        self.stats = None
+        self.stats_event = threading.Event()
+        self.retain = None
+        self.retain_event = threading.Event()
+        self.tasks = None
+        self.tasks_event = threading.Event()
 
         if os.path.exists(self.wdir):
             shutil.rmtree(self.wdir)
@@ -186,6 +230,10 @@ class PLCObject():
 
         pub.subscribe(self.set_plcstate, 'plc_state')
         pub.subscribe(self.log_msg, 'log_msg')
+        pub.subscribe(self.set_profile, 'pou_profile')
+        pub.subscribe(self.set_stats, 'scan_stats')
+        pub.subscribe(self.set_retain, 'retain_image')
+        pub.subscribe(self.set_tasks, 'task_stats')
 
     @expose
     def GetLogMessage(self, level, msgid):
@@ -286,6 +334,86 @@ class PLCObject():
 
         return 4
 
+    @expose
+    def GetPOUProfile(self, reset=False):
+        """
+        Return timer frequency and (count, min, max, total, self) of each
+        POU, profile is cleared first if reset is True
+        """
+        self.profile_event.clear()
+        self.profile = None
+
+        pub.sendMessage('run async cmd',
+                        e={'cmd': 'get_profile',
+                           'args': [reset]})
+
+        self.profile_event.wait(PROFILE_TIMEOUT * 4)
+        return self.profile
+
+    def set_profile(self, profile):
+        self.profile = profile
+        self.profile_event.set()
+
+    @expose
+    def GetPLCStats(self, reset=False, timeout=PROFILE_TIMEOUT * 2):
+        """
+        Return scan time statistics, see util.ScanStats, cleared once
+        read if reset is True, None if PLC didn't answer within timeout
+        """
+        self.stats_event.clear()
+        self.stats = None
+
+        pub.sendMessage('run async cmd',
+                        e={'cmd': 'get_stats',
+                           'args': [reset]})
+
+        self.stats_event.wait(timeout)
+        return self.stats
+
+    def set_stats(self, stats):
+        self.stats = stats
+        self.stats_event.set()
+
+    @expose
+    def GetRetainImage(self):
+        """
+        Return layout hash, records written, pages erased and image of
+        retained variables, see util.RetainImage
+        """
+        self.retain_event.clear()
+        self.retain = None
+
+        pub.sendMessage('run async cmd',
+                        e={'cmd': 'get_retain',
+                           'args': []})
+
+        self.retain_event.wait(PROFILE_TIMEOUT * 4)
+        return self.retain
+
+    def set_retain(self, retain):
+        self.retain = retain
+        self.retain_event.set()
+
+    @expose
+    def GetTaskStats(self, reset=False):
+        """
+        Return ms since counters reset and usage of background tasks, see
+        util.TaskStats, cleared once read if reset is True
+        """
+        self.tasks_event.clear()
+        self.tasks = None
+
+        pub.sendMessage('run async cmd',
+                        e={'cmd': 'get_tasks',
+                           'args': [reset]})
+
+        self.tasks_event.wait(PROFILE_TIMEOUT * 4)
+        return self.tasks
+
+    def set_tasks(self, tasks):
+        self.tasks = tasks
+        self.tasks_event.set()
+
     @expose
     def NewPLC(self, md5sum, plc_object, extrafiles):
         if self.plcstate not in [
@@ -371,8 +499,8 @@ class PLCObject():
 
         return False
 
-    def log_msg(self, level, msg, tick):
-        t = time_ns()
+    def log_msg(self, level, msg, tick, ts=None):
+        t = time_ns() if ts is None else ts
         s = t // 1000000000
         ns = t % 1000000000
 
@@ -473,9 +601,25 @@ class MINPLCObject(MINTransport):
         self.trace_list = []
         self.trace = {}
         self.trace_tick = 0
+        self.trace_ms = 0
+        self.tick_unwrap = Unwrap32()
+        self.clock = ClockSync()
+        self.sync_seq = 0
+        self.sync_sent = 0
         self.loop = None
         self.alive = None
         self.trace_ready = None
+        self.profile_ready = None
+        self.profile_page = b''
+        self.stats_ready = None
+        self.stats_payload = b''
+        self.log_ready = None
+        self.log_pages = deque()
+        self.log_dropped = 0
+        self.retain_ready = None
+        self.retain_page = b''
+        self.tasks_ready = None
+        self.tasks_page = b''
         self.queue = queue
 
         pub.subscribe(self.do_cmd, 'run async cmd')
@@ -491,6 +635,30 @@ class MINPLCObject(MINTransport):
             if self._ready:
                 asyncio.run_coroutine_threadsafe(self.set_trace(*a), self.loop)
 
+        elif e['cmd'] == 'get_profile':
+            if self._ready:
+                asyncio.run_coroutine_threadsafe(self.get_profile(*a), self.loop)
+            else:
+                pub.sendMessage('pou_profile', profile=None)
+
+        elif e['cmd'] == 'get_stats':
+            if self._ready:
+                asyncio.run_coroutine_threadsafe(self.get_stats(*a), self.loop)
+            else:
+                pub.sendMessage('scan_stats', stats=None)
+
+        elif e['cmd'] == 'get_retain':
+            if self._ready:
+                asyncio.run_coroutine_threadsafe(self.get_retain(*a), self.loop)
+            else:
+                pub.sendMessage('retain_image', retain=None)
+
+        elif e['cmd'] == 'get_tasks':
+            if self._ready:
+                asyncio.run_coroutine_threadsafe(self.get_tasks(*a), self.loop)
+            else:
+                pub.sendMessage('task_stats', tasks=None)
+
     def _now_ms(self):
         return int(time() * 1000.0)
 
@@ -525,28 +693,173 @@ class MINPLCObject(MINTransport):
 
         if not idxs:
             self.send_cmd(MIN_PLC_RESET_TRACE, b'')
-        else:
-            for ids, t, v in idxs:
-                self.trace_ids.append(ids)
-                # init trace
-                self.trace.update({ids: bytes(IEC_SIZES[t])})
+            return
+
+        entries = []
+        for ids, t, v in idxs:
+            self.trace_ids.append(ids)
+            # init trace
+            self.trace.update({ids: bytes(IEC_SIZES[t])})
+
+            e = pack('<HB', ids, v is not None)
+            if v is not None:
+                e += pack_value(t, v)
+            entries.append(e)
+
+        for p in self.pack_trace_batch(entries):
+            self.send_cmd(MIN_PLC_SET_TRACES, p)
+
+    @staticmethod
+    def pack_trace_batch(entries):
+        """
+        Pack trace entries densely into as few frames as possible, each
+        frame starts with flags telling the first and last frame of batch.
+        PLC only applies the whole list once the last frame is received.
+        """
+        frames = []
+        p = b''
+        for e in entries:
+            if len(p) + len(e) > MIN_MAX_PAYLOAD - 1:
+                frames.append(p)
+                p = b''
+            p += e
+        frames.append(p)
+
+        res = []
+        for i, p in enumerate(frames):
+            flags = ((BATCH_FIRST if i == 0 else 0)
+                     | (BATCH_LAST if i == len(frames) - 1 else 0))
+            res.append(pack('B', flags) + p)
+        return res
 
-                val = v
-                if v is None:
-                    if IEC_FORMAT[t] != 's':
-                        val = 0
-                    else:
-                        val = b''
+    async def get_profile(self, reset):
+        """
+        Read POU profile table, page by page
+        """
+        profile = None
+        self.profile_ready.clear()
 
-                p = (pack('I', ids)
-                     + pack('I', IEC_SIZES[t])
-                     + pack('?', v is not None)
-                     + pack(IEC_FORMAT[t], val))
+        if reset:
+            if not self.send_cmd(MIN_PLC_RESET_PROFILE, b'') or \
+               not await event_wait(self.profile_ready, PROFILE_TIMEOUT, clear=True):
+                await self.send_message('pou_profile', profile=None)
+                return
 
-                self.send_cmd(MIN_PLC_SET_TRACE, p)
+        entries = []
+        while True:
+            if not self.send_cmd(MIN_PLC_GET_PROFILE, pack('<H', len(entries))):
+                break
+            if not await event_wait(self.profile_ready, PROFILE_TIMEOUT, clear=True):
+                logging.error('No answer to POU profile request')
+                break
+            start, count, freq, page = ParseProfilePage(self.profile_page)
+            if start != len(entries):
+                break
+            entries += page
+            if len(entries) >= count:
+                profile = (freq, entries[:count])
+                break
+            if not page:
+                break
+
+        await self.send_message('pou_profile', profile=profile)
+
+    async def get_stats(self, reset):
+        stats = None
+        self.stats_ready.clear()
+
+        if self.send_cmd(MIN_PLC_GET_STATS, pack('B', reset)):
+            if await event_wait(self.stats_ready, PROFILE_TIMEOUT, clear=True):
+                stats = ParseScanStats(self.stats_payload)
+
+        await self.send_message('scan_stats', stats=stats)
+
+    async def get_log(self):
+        """
+        Drain log messages of PLC, page by page, into PLCObject log
+        """
+        more = True
+        while more:
+            # records sent are gone from PLC, a page answering a request
+            # that timed out is still used
+            if not self.log_pages:
+                self.log_ready.clear()
+                if not self.send_cmd(MIN_PLC_GET_LOG, b'') or \
+                   not await event_wait(self.log_ready, PROFILE_TIMEOUT, clear=True):
+                    return
+
+            dropped, more, records = ParseLogPage(self.log_pages.popleft())
+            for level, tick, ms, msg in records:
+                await self.send_message(
+                    'log_msg', level=level, msg=msg, tick=tick,
+                    ts=self.clock.to_wall_ns(self.clock.unwrap.nearest(ms)))
+
+            # counter restarts when PLC is reset
+            lost = dropped - self.log_dropped \
+                if dropped >= self.log_dropped else dropped
+            self.log_dropped = dropped
+            if lost:
+                await self.send_message(
+                    'log_msg', level=1,
+                    msg=f'{lost} PLC log messages dropped',
+                    tick=self.trace_tick)
+
+    async def get_retain(self):
+        """
+        Read retain image, page by page
+        """
+        retain = None
+        image = b''
+        while True:
+            self.retain_ready.clear()
+            if not self.send_cmd(MIN_PLC_GET_RETAIN, pack('<H', len(image))):
+                break
+            if not await event_wait(self.retain_ready, PROFILE_TIMEOUT, clear=True):
+                logging.error('No answer to retain image request')
+                break
+            offset, size, hashval, records, erases, data = \
+                ParseRetainPage(self.retain_page)
+            if offset != len(image):
+                break
+            image += data
+            if len(image) >= size:
+                retain = (hashval, records, erases, image[:size])
+                break
+            if not data:
+                break
+
+        await self.send_message('retain_image', retain=retain)
+
+    async def get_tasks(self, reset):
+        """
+        Read background task usage, page by page
+        """
+        tasks = None
+        entries = []
+        while True:
+            self.tasks_ready.clear()
+            if not self.send_cmd(MIN_PLC_GET_TASKS,
+                                 pack('<HB', len(entries), reset)):
+                break
+            if not await event_wait(self.tasks_ready, PROFILE_TIMEOUT, clear=True):
+                logging.error('No answer to task usage request')
+                break
+            start, count, elapsed, page = ParseTaskPage(self.tasks_page)
+            if start != len(entries):
+                break
+            entries += page
+            if len(entries) >= count:
+                tasks = (elapsed, entries[:count])
+                break
+            if not page:
+                break
+
+        await self.send_message('task_stats', tasks=tasks)
 
     async def run_plc(self, state):
         if state:
+            # PLC init resets tick
+            self.tick_unwrap.reset()
             self.send_cmd(MIN_PLC_INIT, b'')
             self.send_cmd(MIN_PLC_START, b'')
         else:
@@ -555,6 +868,7 @@ class MINPLCObject(MINTransport):
     async def task_poll(self):
         while not self._abort and self._run:
             frames = self.poll()
+            now = time_ns()
             if frames:
                 self.alive.set()
 
@@ -575,13 +889,55 @@ class MINPLCObject(MINTransport):
                             state=PlcStatus.Stopped,
                             tick=self.trace_tick))
 
+                elif frame.min_id == MIN_KEEP_ALIVE:
+                    if len(frame.payload) == 12:
+                        seq, _tick, ms = unpack('III', frame.payload)
+                        if seq and seq == self.sync_seq:
+                            self.sync_seq = 0
+                            self.clock.add(self.sync_sent, now, ms)
+
                 elif frame.min_id == MIN_PLC_TICK:
-                    self.trace_tick = unpack('I', frame.payload)[0]
+                    tick = unpack('I', frame.payload[:4])[0]
+                    self.trace_tick = self.tick_unwrap(tick)
+                    if len(frame.payload) >= 8:
+                        self.trace_ms = self.clock.unwrap(
+                            unpack('I', frame.payload[4:8])[0])
+
+                elif frame.min_id == MIN_PLC_SET_TRACES:
+                    if frame.payload[:1] != b'\x00':
+                        stdout_write('Debug trace list too large for PLC.\n')
+                        asyncio.create_task(
+                            self.send_message(
+                                'log_msg',
+                                level=0,
+                                msg='Debug trace list too large',
+                                tick=self.trace_tick))
 
                 elif frame.min_id == MIN_PLC_GET_TRACE:
                     self.trace.update({self.trace_id: frame.payload})
                     self.trace_ready.set()
 
+                elif frame.min_id in (MIN_PLC_GET_PROFILE,
+                                      MIN_PLC_RESET_PROFILE):
+                    self.profile_page = frame.payload
+                    self.profile_ready.set()
+
+                elif frame.min_id == MIN_PLC_GET_STATS:
+                    self.stats_payload = frame.payload
+                    self.stats_ready.set()
+
+                elif frame.min_id == MIN_PLC_GET_LOG:
+                    self.log_pages.append(frame.payload)
+                    self.log_ready.set()
+
+                elif frame.min_id == MIN_PLC_GET_RETAIN:
+                    self.retain_page = frame.payload
+                    self.retain_ready.set()
+
+                elif frame.min_id == MIN_PLC_GET_TASKS:
+                    self.tasks_page = frame.payload
+                    self.tasks_ready.set()
+
             await asyncio.sleep(0.01)
 
         return not self._abort
@@ -591,6 +947,10 @@ class MINPLCObject(MINTransport):
         await event_wait(self.alive, None)
         if not self.send_cmd(MIN_PLC_RESET, b''):
             return False
+        self.clock.reset()
+        self.tick_unwrap.reset()
+        self.log_dropped = 0
+        self.log_pages.clear()
 
         asyncio.create_task(
             self.send_message(
@@ -620,6 +980,25 @@ class MINPLCObject(MINTransport):
 
         return not self._abort
 
+    async def task_clock_sync(self):
+        seq = 0
+        while not self._abort and self._run:
+            if self._ready:
+                # unreliable frame, goes on the wire right now
+                seq = seq % 0xffffffff + 1
+                self.sync_seq = seq
+                self.sync_sent = time_ns()
+                self.send_frame(MIN_KEEP_ALIVE, pack('I', seq))
+
+            await asyncio.sleep(SYNC_PERIOD)
+
+    async def task_log(self):
+        while not self._abort and self._run:
+            if self._ready:
+                await self.get_log()
+
+            await asyncio.sleep(LOG_PERIOD)
+
     async def send_message(self, arg, **kwargs):
         await self.loop.run_in_executor(None, partial(pub.sendMessage,
                                                       arg, **kwargs))
@@ -656,6 +1035,7 @@ class MINPLCObject(MINTransport):
                 await event_wait(self.trace_ready, None, clear=True)
 
                 tick = self.trace_tick
+                ms = self.trace_ms
 
                 for self.trace_id in self.trace_ids[1:]:
 
@@ -681,10 +1061,12 @@ class MINPLCObject(MINTransport):
                                 'log_msg',
                                 level=1,
                                 msg='Debug Trace Period too slow',
-                                tick=0))
+                                tick=self.trace_tick,
+                                ts=self.clock.to_wall_ns(self.trace_ms)))
 
                 v = b''.join(self.trace.values())
-                asyncio.create_task(self.send_trace((tick, v)))
+                ts = self.clock.to_wall_ns(ms)
+                asyncio.create_task(self.send_trace((tick, v, ts)))
 
             await asyncio.sleep(0.01)
 
@@ -692,13 +1074,22 @@ class MINPLCObject(MINTransport):
         self.loop = asyncio.get_running_loop()
         self.alive = asyncio.Event()
         self.trace_ready = asyncio.Event()
+        self.profile_ready = asyncio.Event()
+        self.stats_ready = asyncio.Event()
+        self.log_ready = asyncio.Event()
+        self.retain_ready = asyncio.Event()
+        self.tasks_ready = asyncio.Event()
 
         main = asyncio.create_task(self.task_main())
+        sync = asyncio.create_task(self.task_clock_sync())
+        log = asyncio.create_task(self.task_log())
 
         res = await asyncio.gather(self.task_poll(),
                                    self.task_keepalive())
 
         main.cancel()
+        sync.cancel()
+        log.cancel()
         self.send_frame(MIN_PLC_RESET, b'')
 
         return res
@@ -0,0 +1,696 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Simulated PlatformIO board.
+
+Loads the shared library of a PLC built for the Native platform, runs it
+at common_ticktime__ as plc_main.cpp does, and answers the MIN commands of
+platformio/src/serial.cpp on a pseudo-terminal. service_pio.py connects to
+the printed serial port exactly as it connects to a board, so debug
+performance can be measured without hardware.
+
+    simulator_pio.py [--link /tmp/plc] BUILD_DIR
+    service_pio.py -x 0 -p 61131 -i localhost TMP_DIR /tmp/plc
+
+Forcing and tracing go through the debugger of the Native build, traced
+values being those published at the end of the last scan.
+"""
+
+
+import argparse
+from collections import deque
+import ctypes
+import glob
+import logging
+import os
+import select
+import tty
+from struct import pack, unpack_from
+from time import monotonic
+
+from min import MINTransport
+from runtime.typemapping import DebugTypesSize, IEC_TIME
+from util.VariablesTable import LoadVariablesTable
+from util.DeviceLog import LOG_MSG_SIZE, LOG_RECORD, PackLogPage
+from util.POUProfile import PROFILE_HEADER, PROFILE_ENTRY, PROFILE_PAGE
+from util.ScanStats import JITTER_BOUNDS, JitterBucket, PackScanStats
+from util.RetainImage import RETAIN_HEADER
+from util.TaskStats import TASK_INFO, TASK_ENTRY, TASK_PAGE, TASK_PRIORITIES
+
+logging.basicConfig(level=logging.INFO)
+
+# same as platformio/src/serial.cpp
+(MIN_KEEP_ALIVE,
+ MIN_PLC_START,
+ MIN_PLC_STOP,
+ MIN_PLC_RESET,
+ MIN_PLC_INIT,
+ MIN_PLC_UPLOAD,
+ MIN_PLC_TICK,
+ MIN_PLC_SET_TRACE,
+ MIN_PLC_GET_TRACE,
+ MIN_PLC_WAIT_TRACE,
+ MIN_PLC_RESET_TRACE,
+ MIN_PLC_SET_TRACES,
+ MIN_PLC_GET_PROFILE,
+ MIN_PLC_RESET_PROFILE,
+ MIN_PLC_GET_STATS,
+ MIN_PLC_GET_LOG,
+ MIN_PLC_GET_RETAIN,
+ MIN_PLC_GET_TASKS) = range(0, 18)
+
+BATCH_FIRST = 0x01
+BATCH_LAST = 0x02
+TRACE_BATCH_SIZE = 512
+
+# same as platformio/src/serial.h, in ms
+MIN_TIMEOUT = 2000
+
+# same as platformio/src/logbuf.h
+LOG_BUFFER_SIZE = 512
+
+# same as platformio/src/tasks.h, in us
+TASK_SERIAL_BUDGET = 1000
+
+# longest wait for serial data while MIN has frames to send, in s
+MIN_POLL_PERIOD = 0.001
+
+
+class NativePLC():
+    """
+    Shared library of a Native build, scans being run by caller
+    """
+
+    def __init__(self, libpath, csvfile):
+        table = LoadVariablesTable(csvfile, DebugTypesSize)
+        self.types = [v["type"] for v in table.debug_variables]
+        table.close()
+
+        self.lib = lib = ctypes.CDLL(os.path.abspath(libpath))
+
+        # names starting with __ would be mangled as attributes
+        self._init = getattr(lib, "__init")
+        self._init.restype = ctypes.c_int
+        self._init.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_char_p)]
+        self._run = getattr(lib, "__run")
+        self._run.restype = None
+        self._cleanup = getattr(lib, "__cleanup")
+        self._cleanup.restype = None
+
+        lib.config_init__.restype = None
+        lib.PLC_GetTime.restype = None
+        lib.PLC_GetTime.argtypes = [ctypes.POINTER(IEC_TIME)]
+
+        lib.ResetDebugVariables.restype = None
+        lib.RegisterDebugVariable.restype = ctypes.c_int
+        lib.RegisterDebugVariable.argtypes = [ctypes.c_uint, ctypes.c_void_p]
+        lib.FreeDebugData.restype = None
+        lib.WaitDebugData.restype = ctypes.c_int
+        lib.WaitDebugData.argtypes = [ctypes.POINTER(ctypes.c_ulong)]
+        lib.GetDebugData.restype = ctypes.c_int
+        lib.GetDebugData.argtypes = [ctypes.POINTER(ctypes.c_ulong),
+                                     ctypes.POINTER(ctypes.c_ulong),
+                                     ctypes.POINTER(ctypes.c_void_p)]
+        lib.suspendDebug.restype = ctypes.c_int
+        lib.suspendDebug.argtypes = [ctypes.c_int]
+        lib.resumeDebug.restype = None
+
+        # only in builds with POU profiling enabled
+        try:
+            lib.profile_count.restype = ctypes.c_uint16
+            lib.profile_freq.restype = ctypes.c_uint32
+            lib.profile_read.restype = None
+            lib.profile_read.argtypes = [ctypes.c_uint16, ctypes.c_char_p]
+            lib.profile_reset.restype = None
+            self.profiled = True
+        except AttributeError:
+            self.profiled = False
+
+        # not in builds with TARGET_LOGGING_DISABLE
+        try:
+            lib.GetLogCount.restype = ctypes.c_uint32
+            lib.GetLogCount.argtypes = [ctypes.c_uint8]
+            lib.GetLogMessage.restype = ctypes.c_uint32
+            lib.GetLogMessage.argtypes = [
+                ctypes.c_uint8, ctypes.c_uint32, ctypes.c_char_p,
+                ctypes.c_uint32, ctypes.POINTER(ctypes.c_uint32),
+                ctypes.POINTER(ctypes.c_uint32), ctypes.POINTER(ctypes.c_uint32)]
+            self.logging = True
+        except AttributeError:
+            self.logging = False
+        self.log_count = [0] * 4
+
+        self._tick = ctypes.c_ulong.in_dll(lib, "__tick")
+        self._ticktime = ctypes.c_ulonglong.in_dll(lib, "common_ticktime__")
+        self._current_time = IEC_TIME.in_dll(lib, "__CURRENT_TIME")
+
+        argv = (ctypes.c_char_p * 1)(None)
+        res = self._init(0, argv)
+        if res:
+            raise RuntimeError(f"PLC initialization failed ({res})")
+
+        # Debugger signals published data by unlocking this mutex, taken
+        # here once as the runtime PLC thread would. Scans run in caller's
+        # thread, so data is always read before next scan publishes again.
+        lib.WaitDebugData(ctypes.byref(ctypes.c_ulong()))
+
+        self.debug = False
+        self.traced = []
+        self.values = {}
+
+    @property
+    def tick(self):
+        return self._tick.value
+
+    @property
+    def ticktime(self):
+        """
+        Scan period in s
+        """
+        return self._ticktime.value / 1e9
+
+    def init(self):
+        self.lib.config_init__()
+        self._tick.value = 0
+
+    def scan(self):
+        self.lib.PLC_GetTime(ctypes.byref(self._current_time))
+        self._run()
+
+        if self.debug:
+            tick = ctypes.c_ulong()
+            size = ctypes.c_ulong()
+            buff = ctypes.c_void_p()
+            if self.lib.GetDebugData(ctypes.byref(tick), ctypes.byref(size),
+                                     ctypes.byref(buff)) == 0:
+                self.values = self._split(ctypes.string_at(buff, size.value))
+                self.lib.FreeDebugData()
+
+    def _split(self, data):
+        values = {}
+        offset = 0
+        for idx in self.traced:
+            if self.types[idx] == "STRING":
+                # strings are published up to their length
+                size = data[offset] + 1 if offset < len(data) else 0
+            else:
+                size = DebugTypesSize[self.types[idx]]
+            values[idx] = data[offset:offset + size]
+            offset += size
+        return values
+
+    def size(self, idx):
+        if idx < len(self.types):
+            return DebugTypesSize.get(self.types[idx], 0)
+        return 0
+
+    def value(self, idx):
+        """
+        Value of given debug variable at end of last scan
+        """
+        value = self.values.get(idx)
+        if value is None:
+            value = bytes(self.size(idx))
+        return value
+
+    def set_traces(self, entries):
+        """
+        Replace traced variables list by entries, (index, forced value)
+        tuples, forced value being None for not forced variables.
+        Return 0 on success.
+        """
+        status = 0
+        traced = []
+
+        if not entries:
+            # disable debugger
+            self.lib.suspendDebug(1)
+            self.lib.ResetDebugVariables()
+        else:
+            # suspend but don't disable
+            self.lib.suspendDebug(0)
+            self.lib.ResetDebugVariables()
+            for idx, force in entries:
+                if not self.size(idx):
+                    continue
+                if force is not None:
+                    force = ctypes.create_string_buffer(
+                        force.ljust(self.size(idx), b'\0'))
+                if self.lib.RegisterDebugVariable(idx, force) != 0:
+                    # list was reset by debugger
+                    status = 1
+                    traced = []
+                    break
+                traced.append(idx)
+            self.lib.resumeDebug()
+
+        self.debug = bool(entries)
+        self.traced = traced
+        self.values = {}
+        return status
+
+    def logs(self):
+        """
+        Messages logged since last call, as (level, tick, msg)
+        """
+        logs = []
+        if not self.logging:
+            return logs
+        buf = ctypes.create_string_buffer(LOG_MSG_SIZE)
+        tick, sec, nsec = ctypes.c_uint32(), ctypes.c_uint32(), ctypes.c_uint32()
+        for level in range(len(self.log_count)):
+            count = self.lib.GetLogCount(level)
+            for idx in range(self.log_count[level], count):
+                size = self.lib.GetLogMessage(
+                    level, idx, buf, LOG_MSG_SIZE, ctypes.byref(tick),
+                    ctypes.byref(sec), ctypes.byref(nsec))
+                msg = buf.raw[:size].rstrip(b'\0').decode(errors="replace")
+                logs.append((level, tick.value, msg))
+            self.log_count[level] = count
+        return logs
+
+    def profile(self, start):
+        """
+        Page of POU profile table starting at given POU, as sent by board
+        """
+        if not self.profiled:
+            return PROFILE_HEADER.pack(start, 0, 0)
+        count = self.lib.profile_count()
+        page = PROFILE_HEADER.pack(start, count, self.lib.profile_freq())
+        buf = ctypes.create_string_buffer(PROFILE_ENTRY.size)
+        for idx in range(start, min(count, start + PROFILE_PAGE)):
+            self.lib.profile_read(idx, buf)
+            page += buf.raw
+        return page
+
+    def profile_reset(self):
+        if self.profiled:
+            self.lib.profile_reset()
+
+    def close(self):
+        if self.debug:
+            self.lib.suspendDebug(1)
+        self._cleanup()
+
+
+class MINSimulator(MINTransport):
+    """
+    Board side of serial.cpp MIN protocol, on a pseudo-terminal
+    """
+
+    def __init__(self, plc, link=None, loglevel=logging.ERROR):
+        self.start_time = monotonic()
+
+        self.master, self.slave = os.openpty()
+        # no echo nor line discipline, bytes go through as on a UART
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        self.link = link
+        if link is not None:
+            if os.path.lexists(link):
+                os.unlink(link)
+            os.symlink(self.port, link)
+
+        super().__init__(loglevel=loglevel)
+
+        self.plc = plc
+        self.running = False
+        self.shutdown = False
+        self.keepalive = -MIN_TIMEOUT
+        self.last_tick = None
+        self.wait_idx = None
+        self.traces = {}
+        self.batch = b''
+        self.batch_overflow = False
+        self.tick_ms = 0
+        self.reset_stats()
+        self.reset_logs()
+        self.reset_tasks()
+
+    def _now_ms(self):
+        return int((monotonic() - self.start_time) * 1000)
+
+    def millis(self):
+        return self._now_ms() & 0xffffffff
+
+    def _serial_write(self, data):
+        try:
+            os.write(self.master, data)
+        except BlockingIOError:
+            # nobody reads the port, drop as a UART would
+            pass
+
+    def _serial_any(self):
+        return bool(select.select([self.master], [], [], 0)[0])
+
+    def _serial_read_all(self):
+        try:
+            return os.read(self.master, 4096)
+        except (BlockingIOError, OSError):
+            return b''
+
+    def _serial_close(self):
+        if self.link is not None and os.path.islink(self.link):
+            os.unlink(self.link)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def queue_tick(self):
+        self.queue_frame(MIN_PLC_TICK,
+                         pack('II', self.plc.tick & 0xffffffff, self.tick_ms))
+
+    def queue_trace(self, idx):
+        self.queue_frame(MIN_PLC_GET_TRACE, self.plc.value(idx))
+
+    def watch(self, idx):
+        """
+        Board reads any variable, debugger only publishes registered ones
+        """
+        if idx not in self.traces and self.plc.size(idx):
+            self.traces[idx] = None
+            self.apply_traces()
+
+    def apply_traces(self):
+        entries = sorted(self.traces.items())
+        return self.plc.set_traces(entries)
+
+    def set_traces(self, payload):
+        flags = payload[0]
+        if flags & BATCH_FIRST:
+            self.batch = b''
+            self.batch_overflow = False
+
+        if len(self.batch) + len(payload) - 1 > TRACE_BATCH_SIZE:
+            self.batch_overflow = True
+        else:
+            self.batch += payload[1:]
+
+        if not flags & BATCH_LAST:
+            return
+
+        status = int(self.batch_overflow)
+        if not status:
+            self.traces = {}
+            i = 0
+            while i + 3 <= len(self.batch):
+                idx, forced = unpack_from('<HB', self.batch, i)
+                i += 3
+                size = self.plc.size(idx) if forced else 0
+                if i + size > len(self.batch):
+                    break
+                self.traces[idx] = self.batch[i:i + size] if forced else None
+                i += size
+            status = self.apply_traces()
+
+        self.queue_frame(MIN_PLC_SET_TRACES, pack('B', status))
+
+    def reset_stats(self):
+        self.scan_count = 0
+        self.scan_min = 0
+        self.scan_max = 0
+        self.scan_total = 0
+        self.overruns = 0
+        self.jitter = [0] * (len(JITTER_BOUNDS) + 1)
+
+    def record_scan(self, late, elapsed):
+        """
+        record_scan() of plc_main.cpp, times in s
+        """
+        late, elapsed = int(late * 1e6), int(elapsed * 1e6)
+        self.jitter[JitterBucket(late)] += 1
+        if self.scan_count == 0 or elapsed < self.scan_min:
+            self.scan_min = elapsed
+        self.scan_max = max(self.scan_max, elapsed)
+        self.scan_count += 1
+        self.scan_total += elapsed
+
+    def queue_stats(self, reset):
+        self.queue_frame(MIN_PLC_GET_STATS, PackScanStats(
+            self.scan_count & 0xffffffff, self.scan_min, self.scan_max,
+            self.scan_total, self.overruns & 0xffffffff,
+            int(self.plc.ticktime * 1e6), self.jitter))
+        if reset:
+            self.reset_stats()
+
+    def reset_logs(self):
+        self.log_records = deque()
+        self.log_used = 0
+        self.log_dropped = 0
+
+    def collect_logs(self):
+        """
+        LogMessage() of logbuf.cpp, messages that don't fit are dropped
+        """
+        for level, tick, msg in self.plc.logs():
+            size = LOG_RECORD.size + len(msg.encode()[:LOG_MSG_SIZE])
+            if self.log_used + size > LOG_BUFFER_SIZE:
+                self.log_dropped += 1
+                continue
+            self.log_records.append((level, tick, self.millis(), msg))
+            self.log_used += size
+
+    def queue_log(self):
+        page, count = PackLogPage(self.log_dropped, self.log_records)
+        for _i in range(count):
+            _level, _tick, _ms, msg = self.log_records.popleft()
+            self.log_used -= LOG_RECORD.size + len(msg.encode()[:LOG_MSG_SIZE])
+        self.queue_frame(MIN_PLC_GET_LOG, page)
+
+    def reset_tasks(self):
+        self.tasks_since = self._now_ms()
+        self.serial_calls = 0
+        self.serial_total = 0
+        self.serial_max = 0
+        self.serial_overruns = 0
+
+    def record_serial(self, elapsed):
+        """
+        sched_run() of task_sched.c, serial being the only task, time in s
+        """
+        elapsed = int(elapsed * 1e6)
+        self.serial_calls += 1
+        self.serial_total += elapsed
+        self.serial_max = max(self.serial_max, elapsed)
+        if elapsed > TASK_SERIAL_BUDGET:
+            self.serial_overruns += 1
+
+    def queue_tasks(self, start, reset):
+        """
+        queue_tasks() of serial.cpp, other tasks of board don't exist here
+        """
+        tasks = [TASK_ENTRY.pack(
+            b"serial", TASK_PRIORITIES.index("high"), TASK_SERIAL_BUDGET,
+            self.serial_calls & 0xffffffff, self.serial_total, self.serial_max,
+            self.serial_overruns & 0xffffffff, 0)]
+        page = TASK_INFO.pack(start, len(tasks),
+                              (self._now_ms() - self.tasks_since) & 0xffffffff)
+        page += b''.join(tasks[start:start + TASK_PAGE])
+        if reset and start + TASK_PAGE >= len(tasks):
+            self.reset_tasks()
+        self.queue_frame(MIN_PLC_GET_TASKS, page)
+
+    def handle(self, frame):
+        """
+        min_application_handler() and min_task() of serial.cpp
+        """
+        min_id, payload = frame.min_id, frame.payload
+        self.keepalive = self._now_ms()
+
+        if min_id == MIN_KEEP_ALIVE:
+            # answer at once with echoed sequence, tick and time
+            seq = payload[:4] if len(payload) >= 4 else bytes(4)
+            self.send_frame(
+                MIN_KEEP_ALIVE,
+                seq + pack('II', self.plc.tick & 0xffffffff, self.millis()))
+
+        elif min_id == MIN_PLC_SET_TRACE:
+            idx = unpack_from('I', payload)[0]
+            forced = bool(payload[8])
+            self.traces[idx] = bytes(payload[9:9 + self.plc.size(idx)]) \
+                if forced else None
+            self.apply_traces()
+
+        elif min_id == MIN_PLC_SET_TRACES and payload:
+            self.set_traces(payload)
+
+        elif min_id == MIN_PLC_START:
+            self.running = True
+            self.queue_frame(MIN_PLC_START, b'')
+
+        elif min_id == MIN_PLC_STOP:
+            self.running = False
+            self.queue_frame(MIN_PLC_STOP, b'')
+
+        elif min_id == MIN_PLC_RESET:
+            self.reset()
+
+        elif min_id == MIN_PLC_INIT:
+            self.plc.init()
+
+        elif min_id == MIN_PLC_UPLOAD:
+            # no bootloader, firmware is the loaded library
+            pass
+
+        elif min_id == MIN_PLC_WAIT_TRACE:
+            self.wait_idx = unpack_from('H', payload)[0]
+            self.watch(self.wait_idx)
+            self.last_tick = self.plc.tick
+
+        elif min_id == MIN_PLC_GET_TRACE:
+            idx = unpack_from('H', payload)[0]
+            self.watch(idx)
+            if self.plc.tick != self.last_tick:
+                self.last_tick = self.plc.tick
+                self.queue_tick()
+            self.queue_trace(idx)
+
+        elif min_id == MIN_PLC_RESET_TRACE:
+            self.traces = {}
+            self.apply_traces()
+
+        elif min_id == MIN_PLC_GET_PROFILE:
+            start = unpack_from('H', payload)[0] if len(payload) >= 2 else 0
+            self.queue_frame(MIN_PLC_GET_PROFILE, self.plc.profile(start))
+
+        elif min_id == MIN_PLC_RESET_PROFILE:
+            self.plc.profile_reset()
+            self.queue_frame(MIN_PLC_RESET_PROFILE, b'')
+
+        elif min_id == MIN_PLC_GET_STATS:
+            self.queue_stats(bool(payload[:1] and payload[0]))
+
+        elif min_id == MIN_PLC_GET_LOG:
+            self.queue_log()
+
+        elif min_id == MIN_PLC_GET_RETAIN:
+            # no flash to retain variables in, answer as retain_read() of
+            # a board without retained variable : empty image
+            offset = unpack_from('<H', payload)[0] if len(payload) >= 2 else 0
+            self.queue_frame(MIN_PLC_GET_RETAIN,
+                             RETAIN_HEADER.pack(offset, 0, 0, 0, 0))
+
+        elif min_id == MIN_PLC_GET_TASKS:
+            start = unpack_from('<H', payload)[0] if len(payload) >= 2 else 0
+            self.queue_tasks(start, len(payload) >= 3 and bool(payload[2]))
+
+        else:
+            self.queue_frame(MIN_KEEP_ALIVE, b'')
+
+    def reset(self):
+        """
+        Same state as a board coming out of reset
+        """
+        self.running = False
+        self.wait_idx = None
+        self.traces = {}
+        self.apply_traces()
+        self.plc.init()
+        self.reset_stats()
+        self.plc.logs()
+        self.reset_logs()
+        self.reset_tasks()
+        self.last_tick = None
+        # announced at once by keep alive
+        self.keepalive = self._now_ms() - MIN_TIMEOUT - 1
+
+    def run(self):
+        """
+        loop() of plc_main.cpp, serial task being run between scans
+        """
+        period = self.plc.ticktime
+        next_scan = monotonic() + period
+
+        while not self.shutdown:
+            now = monotonic()
+            if now >= next_scan:
+                late = now - next_scan
+                next_scan += period
+                if self.running:
+                    self.tick_ms = self.millis()
+                    self.plc.scan()
+                    end = monotonic()
+                    # late scans are caught up, next one is already due
+                    if end >= next_scan:
+                        self.overruns += 1
+                    self.record_scan(late, end - now)
+                    self.collect_logs()
+
+            if self.wait_idx is not None and self.plc.tick != self.last_tick:
+                self.last_tick = self.plc.tick
+                self.queue_tick()
+                self.queue_trace(self.wait_idx)
+                self.wait_idx = None
+
+            start = monotonic()
+            for frame in self.poll():
+                self.handle(frame)
+            self.record_serial(monotonic() - start)
+
+            # keep alive
+            if self._now_ms() - self.keepalive > MIN_TIMEOUT:
+                self.keepalive = self._now_ms()
+                self.transport_reset()
+                self.queue_frame(MIN_KEEP_ALIVE, b'')
+
+            timeout = max(0, next_scan - monotonic())
+            if self._transport_fifo:
+                timeout = min(timeout, MIN_POLL_PERIOD)
+            select.select([self.master], [], [], timeout)
+
+
+def FindNativeLibrary(buildpath):
+    libs = [p for ext in (".so", ".dylib", ".dynlib", ".dll")
+            for p in glob.glob(os.path.join(buildpath, "pio", "default", "*" + ext))]
+    return libs[0] if libs else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lib',
+                        help='PLC shared library, default is the one in build folder')
+    parser.add_argument('--link',
+                        help='symbolic link to create to simulated serial port')
+    parser.add_argument('-v', action='store_true',
+                        help='log MIN frames')
+    parser.add_argument('buildpath',
+                        help='build folder of a project built for Native platform')
+    args = parser.parse_args()
+
+    libpath = args.lib or FindNativeLibrary(args.buildpath)
+    if libpath is None:
+        parser.error(f'no Native PLC library in {args.buildpath}')
+
+    plc = NativePLC(libpath, os.path.join(args.buildpath, "VARIABLES.csv"))
+    sim = MINSimulator(plc, args.link,
+                       loglevel=logging.DEBUG if args.v else logging.ERROR)
+
+    logging.info('Simulated PLC serial port : %s', args.link or sim.port)
+    logging.info('Scan period : %g ms', plc.ticktime * 1000)
+
+    try:
+        sim.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        plc.close()
+        sim.close()
@@ -29,7 +29,7 @@
 from os import listdir, path
 import util.paths as paths
 import importlib
-from .toolchain_pio import XSD as PIO_XSD
+from .toolchain_pio import XSD as PIO_XSD, pio_env
 import sys
 
 _base_path = paths.AbsDir(__file__)
@@ -45,6 +45,26 @@ def GetTargetChoices():
     return PIO_XSD
 
 
+def GetBoards():
+    return list(pio_env)
+
+
+def GetBoardName(name):
+    """
+    Return board name as in target XSD, given it or its PlatformIO env name
+    """
+    if name in pio_env:
+        return name
+    for board, env in pio_env.items():
+        if env == name:
+            return board
+    return None
+
+
+def GetBoardEnv(board):
+    return pio_env.get(board)
+
+
 def GetTargetCode(targetname):
 
     name = "Linux"
@@ -21,6 +21,7 @@ from configparser import ConfigParser
 import os
 import shutil
 from util.ProcessLogger import ProcessLogger
+from util.BuildGraph import ContentDigest, FileDigest, TreeDigest, WriteIfChanged
 import util.paths as paths
 
 base_folder = paths.AbsParentDir(__file__)
@@ -65,6 +66,15 @@ XSD = f'''
                       </xsd:element>
                     </xsd:sequence>
                     <xsd:attribute name="Enable_Debug" type="xsd:boolean"/>
+                    <xsd:attribute name="Debug_Scope" use="optional" default="All">
+                      <xsd:simpleType>
+                        <xsd:restriction base="xsd:string">
+                          <xsd:enumeration value="All"/>
+                          <xsd:enumeration value="Programs"/>
+                        </xsd:restriction>
+                      </xsd:simpleType>
+                    </xsd:attribute>
+                    <xsd:attribute name="Debug_Variables" type="xsd:string" use="optional" default=""/>
                   </xsd:complexType>
                 </xsd:element>
               </xsd:choice>
@@ -72,6 +82,7 @@ XSD = f'''
           </xsd:element>
         </xsd:sequence>
         <xsd:attribute name="Verbose_Mode" type="xsd:boolean"/>
+        <xsd:attribute name="Enable_Profiling" type="xsd:boolean" use="optional" default="false"/>
       </xsd:complexType>
     </xsd:element>
 '''
@@ -85,6 +96,7 @@ class toolchain_pio():
         self.SetBuildPath(self.CTRInstance._getBuildPath())
         self.bin = ""
         self.bin_path = ""
+        self.include_path = None
 
     def SetBuildPath(self, buildpath):
         if not os.path.isabs(buildpath):
@@ -117,6 +129,18 @@ class toolchain_pio():
                 return None
 
     def build(self):
+        job = self.PrepareBuild()
+        if job is None:
+            return False
+        if self.IsUpToDate(job):
+            return True
+        return self.FinishBuild(job, self.StartBuild(job))
+
+    def PrepareBuild(self):
+        """
+        Collect sources and PlatformIO environment of current target.
+        Return build job, None if target cannot be built.
+        """
         src = []
         for _, files, _ in self.CTRInstance.LocationCFilesAndCFLAGS:
             for cfile, _ in files:
@@ -152,7 +176,7 @@ class toolchain_pio():
             if not board:
                 self.CTRInstance.logger.write_error(
                     "Please select an embedded board first.\n")
-                return False
+                return None
 
             self.bin = "firmware.bin"
 
@@ -169,10 +193,15 @@ class toolchain_pio():
             self.bin_path = os.path.join(
                 self.buildpath, 'pio', pio_env[board], self.bin)
 
-            with open(os.path.join(self.buildpath,
-                                   'extra_files',
-                                   f'env.{pio_env[board]}'), 'w') as f:
-                f.write(str(env))
+        # headers shared with other builds, i.e. in build matrix
+        if self.include_path is not None:
+            env['PLATFORMIO_BUILD_FLAGS'] = f'-I {self.include_path}'
+
+        if platform == 'Embedded':
+            os.makedirs(os.path.join(self.buildpath, 'extra_files'), exist_ok=True)
+            WriteIfChanged(os.path.join(self.buildpath,
+                                        'extra_files',
+                                        f'env.{pio_env[board]}'), str(env))
 
         command = ['pio', 'run']
         if verbose:
@@ -182,16 +211,56 @@ class toolchain_pio():
 
         cwd = os.path.join(base_folder, "platformio")
 
-        status, _result, _err_result = ProcessLogger(
-            self.CTRInstance.logger, command, cwd=cwd,
-            env={**os.environ, **env}).spin()
+        job = {
+            'platform': platform,
+            'env': env,
+            'command': command,
+            'cwd': cwd,
+            'graph': self.CTRInstance.BuildGraph,
+        }
+        if job['graph'] is not None:
+            job['inputs'] = self._GetStageInputs(src, env, command, cwd)
+        return job
+
+    def IsUpToDate(self, job):
+        """
+        Tell if PlatformIO can be skipped entirely,
+        nothing it depends on changed since last build
+        """
+        graph = job['graph']
+        if graph is None:
+            return False
+        if graph.UpToDate("C build", job['inputs']):
+            self.md5key = self.GetBinaryMD5()
+            if self.md5key is not None:
+                self.CTRInstance.logger.write(
+                    "C sources did not change, not re-compiling.\n")
+                graph.Skip("C build")
+                return True
+        graph.Invalidate("C build")
+        return False
+
+    def StartBuild(self, job, quiet=False):
+        """
+        Launch PlatformIO, return ProcessLogger to wait for
+        """
+        return ProcessLogger(
+            self.CTRInstance.logger, job['command'], cwd=job['cwd'],
+            no_stdout=quiet, no_stderr=quiet,
+            env={**os.environ, **job['env']})
+
+    def FinishBuild(self, job, process):
+        """
+        Wait for PlatformIO and collect binary and its MD5
+        """
+        status, _result, _err_result = process.spin()
 
         if status:
             self.md5key = None
             self.CTRInstance.logger.write_error("C compilation failed.\n")
             return False
 
-        if platform == 'Embedded':
+        if job['platform'] == 'Embedded':
             src = self.bin_path.rsplit('.', 1)[0] + '.elf'
             shutil.copy(src, os.path.join(self.buildpath, 'extra_files'))
 
@@ -207,4 +276,24 @@ class toolchain_pio():
         f.write(self.md5key)
         f.close()
 
+        graph = job['graph']
+        if graph is not None:
+            outputs = [self.bin_path, self._GetMD5FileName()]
+            if job['platform'] == 'Embedded':
+                outputs.append(os.path.join(
+                    self.buildpath, 'extra_files', os.path.basename(src)))
+            graph.Done("C build", job['inputs'], outputs)
+
         return True
+
+    def _GetStageInputs(self, src, env, command, cwd):
+        # generated sources, headers included by them and firmware sources
+        generated = sorted(
+            f for f in os.listdir(self.buildpath)
+            if f.rsplit('.', 1)[-1] in ('c', 'h', 'cpp'))
+        return ContentDigest(
+            sorted(env.items()), command,
+            [(s, FileDigest(s)) for s in src],
+            [(f, FileDigest(os.path.join(self.buildpath, f)))
+             for f in generated],
+            TreeDigest(cwd))
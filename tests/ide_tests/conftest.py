@@ -24,8 +24,13 @@
 
 
 
+import ctypes
 import os
+import shutil
+import subprocess
 import sys
+import tempfile
+import unittest
 
 # import pytest
 # import xvfbwrapper
@@ -46,6 +51,57 @@ def init_environment():
 
 init_environment()
 
+# embedded runtime sources, built on host by tests of C code
+src_dir = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'platformio', 'src')
+
+
+def BuildCLibrary(tmpdir, sources, includes=(), cflags=()):
+    """
+    Compile C sources into objects named after them in tmpdir, then link
+    them into a shared library named after first one, loaded with ctypes
+    """
+    objects = []
+    for source in sources:
+        obj = os.path.join(
+            tmpdir, os.path.splitext(os.path.basename(source))[0] + ".o")
+        subprocess.check_call(
+            ["cc"] + list(cflags) + ["-fPIC", "-c"] +
+            [arg for path in includes for arg in ("-I", path)] +
+            [source, "-o", obj])
+        objects.append(obj)
+    lib = os.path.splitext(objects[0])[0] + ".so"
+    subprocess.check_call(["cc", "-shared"] + objects + ["-o", lib])
+    return ctypes.CDLL(lib)
+
+
+@unittest.skipIf(shutil.which("cc") is None, "needs a C compiler")
+class CLibraryTestCase(unittest.TestCase):
+    """
+    Tests of C code built once for all tests of class, in a temporary
+    folder. Sources are in src_dir, unless BuildLibrary is overridden.
+    """
+    sources = []
+
+    @classmethod
+    def BuildLibrary(cls, tmpdir):
+        return BuildCLibrary(
+            tmpdir, [os.path.join(src_dir, name) for name in cls.sources],
+            includes=[src_dir])
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        try:
+            cls.lib = cls.BuildLibrary(cls.tmpdir)
+        except Exception:
+            shutil.rmtree(cls.tmpdir)
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
 #
 # Something seems to be broken in Beremiz application,
 # because after tests in test_application.py during Xvfb shutdown
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+PLC millis() unwrapping and wall clock estimation of util/ClockSync.py
+"""
+
+
+import unittest
+
+import conftest  # noqa: F401, sets sys.path
+from util.ClockSync import ClockSync, Unwrap32
+
+
+class TestUnwrap32(unittest.TestCase):
+
+    def testForward(self):
+        unwrap = Unwrap32()
+        self.assertEqual(
+            [unwrap(v) for v in (0xfffffff0, 0x10, 0x70000000, 0xe0000000, 0x5)],
+            [0xfffffff0, 0x100000010, 0x170000000, 0x1e0000000, 0x200000005])
+
+    def testOutOfOrder(self):
+        """Scan timestamps older than last keep alive reply, across wrap"""
+        unwrap = Unwrap32()
+        self.assertEqual([unwrap(v) for v in (0xffffff00, 0x10, 0xfffffff0, 0x20)],
+                         [0xffffff00, 0x100000010, 0xfffffff0, 0x100000020])
+        self.assertEqual(unwrap.nearest(0xffffffff), 0xffffffff)
+
+    def testReset(self):
+        unwrap = Unwrap32()
+        unwrap(0xfffffff0)
+        unwrap(0x10)
+        unwrap.reset()
+        self.assertEqual(unwrap(0x20), 0x20)
+
+
+class TestClockSync(unittest.TestCase):
+
+    def testDrift(self):
+        """PLC clock 100 ppm fast, through millis() wrap"""
+        sync = ClockSync()
+        for i in range(10):
+            ms = 0xffffff00 + i * 100
+            ns = int(i * 100 * 1e6 / 1.0001)
+            sync.add(ns - 1000, ns + 1000, ms & 0xffffffff)
+        self.assertAlmostEqual(sync.drift_ppm(), -100, delta=1)
+        self.assertAlmostEqual(sync.to_wall_ns(sync.unwrap(0x200)),
+                               (0x300 * 1e6) / 1.0001, delta=1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Embedded debugger table generated from platformio/templates/debug.c.j2,
+built on host against matiec headers, compared to dispatch by a switch on
+variable type as generated before.
+
+Run directly to benchmark both on host, as for Native target :
+
+    $ python test_DebugTable.py [nb_vars [rounds]]
+"""
+
+
+import ctypes
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from struct import pack
+
+from jinja2 import Environment, FileSystemLoader
+
+import conftest
+
+base_dir = os.path.join(os.path.dirname(conftest.__file__), '..', '..')
+templates_dir = os.path.join(base_dir, 'platformio', 'templates')
+matiec_dir = os.environ.get(
+    "MATIEC_C_DIR", os.path.join(base_dir, 'lib', 'matiec', 'lib', 'C'))
+
+TYPES = [("BOOL", "B"), ("SINT", "b"), ("USINT", "B"), ("BYTE", "B"),
+         ("INT", "h"), ("UINT", "H"), ("WORD", "H"),
+         ("DINT", "i"), ("UDINT", "I"), ("DWORD", "I"),
+         ("LINT", "q"), ("ULINT", "Q"), ("LWORD", "Q"),
+         ("REAL", "f"), ("LREAL", "d")]
+KINDS = [("VAR", "DEBUG_VALUE"), ("IN", "DEBUG_POINTER"),
+         ("OUT", "DEBUG_OUTPUT")]
+
+# debug.c.j2 used to look values up by a switch on their type
+SWITCH_DISPATCH = """
+static const struct {
+    void *ptr;
+    __IEC_types_enum type;
+} switch_vars[] = {
+{%- for v in vars %}
+    {&({{ v.C_path }}), {{ v.type }}{{ v.suffix }}},
+{%- endfor %}
+};
+
+size_t switch_get_var_size(size_t idx)
+{
+    switch (switch_vars[idx].type) {
+{%- for t in types %}
+    case {{ t }}_ENUM:
+    case {{ t }}_O_ENUM:
+    case {{ t }}_P_ENUM:
+        return sizeof({{ t }});
+{%- endfor %}
+    default:
+        return 0;
+    }
+}
+
+void *switch_get_var_addr(size_t idx)
+{
+    void *ptr = switch_vars[idx].ptr;
+
+    switch (switch_vars[idx].type) {
+{%- for t in types %}
+    case {{ t }}_ENUM:
+        return (void *)&((__IEC_{{ t }}_t *) ptr)->value;
+    case {{ t }}_O_ENUM:
+    case {{ t }}_P_ENUM:
+        return (void *)((((__IEC_{{ t }}_p *) ptr)->flags & __IEC_FORCE_FLAG)
+                        ? &(((__IEC_{{ t }}_p *) ptr)->fvalue)
+                        : ((__IEC_{{ t }}_p *) ptr)->value);
+{%- endfor %}
+    default:
+        return 0;
+    }
+}
+
+void switch_force_var(size_t idx, bool forced, void *val)
+{
+    void *ptr = switch_vars[idx].ptr;
+
+    if (forced) {
+        switch (switch_vars[idx].type) {
+{%- for t in types %}
+        case {{ t }}_ENUM:
+            ((__IEC_{{ t }}_t *) ptr)->value = *(({{ t }} *) val);
+            ((__IEC_{{ t }}_t *) ptr)->flags |= __IEC_FORCE_FLAG;
+            break;
+        case {{ t }}_O_ENUM:
+            *(((__IEC_{{ t }}_p *) ptr)->value) = *(({{ t }} *) val);
+        case {{ t }}_P_ENUM:
+            ((__IEC_{{ t }}_p *) ptr)->fvalue = *(({{ t }} *) val);
+            ((__IEC_{{ t }}_p *) ptr)->flags |= __IEC_FORCE_FLAG;
+            break;
+{%- endfor %}
+        default:
+            break;
+        }
+    } else {
+        switch (switch_vars[idx].type) {
+{%- for t in types %}
+        case {{ t }}_ENUM:
+            ((__IEC_{{ t }}_t *) ptr)->flags &= ~__IEC_FORCE_FLAG;
+            break;
+        case {{ t }}_O_ENUM:
+        case {{ t }}_P_ENUM:
+            ((__IEC_{{ t }}_p *) ptr)->flags &= ~__IEC_FORCE_FLAG;
+            break;
+{%- endfor %}
+        default:
+            break;
+        }
+    }
+}
+"""
+
+# variables, their values for pointers, and timing loops
+HARNESS = """
+#include <stdbool.h>
+#include <stddef.h>
+#include <string.h>
+#include <time.h>
+
+#include "iec_types_all.h"
+{% for v in vars %}
+{%- if v.vartype == "VAR" %}
+__IEC_{{ v.type }}_t {{ v.C_path }};
+{%- else %}
+__IEC_{{ v.type }}_p {{ v.C_path }};
+{{ v.type }} {{ v.C_path }}_value;
+{%- endif %}
+{%- endfor %}
+
+void bind_vars(void)
+{
+{%- for v in vars if v.vartype != "VAR" %}
+    {{ v.C_path }}.value = &{{ v.C_path }}_value;
+{%- endfor %}
+}
+
+typedef size_t (*size_func)(size_t);
+typedef void *(*addr_func)(size_t);
+typedef void (*force_func)(size_t, bool, void *);
+
+static double elapsed_ns(struct timespec *t0)
+{
+    struct timespec t1;
+
+    clock_gettime(CLOCK_MONOTONIC, &t1);
+    return (t1.tv_sec - t0->tv_sec) * 1e9 + (t1.tv_nsec - t0->tv_nsec);
+}
+
+/* ns per variable, to copy all values as for a trace */
+double bench_trace(size_func size, addr_func addr, size_t count, int rounds)
+{
+    static unsigned char buf[{{ vars | length }} * 8];
+    struct timespec t0;
+
+    clock_gettime(CLOCK_MONOTONIC, &t0);
+    for (int r = 0; r < rounds; r++) {
+        size_t len = 0;
+        for (size_t i = 0; i < count; i++) {
+            size_t n = size(i);
+            memcpy(buf + len, addr(i), n);
+            len += n;
+        }
+    }
+    return elapsed_ns(&t0) / rounds / count;
+}
+
+/* ns per variable, to force then release all of them */
+double bench_force(force_func force, size_t count, int rounds)
+{
+    double val = 0;
+    struct timespec t0;
+
+    clock_gettime(CLOCK_MONOTONIC, &t0);
+    for (int r = 0; r < rounds; r++) {
+        for (size_t i = 0; i < count; i++)
+            force(i, true, &val);
+        for (size_t i = 0; i < count; i++)
+            force(i, false, 0);
+    }
+    return elapsed_ns(&t0) / rounds / count;
+}
+"""
+
+
+def Variables(count):
+    """Variables of each type and kind in turn"""
+    suffix = {"VAR": "_ENUM", "IN": "_P_ENUM", "OUT": "_O_ENUM"}
+    variables = []
+    for i in range(count):
+        iectype, fmt = TYPES[i % len(TYPES)]
+        vartype, kind = KINDS[(i // len(TYPES)) % len(KINDS)]
+        variables.append({"C_path": "VAR%d" % i, "type": iectype,
+                          "fmt": fmt, "vartype": vartype, "kind": kind,
+                          "suffix": suffix[vartype]})
+    return variables
+
+
+def Externs(variables):
+    return ["extern __IEC_%s_%s %s;" % (
+        v["type"], "t" if v["vartype"] == "VAR" else "p", v["C_path"])
+        for v in variables]
+
+
+def BuildTable(tmpdir, variables, optimize="-Os"):
+    """Build generated table, former switch dispatch and harness into a
+    library, return it and size of code and data of both"""
+    env = Environment(loader=FileSystemLoader(templates_dir))
+    sources = {
+        "debug.c": env.get_template("debug.c.j2").render(
+            debug={"externs": Externs(variables), "vars": variables}),
+        "switch.c": "\n".join(
+            ["#include <stdbool.h>", "#include <stddef.h>",
+             '#include "iec_types_all.h"'] + Externs(variables)) +
+        env.from_string(SWITCH_DISPATCH).render(
+            vars=variables, types=[t for t, _fmt in TYPES]),
+        "harness.c": env.from_string(HARNESS).render(vars=variables),
+        "POUS.h": "",
+    }
+    for name, code in sources.items():
+        with open(os.path.join(tmpdir, name), "w") as f:
+            f.write(code)
+
+    lib = conftest.BuildCLibrary(
+        tmpdir, [os.path.join(tmpdir, name)
+                 for name in ("debug.c", "switch.c", "harness.c")],
+        includes=[tmpdir, matiec_dir], cflags=[optimize])
+
+    sizes = {}
+    if shutil.which("size"):
+        for obj in (os.path.join(tmpdir, name) for name in ("debug.o", "switch.o")):
+            out = subprocess.check_output(["size", obj]).decode().split("\n")[1]
+            text, data, _bss = out.split()[:3]
+            sizes[os.path.basename(obj)] = (int(text), int(data))
+
+    for prefix in ("", "switch_"):
+        getattr(lib, prefix + "get_var_addr").restype = ctypes.c_void_p
+        getattr(lib, prefix + "get_var_size").restype = ctypes.c_size_t
+    lib.bench_trace.restype = ctypes.c_double
+    lib.bench_force.restype = ctypes.c_double
+    lib.bind_vars()
+    return lib, sizes
+
+
+def HaveMatiec():
+    return shutil.which("cc") is not None and \
+        os.path.isfile(os.path.join(matiec_dir, "iec_types_all.h"))
+
+
+@unittest.skipUnless(HaveMatiec(), "needs a C compiler and matiec headers")
+class TestDebugTable(conftest.CLibraryTestCase):
+    """Flat debug table behaves as switch dispatch on type"""
+
+    @classmethod
+    def BuildLibrary(cls, tmpdir):
+        cls.vars = Variables(len(TYPES) * len(KINDS))
+        lib, _sizes = BuildTable(tmpdir, cls.vars)
+        return lib
+
+    def Value(self, prefix, idx):
+        lib = self.lib
+        size = getattr(lib, prefix + "get_var_size")(idx)
+        addr = getattr(lib, prefix + "get_var_addr")(idx)
+        return ctypes.string_at(addr, size)
+
+    def Force(self, prefix, idx, data):
+        getattr(self.lib, prefix + "force_var")(idx, data is not None, data)
+
+    def testSameAsSwitch(self):
+        for idx, v in enumerate(self.vars):
+            data = pack("<" + v["fmt"], idx + 1)
+            for prefix in ("", "switch_"):
+                self.assertEqual(getattr(self.lib, prefix + "get_var_size")(idx),
+                                 len(data))
+            self.assertEqual(self.Value("", idx), self.Value("switch_", idx))
+
+            self.Force("", idx, data)
+            self.assertEqual(self.Value("", idx), data)
+            self.assertEqual(self.Value("switch_", idx), data)
+
+            # released, outputs keep forced value, inputs get theirs back
+            self.Force("", idx, None)
+            self.assertEqual(self.Value("", idx), self.Value("switch_", idx))
+            if v["vartype"] == "IN":
+                self.assertEqual(self.Value("", idx), bytes(len(data)))
+            else:
+                self.assertEqual(self.Value("", idx), data)
+
+    def testTraceReset(self):
+        data = pack("<d", 1.5)
+        idx = [i for i, v in enumerate(self.vars)
+               if v["vartype"] == "IN" and v["type"] == "LREAL"][0]
+        self.Force("", idx, data)
+        self.lib.trace_reset()
+        self.assertEqual(self.Value("", idx), bytes(8))
+
+
+def Benchmark(count, rounds):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        lib, sizes = BuildTable(tmpdir, Variables(count))
+        for name, (text, data) in sizes.items():
+            print("%-9s : %d bytes of code, %d of data" % (name, text, data))
+        for label, prefix in (("table", ""), ("switch", "switch_")):
+            trace = lib.bench_trace(getattr(lib, prefix + "get_var_size"),
+                                    getattr(lib, prefix + "get_var_addr"),
+                                    ctypes.c_size_t(count), rounds)
+            force = lib.bench_force(getattr(lib, prefix + "force_var"),
+                                    ctypes.c_size_t(count), rounds)
+            print("%-9s : trace %.1f ns, force %.1f ns per variable" % (
+                label, trace, force))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    Benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+              int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+
+import unittest
+
+import conftest
+from util.ModbusPlanner import (
+    ModbusItem, ModbusRequest, LocationItem, MapItems, PlanRequests,
+    READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS, READ_DISCRETE_INPUTS,
+    WRITE_MULTIPLE_REGISTERS)
+
+
+def Items(slave, function, *addresses):
+    return [ModbusItem(slave, function, a) for a in addresses]
+
+
+class TestModbusPlanner(unittest.TestCase):
+    """Located Modbus items are coalesced into few block requests"""
+
+    def testContiguous(self):
+        """Contiguous registers are read with one request"""
+        plan = PlanRequests(Items(1, READ_INPUT_REGISTERS, 12, 10, 11, 13))
+        self.assertEqual(plan, [ModbusRequest(1, READ_INPUT_REGISTERS, 10, 4)])
+
+    def testGap(self):
+        """Reads span small gaps, not larger ones"""
+        items = Items(1, READ_HOLDING_REGISTERS, 0, 1, 4, 20)
+        self.assertEqual(PlanRequests(items, max_gap=2), [
+            ModbusRequest(1, READ_HOLDING_REGISTERS, 0, 5),
+            ModbusRequest(1, READ_HOLDING_REGISTERS, 20, 1)])
+        self.assertEqual(len(PlanRequests(items)), 3)
+
+    def testWritesNeverSpanGaps(self):
+        """Writes would overwrite registers in gaps"""
+        items = Items(1, WRITE_MULTIPLE_REGISTERS, 0, 2)
+        self.assertEqual(PlanRequests(items, max_gap=4), [
+            ModbusRequest(1, WRITE_MULTIPLE_REGISTERS, 0, 1),
+            ModbusRequest(1, WRITE_MULTIPLE_REGISTERS, 2, 1)])
+
+    def testSlavesAndFunctions(self):
+        """Requests are per slave and function, sorted"""
+        items = Items(2, READ_INPUT_REGISTERS, 0) + \
+            Items(1, READ_INPUT_REGISTERS, 1) + \
+            Items(1, READ_DISCRETE_INPUTS, 0, 1)
+        self.assertEqual(PlanRequests(items), [
+            ModbusRequest(1, READ_DISCRETE_INPUTS, 0, 2),
+            ModbusRequest(1, READ_INPUT_REGISTERS, 1, 1),
+            ModbusRequest(2, READ_INPUT_REGISTERS, 0, 1)])
+
+    def testMaxItems(self):
+        """Blocks are split at protocol limit"""
+        plan = PlanRequests(Items(1, READ_INPUT_REGISTERS, *range(300)))
+        self.assertEqual([r.count for r in plan], [125, 125, 50])
+        plan = PlanRequests(
+            Items(1, READ_INPUT_REGISTERS, *range(10)), max_items=4)
+        self.assertEqual([r.count for r in plan], [4, 4, 2])
+
+    def testMapItems(self):
+        """Each item is found in its request"""
+        items = Items(1, READ_INPUT_REGISTERS, 5, 7, 30)
+        plan = PlanRequests(items, max_gap=1)
+        mapping = MapItems(plan, items)
+        self.assertEqual([mapping[i] for i in items], [(0, 0), (0, 2), (1, 0)])
+
+    def testLocationItem(self):
+        """Located variables map to remote items"""
+        self.assertEqual(LocationItem('I', 'W', 3, 100),
+                         ModbusItem(3, READ_INPUT_REGISTERS, 100))
+        self.assertIsNone(LocationItem('I', 'D', 3, 100))
+        self.assertIsNone(LocationItem('I', 'W', 0, 100))
+        self.assertIsNone(LocationItem('I', 'W', 1, 0x10000))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Modbus RTU frames of embedded master, platformio/src/modbus_rtu.c built on
+host, against a simulated slave.
+"""
+
+
+import ctypes
+import unittest
+from struct import pack, unpack_from
+
+import conftest
+from util.ModbusPlanner import (
+    ModbusItem, PlanRequests,
+    READ_COILS, READ_DISCRETE_INPUTS, READ_HOLDING_REGISTERS,
+    READ_INPUT_REGISTERS, WRITE_MULTIPLE_COILS, WRITE_MULTIPLE_REGISTERS)
+
+# same as platformio/src/modbus.h
+MODBUS_ERR_SHORT = -1
+MODBUS_ERR_CRC = -2
+MODBUS_ERR_REPLY = -3
+
+ILLEGAL_DATA_ADDRESS = 2
+
+
+class ModbusRequest(ctypes.Structure):
+    _fields_ = [("slave", ctypes.c_uint8),
+                ("function", ctypes.c_uint8),
+                ("start", ctypes.c_uint16),
+                ("count", ctypes.c_uint16),
+                ("data", ctypes.c_void_p),
+                ("errors", ctypes.c_uint16),
+                ("status", ctypes.c_int8)]
+
+
+def CRC(data):
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b
+        for _i in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return pack("<H", crc)
+
+
+class SimulatedSlave():
+    """Answers RTU requests from its coils and registers"""
+
+    def __init__(self, address, size=256):
+        self.address = address
+        self.bits = {READ_COILS: [0] * size, READ_DISCRETE_INPUTS: [0] * size}
+        self.words = {READ_HOLDING_REGISTERS: [0] * size,
+                      READ_INPUT_REGISTERS: [0] * size}
+
+    def reply(self, function, pdu):
+        return bytes([self.address, function]) + pdu + \
+            CRC(bytes([self.address, function]) + pdu)
+
+    def handle(self, frame):
+        if frame[-2:] != CRC(frame[:-2]) or frame[0] != self.address:
+            return b''
+        function = frame[1]
+        start, count = unpack_from(">HH", frame, 2)
+
+        area = self.bits.get(function) or self.words.get(function)
+        if function == WRITE_MULTIPLE_COILS:
+            area = self.bits[READ_COILS]
+        elif function == WRITE_MULTIPLE_REGISTERS:
+            area = self.words[READ_HOLDING_REGISTERS]
+        if start + count > len(area):
+            return self.reply(function | 0x80, bytes([ILLEGAL_DATA_ADDRESS]))
+
+        if function in self.bits:
+            data = bytearray((count + 7) // 8)
+            for i in range(count):
+                data[i // 8] |= area[start + i] << (i % 8)
+            return self.reply(function, bytes([len(data)]) + data)
+        if function in self.words:
+            data = pack(">%dH" % count, *area[start:start + count])
+            return self.reply(function, bytes([len(data)]) + data)
+        if function == WRITE_MULTIPLE_COILS:
+            for i in range(count):
+                area[start + i] = (frame[7 + i // 8] >> (i % 8)) & 1
+        else:
+            area[start:start + count] = unpack_from(">%dH" % count, frame, 7)
+        return self.reply(function, frame[2:6])
+
+
+class TestModbusRTU(conftest.CLibraryTestCase):
+    """Frames built and parsed by embedded master"""
+    sources = ["modbus_rtu.c"]
+
+    def setUp(self):
+        self.slave = SimulatedSlave(7)
+
+    def Exchange(self, req, reply=None):
+        """Send request to slave, parse its reply, return status"""
+        buf = ctypes.create_string_buffer(256)
+        size = self.lib.modbus_frame(ctypes.byref(req), buf)
+        if reply is None:
+            reply = self.slave.handle(buf.raw[:size])
+        # reply size is known from first bytes
+        self.assertEqual(
+            self.lib.modbus_reply_size(ctypes.byref(req), reply, 3), len(reply))
+        return self.lib.modbus_parse(ctypes.byref(req), reply, len(reply))
+
+    def Request(self, function, start, count, ctype):
+        data = (ctype * count)()
+        req = ModbusRequest(7, function, start, count,
+                            ctypes.cast(data, ctypes.c_void_p), 0, 0)
+        return req, data
+
+    def testReadRegisters(self):
+        self.slave.words[READ_INPUT_REGISTERS][10:13] = [1, 0x1234, 0xFFFF]
+        req, data = self.Request(READ_INPUT_REGISTERS, 10, 3, ctypes.c_uint16)
+        self.assertEqual(self.Exchange(req), 0)
+        self.assertEqual(list(data), [1, 0x1234, 0xFFFF])
+
+    def testReadBits(self):
+        bits = [1, 0, 1, 1, 0, 0, 0, 1, 1, 0, 1]
+        self.slave.bits[READ_DISCRETE_INPUTS][3:3 + len(bits)] = bits
+        req, data = self.Request(
+            READ_DISCRETE_INPUTS, 3, len(bits), ctypes.c_uint8)
+        self.assertEqual(self.Exchange(req), 0)
+        self.assertEqual(list(data), bits)
+
+    def testWriteRegisters(self):
+        req, data = self.Request(
+            WRITE_MULTIPLE_REGISTERS, 4, 2, ctypes.c_uint16)
+        data[:] = [0xBEEF, 42]
+        self.assertEqual(self.Exchange(req), 0)
+        self.assertEqual(
+            self.slave.words[READ_HOLDING_REGISTERS][4:6], [0xBEEF, 42])
+
+    def testWriteCoils(self):
+        bits = [1, 1, 0, 1, 0, 0, 0, 0, 1]
+        req, data = self.Request(
+            WRITE_MULTIPLE_COILS, 0, len(bits), ctypes.c_uint8)
+        data[:] = bits
+        self.assertEqual(self.Exchange(req), 0)
+        self.assertEqual(self.slave.bits[READ_COILS][:len(bits)], bits)
+
+    def testException(self):
+        req, _data = self.Request(READ_HOLDING_REGISTERS, 250, 10,
+                                  ctypes.c_uint16)
+        self.assertEqual(self.Exchange(req), ILLEGAL_DATA_ADDRESS)
+
+    def testBadReplies(self):
+        req, _data = self.Request(READ_INPUT_REGISTERS, 0, 2, ctypes.c_uint16)
+        reply = bytearray(self.slave.reply(READ_INPUT_REGISTERS,
+                                           bytes([4, 0, 1, 0, 2])))
+        reply[4] ^= 1
+        self.assertEqual(self.Exchange(req, bytes(reply)), MODBUS_ERR_CRC)
+        other = SimulatedSlave(8).reply(READ_INPUT_REGISTERS,
+                                        bytes([4, 0, 1, 0, 2]))
+        self.assertEqual(self.Exchange(req, other), MODBUS_ERR_REPLY)
+        self.assertEqual(self.lib.modbus_parse(ctypes.byref(req), other, 4),
+                         MODBUS_ERR_SHORT)
+
+    def testPlannedPoll(self):
+        """Planned blocks read values of all items"""
+        addresses = (0, 1, 3, 40, 41)
+        for a in addresses:
+            self.slave.words[READ_HOLDING_REGISTERS][a] = 100 + a
+        items = [ModbusItem(7, READ_HOLDING_REGISTERS, a) for a in addresses]
+        values = {}
+        for r in PlanRequests(items, max_gap=2):
+            req, data = self.Request(r.function, r.start, r.count,
+                                     ctypes.c_uint16)
+            self.assertEqual(self.Exchange(req), 0)
+            values.update({r.start + i: v for i, v in enumerate(data)})
+        self.assertEqual([values[a] for a in addresses],
+                         [100 + a for a in addresses])
+
+
+if __name__ == '__main__':
+    unittest.main()
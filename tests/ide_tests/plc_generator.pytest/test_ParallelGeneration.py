@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Parallel POU generation tests.
+
+Run directly to benchmark generation of a synthetic project :
+
+    $ python test_ParallelGeneration.py [nb_pous [jobs]]
+"""
+
+
+import os
+import sys
+import time
+import tempfile
+import unittest
+from unittest import mock
+
+import conftest
+import fake_wx  # code generation doesn't need a display
+import controls  # same import order as IDE, before PLCControler
+from PLCControler import PLCControler
+from PLCGenerator import GenerateCurrentProgram, PLCGenException
+
+
+PROJECT_TEMPLATE = """<?xml version='1.0' encoding='utf-8'?>
+<project xmlns:xhtml="http://www.w3.org/1999/xhtml" xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns="http://www.plcopen.org/xml/tc6_0201">
+  <fileHeader companyName="Unknown" productName="Unnamed" productVersion="1" creationDateTime="2024-01-01T00:00:00"/>
+  <contentHeader name="Synthetic" modificationDateTime="2024-01-01T00:00:00">
+    <coordinateInfo>
+      <fbd><scaling x="0" y="0"/></fbd>
+      <ld><scaling x="0" y="0"/></ld>
+      <sfc><scaling x="0" y="0"/></sfc>
+    </coordinateInfo>
+  </contentHeader>
+  <types>
+    <dataTypes/>
+    <pous>
+%(pous)s
+    </pous>
+  </types>
+  <instances>
+    <configurations>
+      <configuration name="config">
+        <resource name="resource1">
+          <task name="task0" priority="0" interval="T#20ms">
+            <pouInstance name="instance0" typeName="main"/>
+          </task>
+        </resource>
+      </configuration>
+    </configurations>
+  </instances>
+</project>
+"""
+
+FB_TEMPLATE = """      <pou name="FB_%(idx)d" pouType="functionBlock">
+        <interface>
+          <inputVars>
+            <variable name="IN"><type><INT/></type></variable>
+          </inputVars>
+          <outputVars>
+            <variable name="OUT"><type><INT/></type></variable>
+          </outputVars>
+%(locals)s
+        </interface>
+        <body>
+%(body)s
+        </body>
+      </pou>
+"""
+
+FB_LOCALS = """          <localVars>
+            <variable name="inst"><type><derived name="%(block)s"/></type></variable>
+          </localVars>"""
+
+ST_BODY = """          <ST>
+            <xhtml:p><![CDATA[OUT := IN + %(idx)d;]]></xhtml:p>
+          </ST>"""
+
+FBD_BODY = """          <FBD>
+            <inVariable localId="1" executionOrderId="0" height="30" width="40" negated="false">
+              <position x="20" y="40"/>
+              <connectionPointOut><relPosition x="40" y="15"/></connectionPointOut>
+              <expression>IN</expression>
+            </inVariable>
+            <block localId="2" typeName="%(block)s" instanceName="inst" executionOrderId="0" height="40" width="80">
+              <position x="100" y="25"/>
+              <inputVariables>
+                <variable formalParameter="IN">
+                  <connectionPointIn>
+                    <relPosition x="0" y="30"/>
+                    <connection refLocalId="1">
+                      <position x="100" y="55"/>
+                      <position x="60" y="55"/>
+                    </connection>
+                  </connectionPointIn>
+                </variable>
+              </inputVariables>
+              <inOutVariables/>
+              <outputVariables>
+                <variable formalParameter="OUT">
+                  <connectionPointOut><relPosition x="80" y="30"/></connectionPointOut>
+                </variable>
+              </outputVariables>
+            </block>
+            <outVariable localId="3" executionOrderId="0" height="30" width="40" negated="false">
+              <position x="220" y="40"/>
+              <connectionPointIn>
+                <relPosition x="0" y="15"/>
+                <connection refLocalId="2" formalParameter="OUT">
+                  <position x="220" y="55"/>
+                  <position x="180" y="55"/>
+                </connection>
+              </connectionPointIn>
+              <expression>OUT</expression>
+            </outVariable>
+          </FBD>"""
+
+MAIN_TEMPLATE = """      <pou name="main" pouType="program">
+        <interface>
+          <localVars>
+%(instances)s
+          </localVars>
+        </interface>
+        <body>
+          <ST>
+            <xhtml:p><![CDATA[%(calls)s]]></xhtml:p>
+          </ST>
+        </body>
+      </pou>
+"""
+
+
+def SyntheticProjectXML(nb_pous, missing_block=None):
+    """
+    Project made of a chain of function blocks, odd ones in FBD calling
+    previous block, even ones in ST, all instantiated by main program
+    """
+    pous = []
+    for idx in range(nb_pous):
+        params = {"idx": idx, "block": "FB_%d" % (idx - 1), "locals": ""}
+        if idx == missing_block:
+            params["block"] = "MISSING_FB"
+        if idx % 2:
+            params["locals"] = FB_LOCALS % params
+            params["body"] = FBD_BODY % params
+        else:
+            params["body"] = ST_BODY % params
+        pous.append(FB_TEMPLATE % params)
+    pous.append(MAIN_TEMPLATE % {
+        "instances": "\n".join(
+            '            <variable name="fb%d"><type><derived name="FB_%d"/></type></variable>' % (idx, idx)
+            for idx in range(nb_pous)),
+        "calls": "\n".join("fb%d(IN := %d);" % (idx, idx)
+                           for idx in range(nb_pous))})
+    return PROJECT_TEMPLATE % {"pous": "".join(pous)}
+
+
+def OpenSyntheticProject(nb_pous, missing_block=None):
+    controler = PLCControler()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "plc.xml")
+        with open(path, "w") as f:
+            f.write(SyntheticProjectXML(nb_pous, missing_block))
+        error = controler.OpenXMLFile(path)
+    return controler, error
+
+
+def Generate(controler, jobs):
+    errors, warnings = [], []
+    chunks = GenerateCurrentProgram(
+        controler, controler.GetProject(), errors, warnings, jobs=jobs)
+    return chunks, errors, warnings
+
+
+class TestParallelGeneration(unittest.TestCase):
+    """Generation in worker processes must give same result as serial one"""
+
+    nb_pous = 40
+
+    def setUp(self):
+        # small project is enough to check results
+        patcher = mock.patch("PLCGenerator.PARALLEL_MIN_POUS", self.nb_pous // 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testSameAsSerial(self):
+        controler, error = OpenSyntheticProject(self.nb_pous)
+        self.assertFalse(error)
+        serial = Generate(controler, 1)
+        self.assertEqual(Generate(controler, 2), serial)
+        self.assertIn(("FB_%d" % (self.nb_pous - 1), ("P::FB_%d" % (self.nb_pous - 1), "name")),
+                      serial[0])
+
+    def testErrorInWorker(self):
+        """Error is raised as in serial generation"""
+        controler, error = OpenSyntheticProject(self.nb_pous, 11)
+        self.assertFalse(error)
+        messages = []
+        for jobs in (1, 2):
+            with self.assertRaises(PLCGenException) as cm:
+                Generate(controler, jobs)
+            messages.append(str(cm.exception))
+        self.assertEqual(messages[0], messages[1])
+
+
+def Benchmark(nb_pous, jobs):
+    controler, error = OpenSyntheticProject(nb_pous)
+    if error:
+        print(error)
+        return
+    results = []
+    for label, njobs in (("serial", 1), ("parallel", jobs)):
+        start = time.time()
+        results.append(Generate(controler, njobs))
+        print("%-8s (%d process%s) : %.2fs" % (
+            label, njobs, "es" if njobs > 1 else "", time.time() - start))
+    print("identical output :", results[0] == results[1])
+
+
+if __name__ == '__main__':
+    Benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+              int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+
+import os
+import unittest
+
+import conftest
+import fake_wx  # code generation doesn't need a display
+import controls  # same import order as IDE, before PLCControler
+from PLCControler import PLCControler
+from PLCGenerator import GenerateCurrentProgram
+
+projects_dir = os.path.join(
+    os.path.dirname(conftest.__file__), '..', 'projects')
+
+
+class TestPouProgramCache(unittest.TestCase):
+    """Cached ST generation must give same chunks as a full generation"""
+
+    def setUp(self):
+        self.controler = PLCControler()
+        error = self.controler.OpenXMLFile(
+            os.path.join(projects_dir, 'modbus', 'plc.xml'))
+        self.assertFalse(error)
+        self.project = self.controler.GetProject()
+
+    def Generate(self, cache=None):
+        errors, warnings = [], []
+        chunks = GenerateCurrentProgram(
+            self.controler, self.project, errors, warnings, cache=cache)
+        self.assertEqual(errors, [])
+        return chunks, warnings
+
+    def CheckSameAsFullGeneration(self):
+        self.assertEqual(self.Generate(self.controler.PouProgramCache),
+                         self.Generate())
+
+    def CachedPrograms(self):
+        return {name: entry["program"] for name, entry
+                in self.controler.PouProgramCache.Entries.items()}
+
+    def testUnchangedProject(self):
+        """Second generation reuses every POU"""
+        self.CheckSameAsFullGeneration()
+        programs = self.CachedPrograms()
+        self.assertEqual(set(programs),
+                         {pou.getname() for pou in self.project.getpous()})
+
+        self.CheckSameAsFullGeneration()
+        for name, program in self.CachedPrograms().items():
+            self.assertIs(program, programs[name])
+
+    def testBodyChanged(self):
+        """Only POU whose body changed is generated again"""
+        self.CheckSameAsFullGeneration()
+        programs = self.CachedPrograms()
+
+        pou = self.project.getpou("Generator")
+        pou.settext(pou.gettext() + "\n(* edited *)\n")
+
+        self.CheckSameAsFullGeneration()
+        cached = self.CachedPrograms()
+        self.assertIsNot(cached["Generator"], programs["Generator"])
+        self.assertIs(cached["program0"], programs["program0"])
+
+    def testInterfaceChanged(self):
+        """POUs depending on a changed block signature are generated again"""
+        self.CheckSameAsFullGeneration()
+        programs = self.CachedPrograms()
+
+        self.project.getpou("Generator").addpouVar(
+            self.controler.GetVarTypeObject("BOOL"), "EXTRA_IN", "inputVars")
+
+        self.CheckSameAsFullGeneration()
+        cached = self.CachedPrograms()
+        self.assertIsNot(cached["Generator"], programs["Generator"])
+        self.assertIsNot(cached["program0"], programs["program0"])
+
+    def testPouUsedInTextAdded(self):
+        """POU whose text uses a new POU is generated again, after it"""
+        pou = self.project.getpou("Generator")
+        pou.settext(pou.gettext() + "\nNEWF(TRUE);\n")
+        self.CheckSameAsFullGeneration()
+        programs = self.CachedPrograms()
+
+        self.controler.ProjectAddPou("NEWF", "function", "ST")
+        newf = self.project.getpou("NEWF")
+        newf.addpouVar(self.controler.GetVarTypeObject("BOOL"), "IN", "inputVars")
+        newf.settext("NEWF := IN;")
+
+        self.CheckSameAsFullGeneration()
+        cached = self.CachedPrograms()
+        self.assertIsNot(cached["Generator"], programs["Generator"])
+        self.assertIs(cached["program0"], programs["program0"])
+
+        self.controler.ProjectRemovePou("NEWF")
+        self.CheckSameAsFullGeneration()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+
+import os
+import unittest
+
+import conftest
+import fake_wx  # code generation doesn't need a display
+import controls  # same import order as IDE, before PLCControler
+from PLCControler import PLCControler
+
+projects_dir = os.path.join(
+    os.path.dirname(conftest.__file__), '..', 'projects')
+
+
+class TestProjectSnapshot(unittest.TestCase):
+    """Compiled project seen by debug views is a snapshot taken at build"""
+
+    def setUp(self):
+        self.controler = PLCControler()
+        error = self.controler.OpenXMLFile(
+            os.path.join(projects_dir, 'modbus', 'plc.xml'))
+        self.assertFalse(error)
+
+    def Build(self):
+        program, errors, warnings = self.controler.GenerateProgram()
+        self.assertEqual(errors, [])
+        self.controler.ProgramTransferred()
+
+    def GetText(self, debug):
+        return self.controler.GetProject(debug).getpou("Generator").gettext()
+
+    def testUnchangedProject(self):
+        """Generating again an unchanged project keeps same snapshot"""
+        self.Build()
+        snapshot = self.controler.CurrentCompiledProject
+        self.assertIsNone(snapshot.Project)
+        self.Build()
+        self.assertIs(self.controler.CurrentCompiledProject, snapshot)
+
+    def testEditAfterBuild(self):
+        """Edits made after build are not seen by debug views"""
+        self.Build()
+        text = self.GetText(True)
+        self.assertIsNot(self.controler.GetProject(True),
+                         self.controler.GetProject())
+
+        pou = self.controler.GetProject().getpou("Generator")
+        pou.settext(text + "\n(* edited *)\n")
+        self.assertEqual(self.GetText(True), text)
+
+        self.Build()
+        self.assertEqual(self.GetText(True), self.GetText(False))
+
+
+if __name__ == '__main__':
+    unittest.main()
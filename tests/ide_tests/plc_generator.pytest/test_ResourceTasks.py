@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Resource tasks scheduled by embedded runtime at their own interval,
+ProjectController.GetResourceTasks()
+"""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import conftest
+import fake_wx  # code generation doesn't need a display
+import controls  # same import order as IDE, before PLCControler
+from ProjectController import ProjectController
+
+projects_dir = os.path.join(
+    os.path.dirname(conftest.__file__), '..', 'projects')
+
+# as written by IEC2C for tests/projects/tasks, 10ms common tick
+VARIABLES_CSV = """\
+// Programs
+0;CONFIG.RESOURCE1.SLOW0;counter;
+1;CONFIG.RESOURCE1.FAST0;counter;
+2;CONFIG.RESOURCE1.FAST1;counter;
+3;CONFIG.RESOURCE1.BACKGROUND;counter;
+
+// Variables
+0;FB;CONFIG.RESOURCE1.SLOW0;CONFIG.RESOURCE1.SLOW0;COUNTER;;
+1;VAR;CONFIG.RESOURCE1.SLOW0.COUNT;CONFIG.RESOURCE1.SLOW0.COUNT;DINT;;
+2;FB;CONFIG.RESOURCE1.FAST0;CONFIG.RESOURCE1.FAST0;COUNTER;;
+3;VAR;CONFIG.RESOURCE1.FAST0.COUNT;CONFIG.RESOURCE1.FAST0.COUNT;DINT;;
+4;FB;CONFIG.RESOURCE1.FAST1;CONFIG.RESOURCE1.FAST1;COUNTER;;
+5;VAR;CONFIG.RESOURCE1.FAST1.COUNT;CONFIG.RESOURCE1.FAST1.COUNT;DINT;;
+6;FB;CONFIG.RESOURCE1.BACKGROUND;CONFIG.RESOURCE1.BACKGROUND;COUNTER;;
+7;VAR;CONFIG.RESOURCE1.BACKGROUND.COUNT;CONFIG.RESOURCE1.BACKGROUND.COUNT;DINT;;
+
+// Ticktime
+10000000
+"""
+
+
+class Log(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def write(self, s):
+        self.messages.append(s)
+
+    write_warning = write_error = write
+
+    def flush(self):
+        pass
+
+
+class TestResourceTasks(unittest.TestCase):
+
+    def setUp(self):
+        self.buildpath = tempfile.mkdtemp()
+        with open(os.path.join(self.buildpath, "VARIABLES.csv"), "w") as f:
+            f.write(VARIABLES_CSV)
+        self.log = Log()
+        self.controller = ProjectController(None, self.log)
+        error, _ = self.controller.LoadProject(
+            os.path.join(projects_dir, 'tasks'), self.buildpath)
+        self.assertIsNone(error)
+        self.resource = self.controller.GetProject(True) \
+            .getconfigurations()[0].getresource()[0]
+
+    def tearDown(self):
+        self.controller.ResetIECProgramsAndVariables()
+        shutil.rmtree(self.buildpath)
+
+    def Task(self, name):
+        return next(t for t in self.resource.gettask() if t.getname() == name)
+
+    def Summary(self):
+        tasks = self.controller.GetResourceTasks()
+        if tasks is None:
+            return None
+        return [(t["name"], t["priority"], t["period"],
+                 [p["C_path"] for p in t["programs"]]) for t in tasks]
+
+    def testOrder(self):
+        """Highest priority first, programs without task last at common tick"""
+        self.assertEqual(self.Summary(), [
+            ("fast", 0, 5000, ["RESOURCE1__FAST0", "RESOURCE1__FAST1"]),
+            ("slow", 1, 100000, ["RESOURCE1__SLOW0"]),
+            ("resource1", None, 10000, ["RESOURCE1__BACKGROUND"])])
+
+    def testSamePriority(self):
+        """Shortest period first among tasks of same priority"""
+        self.Task("fast").setpriority(1)
+        self.Task("slow").setinterval("T#1ms")
+        self.assertEqual([t[:3] for t in self.Summary()], [
+            ("slow", 1, 1000), ("fast", 1, 5000), ("resource1", None, 10000)])
+
+    def testSingle(self):
+        """Task triggered by a variable can't be scheduled on its own"""
+        self.Task("slow").setsingle("config.resource1.fast0.Count")
+        self.assertIsNone(self.Summary())
+        self.assertIn("triggered by", "".join(self.log.messages))
+
+    def testNoInterval(self):
+        self.Task("fast").setinterval(None)
+        self.assertIsNone(self.Summary())
+        self.assertIn("no interval", "".join(self.log.messages))
+
+    def testUnknownProgram(self):
+        """Every instance must match a program generated by IEC2C"""
+        self.Task("slow").getpouInstance()[0].setname("other")
+        self.assertIsNone(self.Summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Retain image layout, and its flash storage platformio/src/retain_store.c
+built on host, against simulated flash pages.
+"""
+
+
+import ctypes
+import unittest
+from struct import pack
+
+import conftest
+from util.RetainImage import (
+    RETAIN_BLOCK_SIZE, RetainLayout, ImageSize, LayoutHash, WriteLayout,
+    ReadLayout, DecodeRetainImage)
+
+# same as platformio/src/retain_store.h
+RETAIN_IDLE, RETAIN_WROTE, RETAIN_ERASED, RETAIN_BLOCKED = range(4)
+RETAIN_RECORD_SIZE = 4 + RETAIN_BLOCK_SIZE
+
+ERASE = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_uint8)
+PROGRAM = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_uint32,
+                           ctypes.POINTER(ctypes.c_uint8), ctypes.c_uint16)
+
+
+class RetainFlash(ctypes.Structure):
+    _fields_ = [("mem", ctypes.c_void_p),
+                ("page_size", ctypes.c_uint16),
+                ("pages", ctypes.c_uint8),
+                ("erase", ERASE),
+                ("program", PROGRAM)]
+
+
+class RetainStore(ctypes.Structure):
+    _fields_ = [("flash", ctypes.POINTER(RetainFlash)),
+                ("image", ctypes.c_void_p),
+                ("size", ctypes.c_uint16),
+                ("hash", ctypes.c_uint32),
+                ("dirty", ctypes.c_void_p),
+                ("missing", ctypes.c_void_p),
+                ("blocks", ctypes.c_uint16),
+                ("cursor", ctypes.c_uint16),
+                ("page", ctypes.c_uint8),
+                ("next_erased", ctypes.c_uint8),
+                ("offset", ctypes.c_uint16),
+                ("seq", ctypes.c_uint32),
+                ("records", ctypes.c_uint32),
+                ("erases", ctypes.c_uint32)]
+
+
+class SimulatedFlash():
+    """NOR flash pages, programmed once between erases"""
+
+    def __init__(self, pages, page_size):
+        self.mem = ctypes.create_string_buffer(b'\xff' * pages * page_size,
+                                               pages * page_size)
+        self.page_size = page_size
+        self.erases = [0] * pages
+        self.fail_after = None
+        self.flash = RetainFlash(ctypes.cast(self.mem, ctypes.c_void_p),
+                                 page_size, pages,
+                                 ERASE(self.erase), PROGRAM(self.program))
+
+    def erase(self, page):
+        start = page * self.page_size
+        self.mem[start:start + self.page_size] = b'\xff' * self.page_size
+        self.erases[page] += 1
+        return 0
+
+    def program(self, offset, data, length):
+        for i in range(length):
+            if self.fail_after is not None:
+                if self.fail_after == 0:
+                    return 1
+                self.fail_after -= 1
+            if self.mem[offset + i] != b'\xff':
+                return 1
+            self.mem[offset + i] = data[i]
+        return 0
+
+
+class TestRetainStore(conftest.CLibraryTestCase):
+    """Image saved by blocks in flash pages, restored at boot"""
+    sources = ["retain_store.c"]
+
+    def Boot(self, flash, size=100, hashval=0x1234):
+        """Store over flash, as at boot, with image loaded"""
+        bitmap = (size + RETAIN_BLOCK_SIZE * 8 - 1) // (RETAIN_BLOCK_SIZE * 8)
+        store = RetainStore()
+        store.image_buf = ctypes.create_string_buffer(size)
+        store.dirty_buf = ctypes.create_string_buffer(bitmap)
+        store.missing_buf = ctypes.create_string_buffer(bitmap)
+        store.flash = ctypes.pointer(flash.flash)
+        store.image = ctypes.cast(store.image_buf, ctypes.c_void_p)
+        store.size = size
+        store.hash = hashval
+        store.dirty = ctypes.cast(store.dirty_buf, ctypes.c_void_p)
+        store.missing = ctypes.cast(store.missing_buf, ctypes.c_void_p)
+        store.pages = self.lib.retain_store_load(ctypes.byref(store))
+        return store
+
+    def Update(self, store, offset, data):
+        self.lib.retain_store_update(ctypes.byref(store), offset, data, len(data))
+
+    def Save(self, store, may_erase=True):
+        """Run store until idle, return status count"""
+        counts = {}
+        for _i in range(1000):
+            status = self.lib.retain_store_step(ctypes.byref(store), may_erase)
+            counts[status] = counts.get(status, 0) + 1
+            if status in (RETAIN_IDLE, RETAIN_BLOCKED):
+                return counts
+        self.fail("store never idle")
+
+    def testRoundTrip(self):
+        flash = SimulatedFlash(2, 512)
+        store = self.Boot(flash)
+        self.assertEqual(store.pages, 0)
+        self.Update(store, 10, b'retained')
+        self.Update(store, 96, pack("<i", -5))
+        self.Save(store)
+
+        store = self.Boot(flash)
+        self.assertEqual(store.pages, 1)
+        self.assertEqual(store.image_buf.raw[10:18], b'retained')
+        self.assertEqual(store.image_buf.raw[96:100], pack("<i", -5))
+
+    def testDirtyBlocksOnly(self):
+        """Unchanged values write nothing, a change writes its block"""
+        flash = SimulatedFlash(2, 1024)
+        store = self.Boot(flash)
+        self.Update(store, 0, b'\x01')
+        self.Save(store)
+        records = store.records
+
+        self.Update(store, 0, b'\x01')
+        self.assertFalse(self.lib.retain_store_pending(ctypes.byref(store)))
+        self.Update(store, 70, b'\x02')
+        self.assertEqual(self.Save(store).get(RETAIN_WROTE), 1)
+        self.assertEqual(store.records, records + 1)
+
+    def testEraseDeferred(self):
+        """Saving waits for permission to erase, image isn't lost"""
+        flash = SimulatedFlash(2, 8 + 8 * RETAIN_RECORD_SIZE)
+        store = self.Boot(flash)
+        for i in range(8):
+            self.Update(store, 0, bytes([i + 1]))
+            self.Save(store, may_erase=True)
+        erases = sum(flash.erases)
+
+        for i in range(8):
+            self.Update(store, 0, bytes([i + 10]))
+            self.Save(store, may_erase=False)
+        self.assertEqual(sum(flash.erases), erases)
+        self.assertTrue(self.lib.retain_store_pending(ctypes.byref(store)))
+
+        self.Save(store, may_erase=True)
+        self.assertEqual(self.Boot(flash).image_buf.raw[0], 17)
+
+    def testWearLeveling(self):
+        """Pages are used in turn, newest values always restored"""
+        for pages in (2, 3):
+            flash = SimulatedFlash(pages, 8 + 10 * RETAIN_RECORD_SIZE)
+            store = self.Boot(flash)
+            for i in range(200):
+                self.Update(store, (i * 7) % 100, bytes([i]))
+                self.Save(store)
+                if i % 37 == 0:
+                    image = store.image_buf.raw
+                    store = self.Boot(flash)
+                    self.assertEqual(store.image_buf.raw, image)
+            self.assertGreater(min(flash.erases), 5)
+            self.assertLessEqual(max(flash.erases) - min(flash.erases), 1)
+            self.assertEqual(self.Boot(flash).image_buf.raw,
+                             store.image_buf.raw)
+
+    def testTornWrite(self):
+        """A record cut by reset is ignored, previous value restored"""
+        flash = SimulatedFlash(2, 512)
+        store = self.Boot(flash)
+        self.Update(store, 5, b'old')
+        self.Save(store)
+
+        self.Update(store, 5, b'new')
+        flash.fail_after = 10
+        self.lib.retain_store_step(ctypes.byref(store), True)
+        flash.fail_after = None
+
+        store = self.Boot(flash)
+        self.assertEqual(store.image_buf.raw[5:8], b'old')
+        self.Update(store, 5, b'new')
+        self.Save(store)
+        self.assertEqual(self.Boot(flash).image_buf.raw[5:8], b'new')
+
+    def testOtherLayout(self):
+        """Pages saved for another program are ignored"""
+        flash = SimulatedFlash(2, 512)
+        store = self.Boot(flash)
+        self.Update(store, 0, b'\x42')
+        self.Save(store)
+        store = self.Boot(flash, hashval=0x4321)
+        self.assertEqual(store.pages, 0)
+        self.assertEqual(store.image_buf.raw[0], 0)
+
+    def testFlashTooSmall(self):
+        """A page must hold image twice"""
+        flash = SimulatedFlash(2, 8 + 7 * RETAIN_RECORD_SIZE)
+        self.assertEqual(self.Boot(flash).pages, -1)
+
+
+class TestRetainLayout(unittest.TestCase):
+    """Retained variables packed in image"""
+
+    Variables = [
+        {"IEC_path": "CONFIG.COUNT", "C_path": "CONFIG__COUNT",
+         "vartype": "VAR", "type": "DINT", "retain": "1"},
+        {"IEC_path": "CONFIG.SPEED", "C_path": "CONFIG__SPEED",
+         "vartype": "VAR", "type": "INT", "retain": "0"},
+        {"IEC_path": "CONFIG.RES.INST.FB", "C_path": "RES__INST.FB",
+         "vartype": "FB", "type": "TON", "retain": "1"},
+        {"IEC_path": "CONFIG.RES.INST.MODE", "C_path": "RES__INST.MODE",
+         "vartype": "VAR", "type": "MODES", "retain": "1"},
+        {"IEC_path": "CONFIG.RES.INST.NAME", "C_path": "RES__INST.NAME",
+         "vartype": "VAR", "type": "STRING", "retain": "1"},
+        {"IEC_path": "CONFIG.RES.INST.ON", "C_path": "RES__INST.ON",
+         "vartype": "OUT", "type": "BOOL", "retain": "1"},
+    ]
+
+    def testLayout(self):
+        layout, skipped = RetainLayout(self.Variables)
+        self.assertEqual([(v.IEC_path, v.offset, v.size) for v in layout], [
+            ("CONFIG.COUNT", 0, 4),
+            ("CONFIG.RES.INST.NAME", 4, 127),
+            ("CONFIG.RES.INST.ON", 131, 1)])
+        self.assertEqual(skipped, ["CONFIG.RES.INST.MODE"])
+        self.assertEqual(ImageSize(layout), 132)
+
+    def testDecode(self):
+        layout, _skipped = RetainLayout(self.Variables)
+        image = pack("<iB126sB", -7, 5, b"hello", 1)
+        layout = ReadLayout(WriteLayout(layout))
+        self.assertEqual(DecodeRetainImage(layout, image), [
+            ("CONFIG.COUNT", "DINT", -7),
+            ("CONFIG.RES.INST.NAME", "STRING", "hello"),
+            ("CONFIG.RES.INST.ON", "BOOL", True)])
+
+    def testHash(self):
+        """Any change of layout changes hash"""
+        layout, _skipped = RetainLayout(self.Variables)
+        variables = [dict(v) for v in self.Variables]
+        variables[0]["type"] = "UDINT"
+        other, _skipped = RetainLayout(variables)
+        self.assertNotEqual(LayoutHash(layout), LayoutHash(other))
+        self.assertEqual(LayoutHash(layout), LayoutHash(ReadLayout(WriteLayout(layout))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+service_pio.py connected to simulator_pio.py through a pseudo-terminal,
+running tests/projects/simulator built for Native platform
+"""
+
+
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from queue import Queue
+from struct import unpack
+from time import monotonic, sleep
+
+import conftest
+import fake_wx  # service_pio.py task bar icon isn't shown
+import controls  # same import order as IDE, before PLCControler
+from ProjectController import Iec2CSettings
+from runtime import PlcStatus
+from runtime.typemapping import DebugTypesSize
+from util.VariablesTable import LoadVariablesTable
+
+try:
+    from pubsub import pub
+    from serial import Serial
+    from service_pio import MINPLCObject, PLCObject
+    from simulator_pio import FindNativeLibrary, MINSimulator, NativePLC
+except ImportError:
+    pub = None
+
+base_dir = os.path.join(os.path.dirname(conftest.__file__), '..', '..')
+project_dir = os.path.join(base_dir, 'tests', 'projects', 'simulator')
+
+COUNT = "CONFIG.RESOURCE1.MAIN0.COUNT"
+TIMEOUT = 5
+
+
+def HasNativeToolchain():
+    settings = Iec2CSettings(None)
+    return (shutil.which("pio") is not None and
+            shutil.which(settings.findCmd()) is not None and
+            settings.ieclib_path is not None)
+
+
+def WaitFor(condition, timeout=TIMEOUT):
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        sleep(0.01)
+    return True
+
+
+@unittest.skipIf(pub is None, "needs service_pio.py dependencies")
+@unittest.skipIf(sys.platform == "win32", "needs a pseudo-terminal")
+@unittest.skipUnless(HasNativeToolchain(), "needs PlatformIO and matiec")
+class TestSimulator(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.buildpath = os.path.join(cls.tmpdir, "build")
+        subprocess.check_call(
+            [sys.executable, os.path.join(base_dir, "Beremiz_cli.py"),
+             "--project-home", project_dir, "--buildpath", cls.buildpath,
+             "--iec-cache", "", "build"])
+        cls.libpath = FindNativeLibrary(cls.buildpath)
+        if cls.libpath is None:
+            shutil.rmtree(cls.tmpdir)
+            raise AssertionError("Native build produced no PLC library")
+
+        table = LoadVariablesTable(
+            os.path.join(cls.buildpath, "VARIABLES.csv"), DebugTypesSize)
+        cls.count_idx, cls.count_type = table.paths[COUNT]
+        table.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def setUp(self):
+        self.plc = NativePLC(self.libpath,
+                             os.path.join(self.buildpath, "VARIABLES.csv"))
+        self.sim = MINSimulator(self.plc)
+        self.sim_thread = threading.Thread(target=self.sim.run, daemon=True)
+        self.sim_thread.start()
+
+        self.serial = Serial(port=self.sim.port, baudrate=115200, timeout=0.1)
+        queue = Queue()
+        self.async_min = MINPLCObject(self.serial, queue)
+        self.plc_object = PLCObject(os.path.join(self.tmpdir, "wdir"), queue)
+        self.min_thread = threading.Thread(
+            target=asyncio.run, args=(self.async_min.run(),), daemon=True)
+        self.min_thread.start()
+
+    def tearDown(self):
+        self.async_min.shutdown()
+        self.min_thread.join(TIMEOUT)
+        self.sim.shutdown = True
+        self.sim_thread.join(TIMEOUT)
+        self.serial.close()
+        self.sim.close()
+        self.plc.close()
+        pub.unsubAll()
+
+    def Call(self, func, *args):
+        """PLCObject methods block until PLC answers, never hang test"""
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(func(*args)), daemon=True)
+        thread.start()
+        thread.join(TIMEOUT)
+        self.assertFalse(thread.is_alive(), f"{func.__name__} timed out")
+        return result[0]
+
+    def Trace(self, token, count, value=None):
+        """
+        Values of traced Count, until count samples in a row match value
+        """
+        values = []
+        ticks = []
+
+        def sampled():
+            state, samples = self.plc_object.GetTraceVariables(token)
+            self.assertEqual(state, PlcStatus.Started)
+            for tick, buf, _wall_ns in samples:
+                ticks.append(tick)
+                values.append(unpack("<i", buf)[0])
+            tail = values[-count:]
+            return len(tail) == count and \
+                (value is None or tail == [value] * count)
+
+        self.assertTrue(WaitFor(sampled), f"traced {values}")
+        self.assertEqual(ticks, sorted(ticks))
+        return values
+
+    def Start(self):
+        self.assertTrue(WaitFor(lambda: self.async_min._ready),
+                        "no keep alive from simulator")
+        self.Call(self.plc_object.StartPLC)
+        self.assertTrue(
+            WaitFor(lambda: self.plc_object.plcstate == PlcStatus.Started))
+
+    def testStartStop(self):
+        self.Start()
+        self.assertTrue(self.Call(self.plc_object.StopPLC))
+        self.assertEqual(self.plc_object.plcstate, PlcStatus.Stopped)
+
+    def testTrace(self):
+        """Count is incremented every scan"""
+        self.Start()
+        token = self.plc_object.SetTraceVariablesList(
+            [(self.count_idx, self.count_type, None)])
+        values = self.Trace(token, 10)
+        self.assertEqual(values, sorted(values))
+        self.assertGreater(values[-1], values[0])
+
+    def testForce(self):
+        """Forced value is traced instead of incremented one"""
+        self.Start()
+        token = self.plc_object.SetTraceVariablesList(
+            [(self.count_idx, self.count_type, 1000000)])
+        self.Trace(token, 5, 1000000)
+
+        # stale token is refused
+        state, samples = self.plc_object.GetTraceVariables(token - 1)
+        self.assertEqual((state, samples), (PlcStatus.Broken, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Background task scheduler platformio/src/task_sched.c built on host,
+against a simulated clock and PLC scan deadline.
+"""
+
+
+import ctypes
+import unittest
+
+import conftest
+from util.TaskStats import TASK_INFO, TASK_ENTRY, ParseTaskPage, FormatTaskStats
+
+# same as platformio/src/task_sched.h
+TASK_HIGH, TASK_LOW = range(2)
+MAX_TASKS = 12
+TASK_MAX_DEFER = 100
+
+CLOCK = ctypes.CFUNCTYPE(ctypes.c_uint32)
+TASK = ctypes.CFUNCTYPE(None, ctypes.c_ulong, ctypes.c_int)
+
+
+class SimulatedTarget():
+    """micros() clock, advanced by tasks, and next scan due time"""
+
+    def __init__(self):
+        self.now = 0
+        self.scan = None
+        self.runs = []
+        self.clock = CLOCK(lambda: self.now)
+        self.idle = CLOCK(self.idle_time)
+        self.callbacks = []
+
+    def idle_time(self):
+        if self.scan is None:
+            return 0xffffffff
+        return max(self.scan - self.now, 0)
+
+    def task(self, name, duration):
+        def run(dt, run):
+            self.runs.append(name)
+            self.now += duration
+        callback = TASK(run)
+        self.callbacks.append(callback)
+        return callback
+
+
+class TestTaskScheduler(conftest.CLibraryTestCase):
+    """Tasks run between scans, within their budget, and are measured"""
+    sources = ["task_sched.c"]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.lib.sched_read.restype = ctypes.c_size_t
+
+    def setUp(self):
+        self.target = SimulatedTarget()
+        self.lib.sched_init(self.target.clock, self.target.idle)
+
+    def Register(self, name, duration, budget, priority):
+        return self.lib.sched_register(
+            name.encode(), self.target.task(name, duration), budget, priority)
+
+    def Run(self, dt, run=1):
+        self.target.runs = []
+        self.lib.sched_run(ctypes.c_ulong(dt), run)
+        return self.target.runs
+
+    def Read(self, dt, start=0, size=255):
+        buf = ctypes.create_string_buffer(size)
+        length = self.lib.sched_read(start, ctypes.c_ulong(dt), buf, size)
+        return ParseTaskPage(buf.raw[:length])
+
+    def testPriorityOrder(self):
+        """High priority tasks run first, in registration order"""
+        self.Register("wifi", 10, 100, TASK_LOW)
+        self.Register("serial", 10, 100, TASK_HIGH)
+        self.Register("modbus", 10, 100, TASK_LOW)
+        self.Register("blink", 10, 100, TASK_HIGH)
+        self.assertEqual(self.Run(0), ["serial", "blink", "wifi", "modbus"])
+
+    def testTableFull(self):
+        for i in range(MAX_TASKS):
+            self.assertGreaterEqual(self.Register("t%d" % i, 0, 0, TASK_LOW), 0)
+        self.assertEqual(self.Register("more", 0, 0, TASK_LOW), -1)
+
+    def testScanDeadline(self):
+        """Once scan is due, high priority tasks still run, low ones wait"""
+        for name in ("a", "b", "c", "d"):
+            self.Register(name, 300, 1000, TASK_HIGH)
+        self.Register("low", 10, 0, TASK_LOW)
+        self.target.scan = 500
+        self.assertEqual(self.Run(0), ["a", "b", "c", "d"])
+
+        self.target.scan = self.target.now + 10000
+        self.assertEqual(self.Run(1), ["a", "b", "c", "d", "low"])
+
+    def testAlwaysOverrun(self):
+        """PLC overrunning, scan always due, doesn't starve high priority tasks"""
+        self.target.idle = CLOCK(lambda: 0)
+        self.lib.sched_init(self.target.clock, self.target.idle)
+        self.Register("serial", 10, 100, TASK_HIGH)
+        self.Register("modbus", 10, 100, TASK_LOW)
+        self.Register("blink", 10, 100, TASK_HIGH)
+        for dt in range(1, TASK_MAX_DEFER):
+            self.assertEqual(self.Run(dt), ["serial", "blink"])
+
+        _start, _count, _elapsed, tasks = self.Read(TASK_MAX_DEFER)
+        self.assertEqual([(t["name"], t["calls"], t["deferred"]) for t in tasks],
+                         [("serial", TASK_MAX_DEFER - 1, 0),
+                          ("blink", TASK_MAX_DEFER - 1, 0),
+                          ("modbus", 0, TASK_MAX_DEFER - 1)])
+
+    def testBudget(self):
+        """Low priority tasks only start if their budget fits before scan"""
+        self.Register("serial", 10, 1000, TASK_HIGH)
+        self.Register("modbus", 10, 1000, TASK_LOW)
+        self.target.scan = 500
+        self.assertEqual(self.Run(1), ["serial"])
+        self.target.scan = self.target.now + 2000
+        self.assertEqual(self.Run(2), ["serial", "modbus"])
+
+        _start, _count, _elapsed, tasks = self.Read(2)
+        self.assertEqual([t["deferred"] for t in tasks], [0, 1])
+
+    def testMaxDefer(self):
+        """A low priority task deferred too long runs anyway"""
+        self.Register("modbus", 10, 1000, TASK_LOW)
+        self.target.scan = 500
+        self.assertEqual(self.Run(0), [])
+        for dt in range(1, TASK_MAX_DEFER):
+            self.target.scan = self.target.now + 500
+            self.assertEqual(self.Run(dt), [])
+        self.target.scan = self.target.now + 500
+        self.assertEqual(self.Run(TASK_MAX_DEFER), ["modbus"])
+        self.target.scan = self.target.now + 500
+        self.assertEqual(self.Run(TASK_MAX_DEFER + 1), [])
+
+    def testNotRunning(self):
+        """Without PLC scan, every task runs"""
+        self.Register("serial", 10, 100, TASK_HIGH)
+        self.Register("modbus", 5000, 100, TASK_LOW)
+        self.assertEqual(self.Run(0, run=0), ["serial", "modbus"])
+
+    def testStats(self):
+        self.Register("serial", 40, 100, TASK_HIGH)
+        self.Register("eth", 250, 200, TASK_LOW)
+        for dt in range(10):
+            self.Run(dt)
+
+        start, count, elapsed, tasks = self.Read(1000)
+        self.assertEqual((start, count, elapsed), (0, 2, 1000))
+        serial, eth = tasks
+        self.assertEqual((serial["name"], serial["priority"], serial["budget"]),
+                         ("serial", TASK_HIGH, 100))
+        self.assertEqual((serial["calls"], serial["total"], serial["max"],
+                          serial["overruns"]), (10, 400, 40, 0))
+        self.assertEqual((eth["calls"], eth["avg"], eth["overruns"]),
+                         (10, 250, 10))
+        self.assertIn("eth", FormatTaskStats(eth, elapsed))
+
+        self.lib.sched_reset(ctypes.c_ulong(1000))
+        _start, _count, elapsed, tasks = self.Read(1500)
+        self.assertEqual(elapsed, 500)
+        self.assertEqual([t["calls"] for t in tasks], [0, 0])
+
+    def testPages(self):
+        """Task table is read in pages, as sent over MIN"""
+        for i in range(MAX_TASKS):
+            self.Register("task%d" % i, 0, 0, TASK_LOW)
+        size = TASK_INFO.size + 5 * TASK_ENTRY.size
+        names = []
+        while len(names) < MAX_TASKS:
+            start, count, _elapsed, tasks = self.Read(0, len(names), size)
+            self.assertEqual((start, count), (len(names), MAX_TASKS))
+            self.assertLessEqual(len(tasks), 5)
+            names += [t["name"] for t in tasks]
+        self.assertEqual(names, ["task%d" % i for i in range(MAX_TASKS)])
+
+
+if __name__ == '__main__':
+    unittest.main()
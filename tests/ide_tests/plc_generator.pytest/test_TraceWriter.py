@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Trace samples written by util/TraceWriter.py read back
+"""
+
+
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from struct import unpack_from, calcsize
+
+import conftest  # noqa: F401, sets sys.path
+from util.TraceWriter import TRACE_MAGIC, TRACE_VERSION, TRACE_FORMATS, \
+    CSVTraceWriter, BinaryTraceWriter, OpenTraceWriter
+
+NAMES = ["RESOURCE1.INSTANCE0.COUNT", "RESOURCE1.INSTANCE0.ON",
+         "RESOURCE1.INSTANCE0.DELAY", "RESOURCE1.INSTANCE0.MSG",
+         "RESOURCE1.INSTANCE0.LEVEL"]
+TYPES = ["DINT", "BOOL", "TIME", "STRING", "LREAL"]
+
+# wall clock of 2024-01-02T03:04:05.5
+WALL = 1704164645500000000
+
+BATCHES = [
+    [(10, WALL, (-5, True, timedelta(seconds=1, microseconds=500), "héllo", 1.5)),
+     (11, None, (7, False, timedelta(days=1), "", -0.25))],
+    [],
+    [(12, WALL + 10 ** 9, (2 ** 31 - 1, True, timedelta(0), "x" * 126, 0.0))],
+]
+
+
+def ReadBinaryTrace(data):
+    """Return names, types and (tick, wall, values) of a binary trace"""
+    if not data.startswith(TRACE_MAGIC):
+        raise ValueError("not a trace")
+    offset = len(TRACE_MAGIC)
+    version, ncols = unpack_from("<BH", data, offset)
+    offset += 3
+    if version != TRACE_VERSION:
+        raise ValueError("unknown version")
+    names, types = [], []
+    for _i in range(ncols):
+        (n,) = unpack_from("<H", data, offset)
+        names.append(data[offset + 2:offset + 2 + n].decode())
+        offset += 2 + n
+        (t,) = unpack_from("<B", data, offset)
+        types.append(data[offset + 1:offset + 1 + t].decode())
+        offset += 1 + t
+
+    samples = []
+    while offset < len(data):
+        (nrows,) = unpack_from("<I", data, offset + 1)
+        offset += 5
+        ticks = unpack_from("<%dQ" % nrows, data, offset)
+        walls = unpack_from("<%dq" % nrows, data, offset + 8 * nrows)
+        offset += 16 * nrows
+        columns = []
+        for iectype in types:
+            if iectype == "STRING":
+                column = []
+                for _row in range(nrows):
+                    length = data[offset]
+                    column.append(data[offset + 1:offset + 1 + length].decode())
+                    offset += 1 + length
+            else:
+                fmt = "<%d%s" % (nrows, TRACE_FORMATS[iectype])
+                column = list(unpack_from(fmt, data, offset))
+                offset += calcsize(fmt)
+            columns.append(column)
+        samples += [(tick, None if wall == -1 else wall, tuple(values))
+                    for tick, wall, values in zip(ticks, walls, zip(*columns))]
+    return names, types, samples
+
+
+def Expected(value):
+    """Values as stored, times in ns"""
+    if isinstance(value, timedelta):
+        return ((value.days * 86400 + value.seconds) * 1000000
+                + value.microseconds) * 1000
+    return value
+
+
+class TestTraceWriter(unittest.TestCase):
+
+    def testCSV(self):
+        fobj = io.StringIO()
+        writer = CSVTraceWriter(fobj, NAMES, TYPES)
+        for batch in BATCHES:
+            writer.write(batch)
+        rows = list(csv.reader(io.StringIO(fobj.getvalue())))
+        writer.close()
+
+        self.assertEqual(rows[0], ["tick", "time"] + NAMES)
+        samples = [s for batch in BATCHES for s in batch]
+        self.assertEqual(len(rows) - 1, len(samples))
+        for row, (tick, wall, values) in zip(rows[1:], samples):
+            self.assertEqual(int(row[0]), tick)
+            if wall is None:
+                self.assertEqual(row[1], "")
+            else:
+                self.assertEqual(datetime.fromisoformat(row[1]),
+                                 datetime.utcfromtimestamp(wall * 1e-9))
+            count, on, delay, msg, level = row[2:]
+            self.assertEqual((int(count), on == "True", int(delay), msg, float(level)),
+                             tuple(Expected(v) for v in values))
+
+    def testBinary(self):
+        fobj = io.BytesIO()
+        writer = BinaryTraceWriter(fobj, NAMES, TYPES)
+        for batch in BATCHES:
+            writer.write(batch)
+        data = fobj.getvalue()
+        writer.close()
+
+        names, types, samples = ReadBinaryTrace(data)
+        self.assertEqual((names, types), (NAMES, TYPES))
+        self.assertEqual(samples, [
+            (tick, wall, tuple(Expected(v) for v in values))
+            for batch in BATCHES for tick, wall, values in batch])
+
+    def testOpenFile(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "trace.bin")
+            writer = OpenTraceWriter(path, "bin", NAMES[:1], TYPES[:1])
+            writer.write([(1, None, (42,))])
+            writer.close()
+            with open(path, "rb") as f:
+                self.assertEqual(ReadBinaryTrace(f.read())[2], [(1, None, (42,))])
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Memory-mapped table of VARIABLES.csv, util/VariablesTable.py
+"""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import conftest  # noqa: F401, sets sys.path
+from util import VariablesTable as vt
+from util.VariablesTable import LoadVariablesTable
+
+DEBUG_TYPES = {"BOOL": 1, "INT": 2, "TIME": 8}
+
+VARIABLES_CSV = """\
+// Programs
+0;CONFIG.RES0.INST0;main;
+1;CONFIG.RES0.INST1;other;
+
+// Variables
+0;FB;CONFIG.RES0.INST0;CONFIG.RES0.INST0;MAIN;;
+1;VAR;CONFIG.RES0.INST0.COUNT;CONFIG.RES0.INST0.COUNT;INT;;
+2;VAR;CONFIG.RES0.INST0.TON0.Q;CONFIG.RES0.INST0.TON0.Q;BOOL;;
+3;VAR;CONFIG.RES0.INST0.TON0.PT;CONFIG.RES0.INST0.TON0.PT;TIME;;
+4;VAR;CONFIG.RES0.INST0.TON0.NAME;CONFIG.RES0.INST0.TON0.NAME;STRING;;
+5;OUT;CONFIG.RES0.INST1.LAMP;CONFIG.RES0.INST1.LAMP;BOOL;;1
+6;VAR;CONFIG.RES0.INST10.X;CONFIG.RES0.INST10.X;INT;;
+
+// Ticktime
+20000000
+"""
+
+
+class TestVariablesTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csvfile = os.path.join(self.tmpdir, "VARIABLES.csv")
+        self.cachefile = os.path.join(self.tmpdir, "VARIABLES.cache")
+        self.tables = []
+        self.WriteCSV(VARIABLES_CSV)
+
+    def tearDown(self):
+        for table in self.tables:
+            table.close()
+        shutil.rmtree(self.tmpdir)
+
+    def WriteCSV(self, content, mtime_ns=None):
+        with open(self.csvfile, "w") as f:
+            f.write(content)
+        if mtime_ns is not None:
+            os.utime(self.csvfile, ns=(mtime_ns, mtime_ns))
+
+    def Load(self, **kwargs):
+        table = LoadVariablesTable(self.csvfile, DEBUG_TYPES, **kwargs)
+        self.tables.append(table)
+        return table
+
+    def testBuild(self):
+        table = self.Load()
+        self.assertTrue(os.path.isfile(self.cachefile))
+        self.assertEqual(table.ticktime, 20000000)
+        self.assertEqual([dict(p) for p in table.programs], [
+            {"num": "0", "C_path": "RES0__INST0", "type": "main"},
+            {"num": "1", "C_path": "RES0__INST1", "type": "other"}])
+        self.assertEqual(len(table.variables), 7)
+        self.assertEqual(table.variables[1]["C_path"], "RES0__INST0.COUNT")
+        self.assertEqual(table.variables[5]["retain"], "1")
+        # FB and STRING, not in debug types, can't be debugged
+        self.assertEqual([v["IEC_path"] for v in table.debug_variables], [
+            "CONFIG.RES0.INST0.COUNT", "CONFIG.RES0.INST0.TON0.Q",
+            "CONFIG.RES0.INST0.TON0.PT", "CONFIG.RES0.INST1.LAMP",
+            "CONFIG.RES0.INST10.X"])
+        self.assertEqual(table.paths["CONFIG.RES0.INST1.LAMP"], (3, "BOOL"))
+        self.assertNotIn("CONFIG.RES0.INST0.TON0.NAME", table.paths)
+        self.assertEqual(list(table.paths), sorted(table.paths))
+
+    def testReopen(self):
+        """Unchanged CSV isn't read again"""
+        self.Load()
+        with mock.patch.object(vt, "_BuildCache") as build, \
+                mock.patch.object(vt.hashlib, "md5", wraps=vt.hashlib.md5) as md5:
+            table = self.Load()
+        build.assert_not_called()
+        # only debug filter digest, CSV isn't hashed
+        self.assertEqual(md5.call_count, 1)
+        self.assertEqual(table.variables[2]["IEC_path"], "CONFIG.RES0.INST0.TON0.Q")
+
+    def testRewrittenSameContent(self):
+        """CSV rewritten by IEC2C with same content keeps cache, with new stamp"""
+        first = self.Load()
+        stamp = (first.mtime_ns, first.size)
+        self.WriteCSV(VARIABLES_CSV, mtime_ns=first.mtime_ns + 10 ** 9)
+        with mock.patch.object(vt, "_BuildCache") as build:
+            table = self.Load()
+        build.assert_not_called()
+        self.assertNotEqual((table.mtime_ns, table.size), stamp)
+
+        with mock.patch.object(vt.hashlib, "md5", wraps=vt.hashlib.md5) as md5:
+            self.Load()
+        self.assertEqual(md5.call_count, 1)
+
+    def testStale(self):
+        self.Load()
+        self.WriteCSV(VARIABLES_CSV.replace("COUNT;INT", "COUNT;TIME"))
+        table = self.Load()
+        self.assertEqual(table.paths["CONFIG.RES0.INST0.COUNT"], (0, "TIME"))
+
+        # debug filter and debuggable types are part of cache key
+        table = self.Load(debug_filter="ALL\nCONFIG.RES0.INST1")
+        self.assertEqual(list(table.paths), ["CONFIG.RES0.INST1.LAMP"])
+        table = LoadVariablesTable(self.csvfile, {"INT": 2})
+        self.tables.append(table)
+        self.assertEqual(list(table.paths), ["CONFIG.RES0.INST10.X"])
+
+    def testPrefix(self):
+        paths = self.Load().paths
+        self.assertTrue(paths.HasPrefix("CONFIG.RES0.INST0.TON0"))
+        self.assertFalse(paths.HasPrefix("CONFIG.RES1"))
+        self.assertEqual([p for p, _entry in paths.PrefixItems("CONFIG.RES0.INST1")],
+                         ["CONFIG.RES0.INST1.LAMP", "CONFIG.RES0.INST10.X"])
+        self.assertEqual([p for p, _entry in paths.PrefixItems("CONFIG.RES0.INST1.")],
+                         ["CONFIG.RES0.INST1.LAMP"])
+        self.assertEqual(dict(paths.PrefixItems("CONFIG.RES0.INST0.TON0.P")),
+                         {"CONFIG.RES0.INST0.TON0.PT": (2, "TIME")})
+        self.assertEqual(paths.Children(""), ["CONFIG"])
+        self.assertEqual(paths.Children("CONFIG.RES0"), ["INST0", "INST1", "INST10"])
+        self.assertEqual(paths.Children("CONFIG.RES0.INST0"), ["COUNT", "TON0"])
+        self.assertEqual(paths.Children("CONFIG.RES0.INST0.TON0."), ["PT", "Q"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Content hash based build graph.
+
+Each build stage declares a digest of its inputs and the files it produces.
+A stage whose inputs digest did not change and whose outputs are still on
+disk, untouched, can be skipped. The graph is kept as JSON in build dir so
+that it survives IDE restarts and command line builds.
+"""
+
+
+import hashlib
+import json
+import os
+
+BUILD_GRAPH_FILE = "build_graph.json"
+BUILD_GRAPH_VERSION = 1
+
+
+def ContentDigest(*items):
+    """
+    Return md5 hex digest of given strings, bytes or nested lists of them
+    """
+    hasher = hashlib.md5()
+
+    def update(item):
+        if isinstance(item, (list, tuple)):
+            hasher.update(b"[%d]" % len(item))
+            for i in item:
+                update(i)
+        else:
+            if item is None:
+                item = b"\0"
+            elif not isinstance(item, bytes):
+                item = str(item).encode()
+            hasher.update(b"%d:" % len(item) + item)
+
+    update(list(items))
+    return hasher.hexdigest()
+
+
+def FileDigest(path):
+    """
+    Return md5 hex digest of file content, None if file cannot be read
+    """
+    hasher = hashlib.md5()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                hasher.update(chunk)
+    except (IOError, OSError):
+        return None
+    return hasher.hexdigest()
+
+
+def TreeDigest(path, exclude=("__pycache__", ".pio")):
+    """
+    Return digest of all files names and contents below path
+    """
+    items = []
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d not in exclude)
+        for name in sorted(files):
+            fpath = os.path.join(root, name)
+            items.append((os.path.relpath(fpath, path), FileDigest(fpath)))
+    return ContentDigest(items)
+
+
+def WriteIfChanged(path, content):
+    """
+    Write content to path only if it differs from what is already there,
+    keeping mtime of unchanged files so that C compiler won't rebuild them.
+    Return True if file was written.
+    """
+    mode = "b" if isinstance(content, bytes) else ""
+    try:
+        with open(path, "r" + mode) as f:
+            if f.read() == content:
+                return False
+    except (IOError, OSError, UnicodeDecodeError):
+        pass
+
+    with open(path, "w" + mode) as f:
+        f.write(content)
+    return True
+
+
+class BuildGraph(object):
+    """
+    Persistent record of build stages inputs and outputs
+    """
+
+    def __init__(self, buildpath):
+        self.buildpath = buildpath
+        self.path = os.path.join(buildpath, BUILD_GRAPH_FILE)
+        self.skipped = []
+        self.stages = {}
+        try:
+            with open(self.path, "r") as f:
+                graph = json.load(f)
+            if graph.get("version") == BUILD_GRAPH_VERSION:
+                self.stages = graph["stages"]
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"version": BUILD_GRAPH_VERSION,
+                           "stages": self.stages}, f, indent=1)
+            os.replace(tmp, self.path)
+        except (IOError, OSError):
+            pass
+
+    def _abspath(self, path):
+        return os.path.join(self.buildpath, path)
+
+    def UpToDate(self, stage, inputs):
+        """
+        Return True if stage already ran with same inputs and
+        all of its outputs are unchanged since
+        """
+        record = self.stages.get(stage)
+        if record is None or record["inputs"] != inputs:
+            return False
+        return all(FileDigest(self._abspath(path)) == digest
+                   for path, digest in record["outputs"].items())
+
+    def Outputs(self, stage):
+        """
+        Return absolute paths of files produced by last run of stage
+        """
+        record = self.stages.get(stage)
+        if record is None:
+            return []
+        return [self._abspath(path) for path in record["outputs"]]
+
+    def Data(self, stage, default=None):
+        """
+        Return extra data stored with last run of stage
+        """
+        record = self.stages.get(stage)
+        if record is None:
+            return default
+        return record.get("data", default)
+
+    def Done(self, stage, inputs, outputs, data=None):
+        """
+        Record successful run of stage
+        """
+        self.stages[stage] = {
+            "inputs": inputs,
+            "outputs": {
+                os.path.relpath(path, self.buildpath): FileDigest(path)
+                for path in outputs},
+            "data": data,
+        }
+        self._save()
+
+    def Invalidate(self, stage):
+        """
+        Forget stage, forcing it to run next time
+        """
+        if self.stages.pop(stage, None) is not None:
+            self._save()
+
+    def Skip(self, stage):
+        """
+        Record stage as skipped for current build
+        """
+        self.skipped.append(stage)
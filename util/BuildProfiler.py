@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Build stages timing.
+
+Code anywhere in build path marks stages with ProfileStage(), which costs
+nothing unless a profiler was started. Result is written in Chrome trace
+event format, that chrome://tracing, Perfetto and speedscope can open.
+"""
+
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+BUILD_PROFILE_FILE = "build_profile.json"
+
+_profiler = None
+
+
+class BuildProfiler(object):
+    """
+    Collect timed stages of one build
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def Now(self):
+        return time.perf_counter()
+
+    def Record(self, name, start, end, category="build", **args):
+        """
+        Add a stage, start and end being Now() values
+        """
+        with self.lock:
+            self.events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            })
+
+    def Write(self, path):
+        with self.lock:
+            events = sorted(self.events, key=lambda e: (e["tid"], e["ts"]))
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events,
+                       "displayTimeUnit": "ms"}, f, indent=0)
+
+    def Summary(self, limit=20):
+        """
+        Return text table of stages, longest total time first.
+        Stages with same name are summed.
+        """
+        with self.lock:
+            events = list(self.events)
+        totals = {}
+        for event in events:
+            count, duration = totals.get((event["cat"], event["name"]), (0, 0))
+            totals[(event["cat"], event["name"])] = (count + 1, duration + event["dur"])
+        rows = sorted(totals.items(), key=lambda item: -item[1][1])
+
+        lines = ["%-10s %-40s %6s %10s" % ("Category", "Stage", "Count", "Time (s)")]
+        for (category, name), (count, duration) in rows[:limit]:
+            if len(name) > 40:
+                name = name[:37] + "..."
+            lines.append("%-10s %-40s %6d %10.3f" % (category, name, count, duration * 1e-6))
+        if len(rows) > limit:
+            lines.append(_("... %d more stages in trace file") % (len(rows) - limit))
+        return "\n".join(lines) + "\n"
+
+
+def StartProfiling():
+    global _profiler
+    _profiler = BuildProfiler()
+    return _profiler
+
+
+def StopProfiling():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def GetProfiler():
+    """
+    Return active profiler, None when not profiling
+    """
+    return _profiler
+
+
+@contextmanager
+def ProfileStage(name, category="build", **args):
+    """
+    Time enclosed block as a build stage if profiling
+    """
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    start = profiler.Now()
+    try:
+        yield
+    finally:
+        profiler.Record(name, start, profiler.Now(), category, **args)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+PLC millis() of keep alive replies and scan timestamps, related to host
+wall clock, see service_pio.py.
+"""
+
+
+from collections import deque
+
+SYNC_SAMPLES = 32
+
+
+class Unwrap32():
+    """
+    Extend a wrapping 32 bit counter to 64 bits
+    """
+
+    def __init__(self):
+        self.last = None
+        self.high = 0
+
+    def reset(self):
+        self.last = None
+        self.high = 0
+
+    def __call__(self, value):
+        """
+        Extend value to the epoch closest to last one, values older than
+        last one, e.g. taken before it but received after, don't move it
+        """
+        full = self.nearest(value)
+        if self.last is None or full > self.high + self.last:
+            self.high, self.last = full - value, value
+        return full
+
+    def nearest(self, value):
+        """
+        Extend a value taken around the last one, e.g. a queued timestamp,
+        to the closest epoch, without changing state
+        """
+        if self.last is None:
+            return value
+        delta = (value - self.last) & 0xffffffff
+        if delta >= 0x80000000:
+            delta -= 0x100000000
+        return self.high + self.last + delta
+
+
+class ClockSync():
+    """
+    Estimate relation between PLC millis() and host wall clock
+
+    NTP style : each sample is a request/reply round trip, PLC time is
+    assumed to be taken at the middle of the round trip. Only the best half
+    of the samples, those with shortest round trip, are kept to fit a line
+    whose slope gives the PLC clock drift.
+    """
+
+    def __init__(self, samples=SYNC_SAMPLES):
+        self.samples = deque(maxlen=samples)
+        self.unwrap = Unwrap32()
+        self.ref = None
+        self.rate = 1000000.0
+        self.offset = 0.0
+
+    def reset(self):
+        self.samples.clear()
+        self.unwrap.reset()
+        self.ref = None
+
+    def add(self, t0, t1, plc_ms):
+        """
+        t0 and t1 are host time_ns() when request was sent and reply received
+        """
+        ms = self.unwrap(plc_ms)
+        self.samples.append((t1 - t0, ms, (t0 + t1) // 2))
+        best = sorted(self.samples)[:max(1, len(self.samples) // 2)]
+
+        # relative to a reference sample, floats can't hold epoch in ns
+        _rtt, ms_ref, ns_ref = best[0]
+        x = [s[1] - ms_ref for s in best]
+        y = [s[2] - ns_ref for s in best]
+        n = len(best)
+        mx, my = sum(x) / n, sum(y) / n
+        sxx = sum((a - mx) ** 2 for a in x)
+        if sxx > 0:
+            self.rate = sum((a - mx) * (b - my) for a, b in zip(x, y)) / sxx
+        self.offset = my - self.rate * mx
+        self.ref = (ms_ref, ns_ref)
+
+    def drift_ppm(self):
+        return (self.rate / 1000000.0 - 1.0) * 1000000.0
+
+    def to_wall_ns(self, plc_ms):
+        """
+        Return estimated host time_ns() for given unwrapped PLC millis()
+        """
+        if self.ref is None:
+            return None
+        ms_ref, ns_ref = self.ref
+        return ns_ref + int(self.offset + self.rate * (plc_ms - ms_ref))
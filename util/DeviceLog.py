@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Log messages kept by embedded runtime, see platformio/src/logbuf.c.
+
+Messages of LOGGER blocks and runtime errors are queued in a ring buffer
+on target, host drains it page by page. Messages that don't fit in buffer
+are dropped and counted.
+"""
+
+
+from struct import Struct
+
+# same as platformio/src/serial.cpp and logbuf.h
+LOG_PAGE_SIZE = 255
+LOG_MSG_SIZE = 96
+
+# dropped messages count, more messages pending flag
+LOG_HEADER = Struct("<IB")
+
+# level, message length, tick, millis()
+LOG_RECORD = Struct("<BBII")
+
+
+def ParseLogPage(payload):
+    """
+    Return dropped count, pending flag and list of (level, tick, ms, msg)
+    of a page of log messages sent by target
+    """
+    dropped, more = LOG_HEADER.unpack_from(payload)
+    records = []
+    offset = LOG_HEADER.size
+    while offset + LOG_RECORD.size <= len(payload):
+        level, size, tick, ms = LOG_RECORD.unpack_from(payload, offset)
+        offset += LOG_RECORD.size
+        msg = payload[offset:offset + size].decode(errors="replace")
+        offset += size
+        records.append((level, tick, ms, msg))
+    return dropped, bool(more), records
+
+
+def PackLogPage(dropped, records):
+    """
+    Pack as many (level, tick, ms, msg) records as fit in a page, return
+    page and count of packed records
+    """
+    page = b''
+    count = 0
+    for level, tick, ms, msg in records:
+        data = msg.encode()[:LOG_MSG_SIZE]
+        record = LOG_RECORD.pack(level, len(data), tick, ms) + data
+        if LOG_HEADER.size + len(page) + len(record) > LOG_PAGE_SIZE:
+            break
+        page += record
+        count += 1
+    more = count < len(records)
+    return LOG_HEADER.pack(dropped, more) + page, count
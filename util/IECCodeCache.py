@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Content addressed cache of IEC to C compiler output.
+
+Entries are directories named after a digest of everything that influences
+iec2c output (ST code, compiler binary, options and IEC library). Each entry
+holds generated files and a manifest. Entries are created atomically, so
+cache directory can be shared between projects, users and build machines,
+e.g. on a network drive. Least recently used entries are evicted.
+"""
+
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from util.BuildGraph import WriteIfChanged
+
+IEC_CACHE_MAX_ENTRIES = 64
+MANIFEST_FILE = "manifest.json"
+# temporary directories older than this are considered abandoned (seconds)
+STALE_TEMP_AGE = 3600
+
+
+def DefaultIECCodeCachePath():
+    """
+    Return cache directory from BEREMIZ_IEC_CACHE environment variable,
+    or per user default. Empty variable disables cache.
+    """
+    path = os.environ.get("BEREMIZ_IEC_CACHE")
+    if path is None:
+        path = os.path.join(
+            os.path.expanduser("~"), ".cache", "beremiz", "iec2c")
+    return path or None
+
+
+class IECCodeCache(object):
+    """
+    Store and restore iec2c generated files keyed by inputs digest
+    """
+
+    def __init__(self, path, max_entries=IEC_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+
+    def _entrypath(self, key):
+        return os.path.join(self.path, key)
+
+    def Restore(self, key, buildpath):
+        """
+        Copy files of cached entry into buildpath.
+        Return data stored with entry, None if not in cache.
+        """
+        entrypath = self._entrypath(key)
+        try:
+            with open(os.path.join(entrypath, MANIFEST_FILE), "r") as f:
+                manifest = json.load(f)
+            contents = []
+            for filename in manifest["files"]:
+                with open(os.path.join(entrypath, filename), "rb") as f:
+                    contents.append((filename, f.read()))
+        except (IOError, OSError, ValueError, KeyError):
+            # missing, or evicted while reading
+            return None
+
+        for filename, content in contents:
+            WriteIfChanged(os.path.join(buildpath, filename), content)
+
+        # mark entry as recently used
+        try:
+            os.utime(os.path.join(entrypath, MANIFEST_FILE))
+        except OSError:
+            pass
+        return manifest.get("data")
+
+    def Store(self, key, paths, data=None):
+        """
+        Add files to cache under key, with some extra JSON data
+        """
+        if os.path.isdir(self._entrypath(key)):
+            return
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmppath = tempfile.mkdtemp(prefix=".tmp-", dir=self.path)
+        except OSError:
+            return
+        try:
+            for path in paths:
+                shutil.copyfile(path, os.path.join(tmppath, os.path.basename(path)))
+            with open(os.path.join(tmppath, MANIFEST_FILE), "w") as f:
+                json.dump({"files": [os.path.basename(path) for path in paths],
+                           "data": data,
+                           "created": time.time()}, f)
+            # rename is atomic, concurrent builders storing
+            # same key make all but one rename fail
+            os.rename(tmppath, self._entrypath(key))
+        except (IOError, OSError):
+            shutil.rmtree(tmppath, ignore_errors=True)
+            return
+        self.Evict()
+
+    def Evict(self):
+        """
+        Remove least recently used entries above max_entries
+        """
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.path):
+            entrypath = self._entrypath(name)
+            if name.startswith("."):
+                # leftovers of an interrupted Store or Evict
+                try:
+                    if now - os.path.getmtime(entrypath) > STALE_TEMP_AGE:
+                        shutil.rmtree(entrypath, ignore_errors=True)
+                except OSError:
+                    pass
+                continue
+            try:
+                entries.append(
+                    (os.path.getmtime(os.path.join(entrypath, MANIFEST_FILE)), name))
+            except OSError:
+                pass
+        entries.sort()
+        for _mtime, name in entries[:max(0, len(entries) - self.max_entries)]:
+            # rename first, so that readers never see a partial entry
+            trash = os.path.join(self.path, ".trash-" + name)
+            try:
+                os.rename(self._entrypath(name), trash)
+            except OSError:
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+IEC 61131-3 TIME literals, parsed without GUI
+"""
+
+
+import re
+import datetime
+
+SECOND = 1000000
+MINUTE = 60 * SECOND
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+IEC_TIME_MODEL = re.compile(r"(?:(?:T|TIME)#)?(-)?(?:(%(float)s)D_?)?(?:(%(float)s)H_?)?(?:(%(float)s)M(?!S)_?)?(?:(%(float)s)S_?)?(?:(%(float)s)MS)?$" % {"float": r"[0-9]+(?:\.[0-9]+)?"})
+
+
+def gettime(v):
+    """
+    Duration given by TIME literal as timedelta, None if invalid
+    """
+    result = IEC_TIME_MODEL.match(v.upper())
+    if result is not None:
+        negative, days, hours, minutes, seconds, milliseconds = result.groups()
+        microseconds = 0
+        not_null = False
+        for value, factor in [(days, DAY),
+                              (hours, HOUR),
+                              (minutes, MINUTE),
+                              (seconds, SECOND),
+                              (milliseconds, 1000)]:
+            if value is not None:
+                microseconds += float(value) * factor
+                not_null = True
+        if not not_null:
+            return None
+        if negative is not None:
+            microseconds = -microseconds
+        return datetime.timedelta(microseconds=microseconds)
+
+    else:
+        return None
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Build time planning of Modbus master requests, see platformio/src/modbus.h.
+
+Each located variable of Modbus node is a remote item, coil or register of
+a slave. Items are coalesced per slave and function into as few block
+requests as possible, runtime then polls the resulting request table.
+"""
+
+
+from collections import namedtuple
+
+READ_COILS = 1
+READ_DISCRETE_INPUTS = 2
+READ_HOLDING_REGISTERS = 3
+READ_INPUT_REGISTERS = 4
+WRITE_MULTIPLE_COILS = 15
+WRITE_MULTIPLE_REGISTERS = 16
+
+# function used for (DIR, SIZE) of located variables
+LOCATION_FUNCTIONS = {
+    ('I', 'X'): READ_DISCRETE_INPUTS,
+    ('M', 'X'): READ_COILS,
+    ('Q', 'X'): WRITE_MULTIPLE_COILS,
+    ('I', 'W'): READ_INPUT_REGISTERS,
+    ('M', 'W'): READ_HOLDING_REGISTERS,
+    ('Q', 'W'): WRITE_MULTIPLE_REGISTERS,
+}
+
+BIT_FUNCTIONS = (READ_COILS, READ_DISCRETE_INPUTS, WRITE_MULTIPLE_COILS)
+WRITE_FUNCTIONS = (WRITE_MULTIPLE_COILS, WRITE_MULTIPLE_REGISTERS)
+
+# most items carried by one request, as in Modbus application protocol
+MAX_ITEMS = {
+    READ_COILS: 2000,
+    READ_DISCRETE_INPUTS: 2000,
+    READ_HOLDING_REGISTERS: 125,
+    READ_INPUT_REGISTERS: 125,
+    WRITE_MULTIPLE_COILS: 1968,
+    WRITE_MULTIPLE_REGISTERS: 123,
+}
+
+MIN_SLAVE, MAX_SLAVE = 1, 247
+MAX_ADDRESS = 0xFFFF
+
+ModbusItem = namedtuple('ModbusItem', 'slave function address')
+ModbusRequest = namedtuple('ModbusRequest', 'slave function start count')
+
+
+def LocationItem(direction, size, slave, address):
+    """
+    Remote item of located variable, None if location can't be one
+    """
+    function = LOCATION_FUNCTIONS.get((direction, size))
+    if function is None or \
+       not MIN_SLAVE <= slave <= MAX_SLAVE or \
+       not 0 <= address <= MAX_ADDRESS:
+        return None
+    return ModbusItem(slave, function, address)
+
+
+def PlanRequests(items, max_gap=0, max_items=None):
+    """
+    Coalesce items into block requests, sorted by slave, function and start.
+    Reads may span up to max_gap unused items if it saves a request, writes
+    never do since they would overwrite them. max_items further limits
+    the number of items in a request.
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault((item.slave, item.function), set()).add(item.address)
+
+    requests = []
+    for (slave, function), addresses in sorted(groups.items()):
+        limit = MAX_ITEMS[function]
+        if max_items is not None:
+            limit = min(limit, max_items)
+        gap = 0 if function in WRITE_FUNCTIONS else max_gap
+
+        # extending each block as far as possible gives fewest blocks
+        start = last = None
+        for address in sorted(addresses):
+            if start is not None and \
+               address - last - 1 <= gap and \
+               address - start < limit:
+                last = address
+                continue
+            if start is not None:
+                requests.append(
+                    ModbusRequest(slave, function, start, last - start + 1))
+            start = last = address
+        requests.append(ModbusRequest(slave, function, start, last - start + 1))
+
+    return requests
+
+
+def MapItems(requests, items):
+    """
+    Return dict of (request index, offset in request) of each item
+    """
+    mapping = {}
+    for item in items:
+        for idx, req in enumerate(requests):
+            if (req.slave, req.function) == (item.slave, item.function) and \
+               req.start <= item.address < req.start + req.count:
+                mapping[item] = (idx, item.address - req.start)
+                break
+        else:
+            raise KeyError(item)
+    return mapping
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Scan time profiling of POUs.
+
+Bodies of programs and function blocks generated by IEC2C in POUS.c are
+wrapped so that each call is timed on target, see pou_profile.h.j2.
+Target accumulates calls count, min, max and total time of each POU, and
+total time spent in POU itself, not counting POUs it called.
+
+Table is read over MIN by pages :
+
+    request  : uint16 first POU index
+    response : header, then up to PROFILE_PAGE entries
+"""
+
+
+import re
+from struct import Struct
+
+POU_PROFILE_NAMES = "pou_profile.txt"
+
+# first POU index, POU count, timer frequency (Hz)
+PROFILE_HEADER = Struct("<HHI")
+# calls, min, max, total and self time, in timer ticks
+PROFILE_ENTRY = Struct("<IIIQQ")
+PROFILE_PAGE = (255 - PROFILE_HEADER.size) // PROFILE_ENTRY.size
+
+BODY_MODEL = re.compile(
+    r"^([ \t]*)void (\w+)_body__\((\w+) \*data__\) \{[ \t]*$", re.MULTILINE)
+
+INCLUDE_POUS = '#include "POUS.c"'
+
+
+def InstrumentPOUs(code):
+    """
+    Return POUS.c code with each POU body timed, and POU names in the
+    order of profile table
+    """
+    names = []
+
+    def wrap(match):
+        indent, name, ctype = match.groups()
+        idx = len(names)
+        names.append(name)
+        return (
+            f"{indent}static void {name}_body__profiled({ctype} *data__);\n"
+            f"{indent}void {name}_body__({ctype} *data__) {{\n"
+            f"{indent}  POU_PROFILE({idx}, {name}_body__profiled(data__));\n"
+            f"{indent}}}\n"
+            f"{indent}static void {name}_body__profiled({ctype} *data__) {{")
+
+    code = BODY_MODEL.sub(wrap, code)
+    return '#include "pou_profile.h"\n' + code, names
+
+
+def ParseProfilePage(payload):
+    """
+    Return first POU index, POU count, timer frequency and entries
+    of a profile page received from target
+    """
+    start, count, freq = PROFILE_HEADER.unpack_from(payload)
+    entries = [
+        PROFILE_ENTRY.unpack_from(payload, offset)
+        for offset in range(PROFILE_HEADER.size,
+                            len(payload) - PROFILE_ENTRY.size + 1,
+                            PROFILE_ENTRY.size)]
+    return start, count, freq, entries
+
+
+def ProfileRows(names, freq, entries):
+    """
+    Return (name, calls, min, avg, max, self) rows, times in us
+    """
+    rows = []
+    scale = 1e6 / freq if freq else 0
+    for i, (calls, tmin, tmax, total, self_total) in enumerate(entries):
+        name = names[i] if i < len(names) else "#%d" % i
+        if calls:
+            rows.append((name, calls, tmin * scale, total * scale / calls,
+                         tmax * scale, self_total * scale / calls))
+        else:
+            rows.append((name, 0, 0.0, 0.0, 0.0, 0.0))
+    return rows
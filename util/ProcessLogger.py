@@ -30,6 +30,7 @@ import ctypes
 import time
 from threading import Timer, Lock, Thread, Semaphore, Condition
 import signal
+from util.BuildProfiler import GetProfiler
 
 _debug = os.path.exists("BEREMIZ_DEBUG")
 
@@ -142,6 +143,11 @@ class ProcessLogger(object):
         if _debug and self.logger:
             self.logger.write("(DEBUG) launching:\n" + self.Command_str + "\n")
 
+        # external processes are part of build profile
+        self.profiler = GetProfiler()
+        if self.profiler is not None:
+            self.starttime = self.profiler.Now()
+
         self.Proc = subprocess.Popen(self.Command, encoding="utf-8", **popenargs)
 
         self.outt = outputThread(
@@ -194,6 +200,11 @@ class ProcessLogger(object):
         if self.timeout:
             self.timeout.cancel()
         self.exitcode = ecode
+        if self.profiler is not None:
+            self.profiler.Record(
+                os.path.basename(self.Command[0].decode(sys.getfilesystemencoding())),
+                self.starttime, self.profiler.Now(), "process",
+                command=self.Command_str, status=ecode)
         if self.exitcode != 0:
             self.log_the_end(ecode, pid)
         if self.finish_callback is not None:
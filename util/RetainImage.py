@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Retained variables of embedded runtime, see platformio/src/retain.cpp.
+
+Values of variables declared RETAIN are packed, in VARIABLES.csv order,
+into an image whose layout is generated at build time in retain.c. Target
+saves changed blocks of image to flash and restores them at boot. Layout
+hash tells images of another program apart.
+
+Image is read over MIN by pages :
+
+    request  : uint16 offset
+    response : header, then up to RETAIN_PAGE bytes of image
+"""
+
+
+import zlib
+from collections import namedtuple
+from struct import Struct
+
+RETAIN_LAYOUT = "retain_layout.csv"
+
+# same as platformio/src/retain_store.h
+RETAIN_BLOCK_SIZE = 32
+
+# offset, image size (uint16), layout hash, records written, pages erased
+RETAIN_HEADER = Struct("<HHIII")
+RETAIN_PAGE = 255 - RETAIN_HEADER.size
+
+# value formats on 32 bits targets, TIME and alike are seconds and ns
+RETAIN_FORMATS = {
+    "BOOL": "B", "SINT": "b", "USINT": "B", "BYTE": "B",
+    "INT": "h", "UINT": "H", "WORD": "H",
+    "DINT": "i", "UDINT": "I", "DWORD": "I",
+    "LINT": "q", "ULINT": "Q", "LWORD": "Q",
+    "REAL": "f", "LREAL": "d",
+    "TIME": "ii", "TOD": "ii", "DATE": "ii", "DT": "ii",
+    "STRING": "B126s",
+}
+
+RetainVariable = namedtuple(
+    "RetainVariable", ["IEC_path", "C_path", "vartype", "type", "offset", "size"])
+
+
+def RetainLayout(variables):
+    """
+    Return layout of retained variables, from VARIABLES.csv entries, and
+    names of the ones whose type can't be retained
+    """
+    layout = []
+    skipped = []
+    offset = 0
+    for v in variables:
+        if v["retain"] != "1" or v["vartype"] in ("FB", "EXT"):
+            continue
+        fmt = RETAIN_FORMATS.get(v["type"])
+        if fmt is None:
+            skipped.append(v["IEC_path"])
+            continue
+        size = Struct("<" + fmt).size
+        layout.append(RetainVariable(v["IEC_path"], v["C_path"], v["vartype"],
+                                     v["type"], offset, size))
+        offset += size
+    return layout, skipped
+
+
+def ImageSize(layout):
+    return layout[-1].offset + layout[-1].size if layout else 0
+
+
+def LayoutHash(layout):
+    """Hash of layout, never 0 nor erased flash"""
+    h = zlib.crc32("".join("%s;%s;%d\n" % (v.IEC_path, v.type, v.offset)
+                           for v in layout).encode())
+    return h if h not in (0, 0xFFFFFFFF) else 1
+
+
+def WriteLayout(layout):
+    return "".join("%s;%s;%d;%d\n" % (v.IEC_path, v.type, v.offset, v.size)
+                   for v in layout)
+
+
+def ReadLayout(text):
+    """Read back layout written by WriteLayout, C path is unknown"""
+    layout = []
+    for line in text.splitlines():
+        path, iectype, offset, size = line.split(";")
+        layout.append(RetainVariable(path, None, None, iectype,
+                                     int(offset), int(size)))
+    return layout
+
+
+def ParseRetainPage(payload):
+    """Return offset, image size, layout hash, records, erases and data"""
+    header = RETAIN_HEADER.unpack_from(payload)
+    return header + (payload[RETAIN_HEADER.size:],)
+
+
+def DecodeRetainImage(layout, image):
+    """Return (IEC path, type, value) of each variable of image"""
+    values = []
+    for v in layout:
+        value = Struct("<" + RETAIN_FORMATS[v.type]).unpack_from(image, v.offset)
+        if v.type == "STRING":
+            value = value[1][:value[0]].decode(errors="replace")
+        elif v.type in ("TIME", "TOD", "DATE", "DT"):
+            value = value[0] + value[1] / 1e9
+        elif v.type == "BOOL":
+            value = bool(value[0])
+        else:
+            value = value[0]
+        values.append((v.IEC_path, v.type, value))
+    return values
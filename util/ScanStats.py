@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Scan time statistics kept by embedded runtime, see plc_main.cpp.
+
+Scan time is measured from inputs update to outputs update, jitter is how
+late scans start after their due time. Overruns are scans, or task
+activations, still due when the previous one ended.
+"""
+
+
+from struct import Struct
+
+# upper bounds of jitter histogram buckets, us, last bucket is unbounded
+JITTER_BOUNDS = (10, 50, 100, 500, 1000, 5000, 10000)
+
+# count, min, max, total, overruns, period, then jitter buckets
+SCAN_STATS = Struct("<IIIQII%dI" % (len(JITTER_BOUNDS) + 1))
+
+
+def ParseScanStats(payload):
+    """
+    Return scan statistics sent by target as a dict, times in us
+    """
+    count, tmin, tmax, total, overruns, period, *jitter = \
+        SCAN_STATS.unpack_from(payload)
+    return {
+        "count": count,
+        "min": tmin,
+        "avg": total / count if count else 0,
+        "max": tmax,
+        "overruns": overruns,
+        "period": period,
+        "jitter": jitter,
+    }
+
+
+def PackScanStats(count, tmin, tmax, total, overruns, period, jitter):
+    return SCAN_STATS.pack(count, tmin, tmax, total, overruns, period, *jitter)
+
+
+def JitterBucket(late):
+    """
+    Index of jitter histogram bucket for a scan starting late us late
+    """
+    for i, bound in enumerate(JITTER_BOUNDS):
+        if late < bound:
+            return i
+    return len(JITTER_BOUNDS)
+
+
+def FormatJitter(jitter):
+    labels = ["<%dus" % b for b in JITTER_BOUNDS] + \
+        [">=%dus" % JITTER_BOUNDS[-1]]
+    return " ".join("%s:%d" % (label, n) for label, n in zip(labels, jitter) if n)
+
+
+def FormatScanStats(stats):
+    """
+    One line summary of scan statistics
+    """
+    return "scan %.2f/%.2f/%.2f ms (min/avg/max) over %.2f ms, %d overruns" % (
+        stats["min"] / 1000., stats["avg"] / 1000., stats["max"] / 1000.,
+        stats["period"] / 1000., stats["overruns"])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Background task usage measured by embedded runtime, see
+platformio/src/task_sched.c.
+
+High priority tasks run every pass, even when a scan is due, low priority
+ones only when their budget ends before next scan. Overruns are calls longer than
+budget, deferred counts passes a low priority task was skipped.
+"""
+
+
+from struct import Struct
+
+# same as enum task_priority of platformio/src/task_sched.h
+TASK_PRIORITIES = ("high", "low")
+
+# first index, task count, ms since counters reset
+TASK_INFO = Struct("<HHI")
+
+# name, priority, budget, calls, total, max, overruns, deferred
+TASK_ENTRY = Struct("<8sBIIQIII")
+TASK_PAGE = (255 - TASK_INFO.size) // TASK_ENTRY.size
+
+
+def ParseTaskPage(payload):
+    """
+    Return first index, task count, ms since reset and list of tasks as
+    dicts, of a page of task table sent by target, times in us
+    """
+    start, count, elapsed = TASK_INFO.unpack_from(payload)
+    tasks = []
+    for offset in range(TASK_INFO.size, len(payload) - TASK_ENTRY.size + 1,
+                        TASK_ENTRY.size):
+        name, priority, budget, calls, total, tmax, overruns, deferred = \
+            TASK_ENTRY.unpack_from(payload, offset)
+        tasks.append({
+            "name": name.rstrip(b'\x00').decode(errors="replace"),
+            "priority": priority,
+            "budget": budget,
+            "calls": calls,
+            "total": total,
+            "avg": total / calls if calls else 0,
+            "max": tmax,
+            "overruns": overruns,
+            "deferred": deferred,
+        })
+    return start, count, elapsed, tasks
+
+
+def FormatTaskStats(task, elapsed):
+    """
+    One line summary of a task usage, over elapsed ms
+    """
+    load = 100. * task["total"] / (elapsed * 1000.) if elapsed else 0
+    priority = TASK_PRIORITIES[task["priority"]] \
+        if task["priority"] < len(TASK_PRIORITIES) else str(task["priority"])
+    return "%-8s %-4s %5.1f%% cpu, %.3f/%.3f ms (avg/max) of %.3f ms budget, " \
+        "%d calls, %d overruns, %d deferred" % (
+            task["name"], priority, load, task["avg"] / 1000.,
+            task["max"] / 1000., task["budget"] / 1000., task["calls"],
+            task["overruns"], task["deferred"])
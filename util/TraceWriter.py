@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Streaming writers for debug traces.
+
+Samples are written as soon as they are received, nothing is kept in memory
+between batches, so a trace can run unattended for hours.
+
+Binary format (all integers little endian) :
+
+    header  : b"BRZTRACE" version:u8 ncols:u16
+              ncols * (name_len:u16 name:utf8 type_len:u8 type:ascii)
+    block   : b"B" nrows:u32 ticks:nrows*u64 wall:nrows*i64
+              then for each column, nrows values stored contiguously.
+              TIME, TOD, DATE and DT are stored as i64 nanoseconds,
+              STRING as len:u8 followed by len bytes.
+              wall is host time in ns since epoch, -1 when unknown.
+"""
+
+
+import csv
+import sys
+from datetime import datetime, timedelta
+from struct import pack
+
+TRACE_MAGIC = b"BRZTRACE"
+TRACE_VERSION = 2
+
+TRACE_FORMATS = {
+    "BOOL": "?", "STEP": "B", "TRANSITION": "B", "ACTION": "B",
+    "SINT": "b", "USINT": "B", "BYTE": "B",
+    "INT": "h", "UINT": "H", "WORD": "H",
+    "DINT": "i", "UDINT": "I", "DWORD": "I",
+    "LINT": "q", "ULINT": "Q", "LWORD": "Q",
+    "REAL": "f", "LREAL": "d",
+    "TIME": "q", "TOD": "q", "DATE": "q", "DT": "q",
+}
+
+
+def _timedelta_ns(value):
+    return ((value.days * 86400 + value.seconds) * 1000000
+            + value.microseconds) * 1000
+
+
+class CSVTraceWriter(object):
+    """
+    One row per sample, first columns are the PLC tick and wall clock time
+    """
+
+    def __init__(self, fobj, names, types):
+        self.fobj = fobj
+        self.writer = csv.writer(fobj)
+        self.writer.writerow(["tick", "time"] + list(names))
+
+    def write(self, samples):
+        for tick, wall, values in samples:
+            date = "" if wall is None else \
+                datetime.utcfromtimestamp(wall * 1e-9).isoformat()
+            self.writer.writerow(
+                [tick, date] +
+                [_timedelta_ns(v) if isinstance(v, timedelta) else v
+                 for v in values])
+        self.fobj.flush()
+
+    def close(self):
+        if self.fobj is not sys.stdout:
+            self.fobj.close()
+
+
+class BinaryTraceWriter(object):
+    """
+    Column oriented blocks, one block per received batch
+    """
+
+    def __init__(self, fobj, names, types):
+        self.fobj = fobj
+        self.types = list(types)
+        header = TRACE_MAGIC + pack("<BH", TRACE_VERSION, len(self.types))
+        for name, iectype in zip(names, self.types):
+            n, t = name.encode(), iectype.encode()
+            header += pack("<H", len(n)) + n + pack("<B", len(t)) + t
+        self.fobj.write(header)
+
+    def _pack_column(self, iectype, column):
+        if iectype == "STRING":
+            return b"".join(pack("<B", len(v)) + v
+                            for v in (s.encode() for s in column))
+        fmt = TRACE_FORMATS[iectype]
+        if fmt == "q" and iectype != "LINT":
+            column = [_timedelta_ns(v) for v in column]
+        return pack("<%d%s" % (len(column), fmt), *column)
+
+    def write(self, samples):
+        if not samples:
+            return
+        ticks = [tick for tick, _wall, _values in samples]
+        walls = [-1 if wall is None else wall for _tick, wall, _values in samples]
+        block = [b"B",
+                 pack("<I%dQ%dq" % (len(ticks), len(walls)),
+                      len(ticks), *(ticks + walls))]
+        for col, iectype in enumerate(self.types):
+            block.append(self._pack_column(
+                iectype, [values[col] for _tick, _wall, values in samples]))
+        self.fobj.write(b"".join(block))
+        self.fobj.flush()
+
+    def close(self):
+        if self.fobj is not sys.stdout.buffer:
+            self.fobj.close()
+
+
+TraceWriters = {
+    "csv": (CSVTraceWriter, "w"),
+    "bin": (BinaryTraceWriter, "wb"),
+}
+
+
+def OpenTraceWriter(path, fmt, names, types):
+    """
+    Return a trace writer for given format, writing to path or stdout if "-"
+    """
+    cls, mode = TraceWriters[fmt]
+    if path == "-":
+        fobj = sys.stdout.buffer if "b" in mode else sys.stdout
+    else:
+        fobj = open(path, mode, newline="" if "b" not in mode else None)
+    return cls(fobj, names, types)
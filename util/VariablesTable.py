@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz for uC
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Compact, memory-mapped table of programs and variables parsed out of
+VARIABLES.csv generated by IEC2C.
+
+The parsed table is stored next to the CSV file. All strings live in a
+single blob addressed by uint32 offset arrays, so loading the table is
+a mmap and variables are only decoded when accessed.
+
+Cache layout (native byte order) :
+
+    header    : see HEADER
+    programs  : uint32[nprograms * 3 + 1] string offsets
+    variables : uint32[nvariables * 7 + 1] string offsets
+    debug     : uint32[ndebug] variable rows that can be debugged
+    pathindex : uint32[ndebug] debug indexes sorted by IEC path
+    blob      : utf-8 strings
+"""
+
+
+import hashlib
+import mmap
+import os
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from fnmatch import fnmatchcase
+from struct import Struct
+
+PROGRAM_FIELDS = ["num", "C_path", "type"]
+VARIABLE_FIELDS = [
+    "num", "vartype", "IEC_path", "C_path", "type", "derived", "retain"]
+
+CACHE_MAGIC = b"BRZVARS" + (b"L" if sys.byteorder == "little" else b"B")
+CACHE_VERSION = 3
+HEADER = Struct("=8sI16s16sQQqIIII")
+# CSV mtime and size, in HEADER
+STAMP = Struct("=QQ")
+STAMP_OFFSET = 44
+
+
+def DebugVariablesFilter(spec):
+    """
+    Return predicate telling if an IEC path is to be debugged, out of a
+    filter specification : scope on first line, then one IEC path or glob
+    pattern per line. A pattern also selects everything below it.
+    An empty specification selects all variables.
+    """
+    lines = [line.strip().upper() for line in spec.splitlines() if line.strip()]
+    scope = lines[0] if lines else "ALL"
+    patterns = lines[1:]
+
+    def debugged(IEC_path):
+        # program level : CONFIG.VAR, CONFIG.RES.VAR or CONFIG.RES.INSTANCE.VAR
+        if scope == "PROGRAMS" and IEC_path.count(".") > 3:
+            return False
+        if patterns:
+            return any(fnmatchcase(IEC_path, p) or IEC_path.startswith(p + ".")
+                       for p in patterns)
+        return True
+
+    return debugged
+
+
+def _ParseVariablesCSV(lines, debug_types, debug_filter=""):
+    """
+    Split VARIABLES.csv content into programs, variables and ticktime,
+    applying the same C path transformations as the runtime expects
+    """
+    debugged = DebugVariablesFilter(debug_filter)
+
+    # Separate sections
+    ListGroup = []
+    for line in lines:
+        strippedline = line.strip()
+        if strippedline.startswith("//"):
+            # Start new section
+            ListGroup.append([])
+        elif len(strippedline) > 0 and len(ListGroup) > 0:
+            # append to this section
+            ListGroup[-1].append(strippedline)
+
+    programs = []
+    # first section contains programs
+    for line in ListGroup[0]:
+        attrs = dict(zip(PROGRAM_FIELDS, line.split(';')))
+        # Truncate "C_path" to remove conf an resources names
+        attrs["C_path"] = '__'.join(attrs["C_path"].split(".", 2)[1:])
+        programs.append([attrs.get(f, "") for f in PROGRAM_FIELDS])
+
+    # second section contains all variables
+    variables = []
+    debug = []
+    config_FBs = {}
+    for line in ListGroup[1]:
+        attrs = dict(zip(VARIABLE_FIELDS, line.split(';')))
+        # Truncate "C_path" to remove conf an resources names
+        parts = attrs["C_path"].split(".", 2)
+        if len(parts) > 2:
+            config_FB = config_FBs.get(tuple(parts[:2]))
+            if config_FB:
+                parts = [config_FB] + parts[2:]
+                attrs["C_path"] = '.'.join(parts)
+            else:
+                attrs["C_path"] = '__'.join(parts[1:])
+        else:
+            attrs["C_path"] = '__'.join(parts)
+            if attrs["vartype"] == "FB":
+                config_FBs[tuple(parts)] = attrs["C_path"]
+        if attrs["vartype"] != "FB" and attrs["type"] in debug_types \
+           and debugged(attrs["IEC_path"]):
+            # Count variables only, ignore FBs
+            debug.append(len(variables))
+        variables.append([attrs.get(f, "") for f in VARIABLE_FIELDS])
+
+    # third section contains ticktime
+    ticktime = 0
+    if len(ListGroup) > 2:
+        ticktime = int(ListGroup[2][0])
+
+    return programs, variables, debug, ticktime
+
+
+def _Offsets(rows, blob):
+    offsets = array("I")
+    for row in rows:
+        for field in row:
+            offsets.append(len(blob))
+            blob += field.encode()
+    offsets.append(len(blob))
+    return offsets
+
+
+def _BuildCache(data, digest, filter_digest, stamp, debug_types, debug_filter):
+    programs, variables, debug, ticktime = _ParseVariablesCSV(
+        data.decode().splitlines(), debug_types, debug_filter)
+
+    blob = bytearray()
+    prog_offsets = _Offsets(programs, blob)
+    var_offsets = _Offsets(variables, blob)
+    debug_rows = array("I", debug)
+    path_index = array("I", sorted(
+        range(len(debug)), key=lambda i: variables[debug[i]][2].encode()))
+
+    header = HEADER.pack(
+        CACHE_MAGIC, CACHE_VERSION, digest, filter_digest,
+        stamp[0], stamp[1], ticktime,
+        len(programs), len(variables), len(debug), len(blob))
+
+    return b"".join([header,
+                     prog_offsets.tobytes(),
+                     var_offsets.tobytes(),
+                     debug_rows.tobytes(),
+                     path_index.tobytes(),
+                     bytes(blob)])
+
+
+class VariableRecord(Mapping):
+    """
+    Read-only dict-like view on one row of the table
+    """
+    __slots__ = ("_table", "_offsets", "_fields", "_row")
+
+    def __init__(self, table, offsets, fields, row):
+        self._table = table
+        self._offsets = offsets
+        self._fields = fields
+        self._row = row
+
+    def __getitem__(self, key):
+        try:
+            col = self._fields.index(key)
+        except ValueError:
+            raise KeyError(key)
+        return self._table._string(self._offsets, self._row * len(self._fields) + col)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+
+class _RecordsView(Sequence):
+    def __init__(self, table, offsets, fields, rows=None):
+        self._table = table
+        self._offsets = offsets
+        self._fields = fields
+        self._rows = rows
+
+    def __len__(self):
+        if self._rows is not None:
+            return len(self._rows)
+        return (len(self._offsets) - 1) // len(self._fields)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        row = self._rows[idx] if self._rows is not None else idx
+        return VariableRecord(self._table, self._offsets, self._fields, row)
+
+
+class IECPathIndex(Mapping):
+    """
+    IEC path -> (debug index, IEC type) mapping.
+
+    Keys are kept sorted, which makes this a flattened trie : all the paths
+    sharing a prefix are contiguous and found with two binary searches.
+    """
+
+    def __init__(self, table):
+        self._table = table
+
+    def _path(self, pos):
+        return self._table._bytes(
+            self._table.var_offsets,
+            self._table.debug_rows[self._table.path_index[pos]] * 7 + 2)
+
+    def _lower_bound(self, key):
+        lo, hi = 0, len(self._table.path_index)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._path(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _entry(self, pos):
+        idx = self._table.path_index[pos]
+        return idx, self._table._string(
+            self._table.var_offsets, self._table.debug_rows[idx] * 7 + 4)
+
+    def __getitem__(self, path):
+        key = path.encode()
+        pos = self._lower_bound(key)
+        if pos < len(self) and self._path(pos) == key:
+            return self._entry(pos)
+        raise KeyError(path)
+
+    def __iter__(self):
+        for pos in range(len(self)):
+            yield self._path(pos).decode()
+
+    def __len__(self):
+        return len(self._table.path_index)
+
+    def _prefix_range(self, prefix):
+        key = prefix.encode()
+        # 0xff never appears in utf-8, so it sorts after any path under prefix
+        return self._lower_bound(key), self._lower_bound(key + b"\xff")
+
+    def HasPrefix(self, prefix):
+        """
+        Return True if at least one debuggable variable path starts with prefix
+        """
+        key = prefix.encode()
+        pos = self._lower_bound(key)
+        return pos < len(self) and self._path(pos).startswith(key)
+
+    def PrefixItems(self, prefix):
+        """
+        Yield (IEC path, (debug index, IEC type)) for paths under prefix
+        """
+        start, end = self._prefix_range(prefix)
+        for pos in range(start, end):
+            yield self._path(pos).decode(), self._entry(pos)
+
+    def Children(self, prefix):
+        """
+        Return sorted list of distinct path elements directly under prefix
+        """
+        children = []
+        if prefix and not prefix.endswith("."):
+            prefix += "."
+        for path, _entry in self.PrefixItems(prefix):
+            child = path[len(prefix):].split(".", 1)[0]
+            if not children or children[-1] != child:
+                children.append(child)
+        return children
+
+
+class VariablesTable(object):
+    """
+    Programs and variables of a build, backed by a (memory-mapped) buffer
+    """
+
+    def __init__(self, buf, mm=None, fobj=None):
+        self._mmap = mm
+        self._fobj = fobj
+        (magic, version, self.digest, self.filter_digest,
+         self.mtime_ns, self.size, self.ticktime,
+         nprograms, nvariables, ndebug, blobsize) = HEADER.unpack_from(buf)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            raise ValueError("Invalid variables cache")
+
+        view = memoryview(buf)
+        pos = HEADER.size
+
+        def take(count):
+            nonlocal pos
+            arr = view[pos:pos + count * 4].cast("I")
+            pos += count * 4
+            return arr
+
+        self.prog_offsets = take(nprograms * len(PROGRAM_FIELDS) + 1)
+        self.var_offsets = take(nvariables * len(VARIABLE_FIELDS) + 1)
+        self.debug_rows = take(ndebug)
+        self.path_index = take(ndebug)
+        self.blob = view[pos:pos + blobsize]
+
+        self.programs = _RecordsView(self, self.prog_offsets, PROGRAM_FIELDS)
+        self.variables = _RecordsView(self, self.var_offsets, VARIABLE_FIELDS)
+        self.debug_variables = _RecordsView(
+            self, self.var_offsets, VARIABLE_FIELDS, self.debug_rows)
+        self.paths = IECPathIndex(self)
+
+    def _bytes(self, offsets, i):
+        return bytes(self.blob[offsets[i]:offsets[i + 1]])
+
+    def _string(self, offsets, i):
+        return self._bytes(offsets, i).decode()
+
+    def close(self):
+        # views must be released before the map can be closed
+        for name in ("prog_offsets", "var_offsets",
+                     "debug_rows", "path_index", "blob"):
+            getattr(self, name).release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # some record is still exported, let GC unmap it later
+                pass
+            self._fobj.close()
+            self._mmap = None
+
+
+def _OpenCache(cachefile):
+    try:
+        fobj = open(cachefile, "rb")
+    except IOError:
+        return None
+    try:
+        mm = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        return VariablesTable(mm, mm, fobj)
+    except Exception:
+        fobj.close()
+        return None
+
+
+def _RewriteStamp(cachefile, table, stamp):
+    """
+    Record new mtime of a CSV rewritten with same content, so that next
+    load doesn't need to read it again
+    """
+    try:
+        with open(cachefile, "r+b") as f:
+            f.seek(STAMP_OFFSET)
+            f.write(STAMP.pack(*stamp))
+    except OSError:
+        # read-only build directory, CSV will be read again next time
+        return
+    table.mtime_ns, table.size = stamp
+
+
+def LoadVariablesTable(csvfile, debug_types, cachefile=None, debug_filter=""):
+    """
+    Return VariablesTable for given VARIABLES.csv, re-using the cache file
+    when neither the CSV, the debug filter nor debuggable types changed
+    since it was written.
+    """
+    if cachefile is None:
+        cachefile = os.path.splitext(csvfile)[0] + ".cache"
+
+    st = os.stat(csvfile)
+    stamp = (st.st_mtime_ns, st.st_size)
+    filter_digest = hashlib.md5(
+        ";".join(sorted(debug_types)).encode() + b"\n" +
+        debug_filter.encode()).digest()
+
+    table = _OpenCache(cachefile)
+    if table is not None and table.filter_digest != filter_digest:
+        table.close()
+        table = None
+    if table is not None and (table.mtime_ns, table.size) == stamp:
+        return table
+
+    with open(csvfile, "rb") as f:
+        data = f.read()
+    digest = hashlib.md5(data).digest()
+
+    if table is not None:
+        if table.digest == digest:
+            _RewriteStamp(cachefile, table, stamp)
+            return table
+        table.close()
+
+    content = _BuildCache(
+        data, digest, filter_digest, stamp, debug_types, debug_filter)
+    try:
+        tmpfile = cachefile + ".tmp"
+        with open(tmpfile, "wb") as f:
+            f.write(content)
+        os.replace(tmpfile, cachefile)
+    except OSError:
+        # read-only build directory, keep table in memory only
+        return VariablesTable(content)
+
+    table = _OpenCache(cachefile)
+    if table is None:
+        table = VariablesTable(content)
+    return table